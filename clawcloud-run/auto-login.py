@@ -10,15 +10,38 @@ import os
 import sys
 import time
 import base64
+import json
+import zlib
+from collections import deque
 import re
+import queue
+import secrets
+import threading
 import requests
-from playwright.sync_api import sync_playwright
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 仓库根目录，用于导入 common
+from common.blocking import ResourceBlocker
+from common.notify import TG_API, get_notifier
+from common.resilience import Retry, host_of
+from common.metrics import Metrics
+from common import trace
 
 # ==================== 配置 ====================
 CLAW_CLOUD_URL = "https://eu-central-1.run.claw.cloud"
 SIGNIN_URL = f"{CLAW_CLOUD_URL}/signin"
 DEVICE_VERIFY_WAIT = 30  # Mobile验证 默认等 30 秒
 TWO_FACTOR_WAIT = int(os.environ.get("TWO_FACTOR_WAIT", "60"))  # 2FA验证 默认等 60 秒
+OAUTH_CLICKS = 3  # 重定向等待期间最多点击几次 OAuth 授权
+SHOT_TYPE = os.environ.get("SHOT_TYPE", "jpeg")  # 截图格式：jpeg（默认，体积小）或 png
+SHOT_QUALITY = int(os.environ.get("SHOT_QUALITY", "60"))  # JPEG 质量
+SHOT_BUFFER = int(os.environ.get("SHOT_BUFFER", "8"))  # 内存中最多保留的截图数
+TG_WEBHOOK_URL = os.environ.get("TG_WEBHOOK_URL")  # 可选，公网可访问的 Webhook 地址，设置后改用 Webhook 接收验证码
+TG_WEBHOOK_PORT = int(os.environ.get("TG_WEBHOOK_PORT", "8443"))  # Webhook 本地监听端口
+CODE_PATTERN = re.compile(r"^/code\s+(\d{6,8})$")  # 6位TOTP 或 8位恢复码也行
+STATE_FILE = os.environ.get("STATE_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "storage_state.enc"))
+STATE_KEY = os.environ.get("STATE_KEY")  # 登录状态快照的加密密钥（独立的随机密钥），未设置时不保存快照
 
 
 class Telegram:
@@ -28,50 +51,53 @@ class Telegram:
         self.token = os.environ.get('TG_BOT_TOKEN')
         self.chat_id = os.environ.get('TG_CHAT_ID')
         self.ok = bool(self.token and self.chat_id)
+        self.session = requests.Session()  # getUpdates 长轮询复用同一个 keep-alive 连接
     
     def send(self, msg):
         if not self.ok:
             return
-        try:
-            requests.post(
-                f"https://api.telegram.org/bot{self.token}/sendMessage",
-                data={"chat_id": self.chat_id, "text": msg, "parse_mode": "HTML"},
-                timeout=30
-            )
-        except:
-            pass
+        # 交给共用通知器后台发送，不阻塞登录流程
+        get_notifier().send(msg, parse_mode="HTML")
     
-    def photo(self, path, caption=""):
-        if not self.ok or not os.path.exists(path):
+    def photo(self, photo, caption=""):
+        """photo 可以是文件路径或内存中的图片字节"""
+        if not self.ok:
             return
-        try:
-            with open(path, 'rb') as f:
-                requests.post(
-                    f"https://api.telegram.org/bot{self.token}/sendPhoto",
-                    data={"chat_id": self.chat_id, "caption": caption[:1024]},
-                    files={"photo": f},
-                    timeout=60
-                )
-        except:
-            pass
+        get_notifier().photo(photo, caption)
+    
+    def album(self, photos):
+        """[(图片, 说明), ...] 合并为一次 sendMediaGroup 上传"""
+        if not self.ok:
+            return
+        get_notifier().album(photos)
+    
+    def _api(self, method):
+        return f"{TG_API}/bot{self.token}/{method}"
+    
+    def _match_code(self, upd):
+        """从一条 update 中提取 /code，只接受来自 TG_CHAT_ID 的消息"""
+        msg = upd.get("message") or {}
+        chat = msg.get("chat") or {}
+        if str(chat.get("id")) != str(self.chat_id):
+            return None
+        m = CODE_PATTERN.match((msg.get("text") or "").strip())
+        return m.group(1) if m else None
     
     def flush_updates(self):
         """刷新 offset 到最新，避免读到旧消息"""
         if not self.ok:
             return 0
         try:
-            r = requests.get(
-                f"https://api.telegram.org/bot{self.token}/getUpdates",
-                params={"timeout": 0},
-                timeout=10
-            )
+            # offset=-1 只返回最后一条 update，无需拉取全部积压消息
+            r = self.session.get(self._api("getUpdates"), params={"offset": -1, "timeout": 0}, timeout=10)
             data = r.json()
             if data.get("ok") and data.get("result"):
                 return data["result"][-1]["update_id"] + 1
-        except:
-            pass
+        except Exception as e:
+            print(f"⚠️ 刷新 Telegram offset 失败: {e}")
         return 0
     
+    @trace.traced("claw.wait_code")
     def wait_code(self, timeout=120):
         """
         等待你在 TG 里发 /code 123456
@@ -79,42 +105,94 @@ class Telegram:
         """
         if not self.ok:
             return None
+        if TG_WEBHOOK_URL:
+            return self.wait_code_webhook(timeout)
         
         # 先刷新 offset，避免读到旧的 /code
         offset = self.flush_updates()
         deadline = time.time() + timeout
-        pattern = re.compile(r"^/code\s+(\d{6,8})$")  # 6位TOTP 或 8位恢复码也行
-        
-        while time.time() < deadline:
+        errors = 0
+        
+        # 长轮询在同一个 keep-alive 连接上进行，返回后立即发起下一轮
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            poll = max(1, min(20, int(remaining)))
             try:
-                r = requests.get(
-                    f"https://api.telegram.org/bot{self.token}/getUpdates",
-                    params={"timeout": 20, "offset": offset},
-                    timeout=30
+                r = self.session.get(
+                    self._api("getUpdates"),
+                    params={"timeout": poll, "offset": offset, "allowed_updates": '["message"]'},
+                    timeout=poll + 10
                 )
                 data = r.json()
                 if not data.get("ok"):
-                    time.sleep(2)
-                    continue
+                    raise RuntimeError(data.get("description", "getUpdates 失败"))
+                errors = 0
                 
                 for upd in data.get("result", []):
                     offset = upd["update_id"] + 1
-                    msg = upd.get("message") or {}
-                    chat = msg.get("chat") or {}
-                    if str(chat.get("id")) != str(self.chat_id):
-                        continue
-                    
-                    text = (msg.get("text") or "").strip()
-                    m = pattern.match(text)
-                    if m:
-                        return m.group(1)
+                    code = self._match_code(upd)
+                    if code:
+                        return code
             
-            except Exception:
-                pass
+            except Exception as e:
+                # 只有出错时才退避，避免空转
+                errors += 1
+                print(f"⚠️ 获取 Telegram 消息失败: {e}")
+                time.sleep(min(2 ** errors, 10, max(deadline - time.time(), 0)))
+    
+    def wait_code_webhook(self, timeout=120):
+        """
+        Webhook 模式（适合有公网地址的自建 runner）：
+        本地监听 TG_WEBHOOK_PORT，Telegram 把消息直接推送过来，结束后删除 webhook
+        """
+        codes = queue.Queue()
+        secret_token = secrets.token_hex(16)
+        tg = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if self.headers.get('X-Telegram-Bot-Api-Secret-Token') == secret_token:
+                    try:
+                        code = tg._match_code(json.loads(body))
+                        if code:
+                            codes.put(code)
+                    except ValueError:
+                        pass
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
             
-            time.sleep(2)
+            def log_message(self, *args):
+                pass
         
-        return None
+        server = ThreadingHTTPServer(('0.0.0.0', TG_WEBHOOK_PORT), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            r = self.session.post(self._api("setWebhook"), data={
+                "url": TG_WEBHOOK_URL,
+                "secret_token": secret_token,
+                "allowed_updates": '["message"]',
+                "drop_pending_updates": "true"
+            }, timeout=10)
+            if not r.json().get("ok"):
+                print(f"⚠️ 设置 Webhook 失败: {r.text}")
+                return None
+            return codes.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        except Exception as e:
+            print(f"⚠️ Webhook 模式出错: {e}")
+            return None
+        finally:
+            try:
+                self.session.post(self._api("deleteWebhook"), timeout=10)
+            except Exception:
+                pass
+            server.shutdown()
+            server.server_close()
 
 
 class SecretUpdater:
@@ -124,47 +202,107 @@ class SecretUpdater:
         self.token = os.environ.get('GH_TOKEN')
         self.repo = os.environ.get('GITHUB_REPOSITORY')
         self.ok = bool(self.token and self.repo)
+        self.api = f"https://api.github.com/repos/{self.repo}/actions/secrets"
+        # 获取公钥与 PUT 复用同一个 keep-alive 连接
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"token {self.token}",
+            "Accept": "application/vnd.github.v3+json"
+        })
+        self._key = None  # (key_id, SealedBox)，进程内缓存
         if self.ok:
             print("✅ Secret 自动更新已启用")
         else:
             print("⚠️ Secret 自动更新未启用（需要 GH_TOKEN）")
     
-    def update(self, name, value):
-        if not self.ok:
-            return False
-        try:
+    def _public_key(self, refresh=False):
+        """获取仓库公钥并缓存 SealedBox，只在 refresh 时重新请求"""
+        if self._key is None or refresh:
             from nacl import encoding, public
             
-            headers = {
-                "Authorization": f"token {self.token}",
-                "Accept": "application/vnd.github.v3+json"
-            }
-            
-            # 获取公钥
-            r = requests.get(
-                f"https://api.github.com/repos/{self.repo}/actions/secrets/public-key",
-                headers=headers, timeout=30
-            )
-            if r.status_code != 200:
-                return False
-            
+            r = self.session.get(f"{self.api}/public-key", timeout=30)
+            r.raise_for_status()
             key_data = r.json()
             pk = public.PublicKey(key_data['key'].encode(), encoding.Base64Encoder())
-            encrypted = public.SealedBox(pk).encrypt(value.encode())
-            
-            # 更新 Secret
-            r = requests.put(
-                f"https://api.github.com/repos/{self.repo}/actions/secrets/{name}",
-                headers=headers,
-                json={"encrypted_value": base64.b64encode(encrypted).decode(), "key_id": key_data['key_id']},
-                timeout=30
-            )
-            return r.status_code in [201, 204]
+            self._key = (key_data['key_id'], public.SealedBox(pk))
+        return self._key
+    
+    def _put(self, name, value):
+        key_id, box = self._public_key()
+        encrypted = box.encrypt(value.encode())
+        r = self.session.put(
+            f"{self.api}/{name}",
+            json={"encrypted_value": base64.b64encode(encrypted).decode(), "key_id": key_id},
+            timeout=30
+        )
+        return r.status_code
+    
+    def update(self, name, value):
+        if not self.ok:
+            return False
+        try:
+            status = self._put(name, value)
+            if 400 <= status < 500:
+                # 公钥可能已轮换，刷新缓存后重试一次
+                self._public_key(refresh=True)
+                status = self._put(name, value)
+            return status in [201, 204]
         except Exception as e:
             print(f"更新 Secret 失败: {e}")
             return False
 
 
+class StateStore:
+    """
+    Playwright storage_state 快照，压缩后用 SecretBox 加密保存到本地文件。
+    快照包含 GitHub 与 ClawCloud 的会话 Cookie 且会进入 actions/cache，密钥必须是独立的高熵随机值，不能由密码推导
+    """
+    
+    def __init__(self, path=STATE_FILE, key=STATE_KEY):
+        self.path = path
+        self.ok = bool(key)
+        self.box = None
+        if self.ok:
+            from nacl import encoding, secret
+            from nacl.hash import blake2b
+            digest = blake2b(key.encode(), digest_size=secret.SecretBox.KEY_SIZE, encoder=encoding.RawEncoder)
+            self.box = secret.SecretBox(digest)
+    
+    def discard(self):
+        """删除遗留的快照文件（例如旧版本用 GH_PASSWORD 推导密钥加密的），避免继续留在缓存中"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"⚠️ 删除登录状态快照失败: {e}")
+
+    def load(self):
+        """读取并解密快照，文件不存在或无法解密时返回 None"""
+        if not self.ok or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                return json.loads(zlib.decompress(self.box.decrypt(f.read())))
+        except Exception as e:
+            print(f"⚠️ 登录状态快照无法读取: {e}")
+            return None
+    
+    def save(self, state):
+        if not self.ok or not state:
+            return False
+        try:
+            data = self.box.encrypt(zlib.compress(json.dumps(state).encode()))
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+            return True
+        except Exception as e:
+            print(f"⚠️ 保存登录状态快照失败: {e}")
+            return False
+
+
 class AutoLogin:
     """自动登录"""
     
@@ -174,9 +312,13 @@ class AutoLogin:
         self.gh_session = os.environ.get('GH_SESSION', '').strip()
         self.tg = Telegram()
         self.secret = SecretUpdater()
-        self.shots = []
+        self.state = StateStore()
+        # 只需要登录态，拦截图片/字体/统计脚本等资源；CLAW_ALLOW_DOMAINS 设置后只放行这些域名
+        self.blocker = ResourceBlocker(allow=os.environ.get("CLAW_ALLOW_DOMAINS", "").split(","))
+        self.shots = deque(maxlen=SHOT_BUFFER)  # [(图片字节, 名称)]
         self.logs = []
         self.n = 0
+        self.metrics = Metrics("clawcloud-run")
         
     def log(self, msg, level="INFO"):
         icons = {"INFO": "ℹ️", "SUCCESS": "✅", "ERROR": "❌", "WARN": "⚠️", "STEP": "🔹"}
@@ -184,15 +326,24 @@ class AutoLogin:
         print(line)
         self.logs.append(line)
     
+    @trace.traced("claw.screenshot")
     def shot(self, page, name):
+        """截图只保存在内存环形缓冲区，需要时才上传；返回图片字节，失败返回 None"""
         self.n += 1
-        f = f"{self.n:02d}_{name}.png"
+        options = {'type': SHOT_TYPE}
+        if SHOT_TYPE == 'jpeg':
+            options['quality'] = SHOT_QUALITY
         try:
-            page.screenshot(path=f)
-            self.shots.append(f)
+            data = page.screenshot(**options)
         except:
-            pass
-        return f
+            return None
+        self.shots.append((data, f"{self.n:02d}_{name}"))
+        return data
+    
+    def idle(self, page, timeout=30000):
+        """等待网络空闲，单独计时（常是整个流程中最慢的一步）"""
+        with trace.span("claw.networkidle", url=page.url.split("?", 1)[0]):
+            page.wait_for_load_state('networkidle', timeout=timeout)
     
     def click(self, page, sels, desc=""):
         for s in sels:
@@ -216,6 +367,7 @@ class AutoLogin:
             pass
         return None
     
+    @trace.traced("claw.save_cookie")
     def save_cookie(self, value):
         """保存新 Cookie"""
         if not value:
@@ -235,6 +387,48 @@ class AutoLogin:
 <code>{value}</code>""")
             self.log("已通过 Telegram 发送 Cookie", "SUCCESS")
     
+    @trace.traced("claw.save_state")
+    def save_state(self, context):
+        """登录成功后保存完整的 storage_state 快照，下次运行直接复用"""
+        if not self.state.ok:
+            return
+        try:
+            if self.state.save(context.storage_state()):
+                self.log("已保存登录状态快照", "SUCCESS")
+        except Exception as e:
+            self.log(f"保存登录状态快照失败: {e}", "WARN")
+    
+    def wait_url(self, page, match, timeout, tick=10, on_tick=None):
+        """
+        基于导航事件等待 URL 满足 match，整个等待共用一个截止时间；
+        页面一跳转立即返回匹配的 URL，超时返回 None。
+        每 tick 秒无跳转时回调 on_tick(已等待秒数)，用于打印进度或补发截图
+        """
+        start = time.monotonic()
+        deadline = start + timeout
+        
+        def on_nav(frame):
+            if frame == page.main_frame:
+                self.log(f"  页面跳转: {frame.url}")
+        
+        page.on("framenavigated", on_nav)
+        try:
+            while True:
+                url = page.url
+                if match(url):
+                    return url
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                try:
+                    page.wait_for_url(match, timeout=min(tick, remaining) * 1000, wait_until="commit")
+                except PlaywrightTimeout:
+                    if on_tick and deadline > time.monotonic():
+                        on_tick(int(time.monotonic() - start))
+        finally:
+            page.remove_listener("framenavigated", on_nav)
+    
+    @trace.traced("claw.wait_device")
     def wait_device(self, page):
         """等待设备验证"""
         self.log(f"需要设备验证，等待 {DEVICE_VERIFY_WAIT} 秒...", "WARN")
@@ -246,30 +440,30 @@ class AutoLogin:
 2️⃣ 或在 GitHub App 批准""")
         
         if self.shots:
-            self.tg.photo(self.shots[-1], "设备验证页面")
+            self.tg.photo(self.shots[-1][0], "设备验证页面")
         
-        for i in range(DEVICE_VERIFY_WAIT):
-            time.sleep(1)
-            if i % 5 == 0:
-                self.log(f"  等待... ({i}/{DEVICE_VERIFY_WAIT}秒)")
-                url = page.url
-                if 'verified-device' not in url and 'device-verification' not in url:
-                    self.log("设备验证通过！", "SUCCESS")
-                    self.tg.send("✅ <b>设备验证通过</b>")
-                    return True
-                try:
-                    page.reload(timeout=10000)
-                    page.wait_for_load_state('networkidle', timeout=10000)
-                except:
-                    pass
+        verified = lambda u: 'verified-device' not in u and 'device-verification' not in u
+        url = self.wait_url(page, verified, DEVICE_VERIFY_WAIT, tick=5,
+                            on_tick=lambda i: self.log(f"  等待... ({i}/{DEVICE_VERIFY_WAIT}秒)"))
         
-        if 'verified-device' not in page.url:
+        # 页面没有自动跳转时，到期只刷新一次做最后确认
+        if not url:
+            try:
+                page.reload(timeout=10000, wait_until="domcontentloaded")
+            except:
+                pass
+            url = page.url if verified(page.url) else None
+        
+        if url:
+            self.log("设备验证通过！", "SUCCESS")
+            self.tg.send("✅ <b>设备验证通过</b>")
             return True
         
         self.log("设备验证超时", "ERROR")
         self.tg.send("❌ <b>设备验证超时</b>")
         return False
     
+    @trace.traced("claw.2fa_mobile")
     def wait_two_factor_mobile(self, page):
         """等待 GitHub Mobile 两步验证批准，并把数字截图提前发到电报"""
         self.log(f"需要两步验证（GitHub Mobile），等待 {TWO_FACTOR_WAIT} 秒...", "WARN")
@@ -283,41 +477,33 @@ class AutoLogin:
         if shot:
             self.tg.photo(shot, "两步验证页面（数字在图里）")
         
-        # 不要频繁 reload，避免把流程刷回登录页
-        for i in range(TWO_FACTOR_WAIT):
-            time.sleep(1)
-            url = page.url
-            
-            # 如果离开 two-factor 流程页面，认为通过
-            if "github.com/sessions/two-factor/" not in url:
-                self.log("两步验证通过！", "SUCCESS")
-                self.tg.send("✅ <b>两步验证通过</b>")
-                return True
-            
-            # 如果被刷回登录页，说明这次流程断了（不要硬等）
-            if "github.com/login" in url:
-                self.log("两步验证后回到了登录页，需重新登录", "ERROR")
-                return False
-            
-            # 每 10 秒打印一次，并补发一次截图（防止你没看到数字）
-            if i % 10 == 0 and i != 0:
-                self.log(f"  等待... ({i}/{TWO_FACTOR_WAIT}秒)")
-                shot = self.shot(page, f"两步验证_{i}s")
-                if shot:
-                    self.tg.photo(shot, f"两步验证页面（第{i}秒）")
-            
-            # 只在 30 秒、60 秒... 做一次轻刷新（可选，频率很低）
-            if i % 30 == 0 and i != 0:
-                try:
-                    page.reload(timeout=30000)
-                    page.wait_for_load_state('domcontentloaded', timeout=30000)
-                except:
-                    pass
+        # 每 10 秒打印一次，并补发一次截图（防止你没看到数字）
+        def on_tick(i):
+            self.log(f"  等待... ({i}/{TWO_FACTOR_WAIT}秒)")
+            shot = self.shot(page, f"两步验证_{i}s")
+            if shot:
+                self.tg.photo(shot, f"两步验证页面（第{i}秒）")
         
-        self.log("两步验证超时", "ERROR")
-        self.tg.send("❌ <b>两步验证超时</b>")
-        return False
+        # 批准后 GitHub 页面会自行跳转，不做 reload，避免把流程刷回登录页
+        url = self.wait_url(page, lambda u: "github.com/sessions/two-factor/" not in u,
+                            TWO_FACTOR_WAIT, tick=10, on_tick=on_tick)
+        
+        if url is None:
+            self.log("两步验证超时", "ERROR")
+            self.tg.send("❌ <b>两步验证超时</b>")
+            return False
+        
+        # 如果被刷回登录页，说明这次流程断了（不要硬等）
+        if "github.com/login" in url and "github.com/login/oauth" not in url:
+            self.log("两步验证后回到了登录页，需重新登录", "ERROR")
+            return False
+        
+        # 离开 two-factor 流程页面，认为通过
+        self.log("两步验证通过！", "SUCCESS")
+        self.tg.send("✅ <b>两步验证通过</b>")
+        return True
     
+    @trace.traced("claw.2fa_code")
     def handle_2fa_code_input(self, page):
         """处理 TOTP 验证码输入（通过 Telegram 发送 /code 123456）"""
         self.log("需要输入验证码", "WARN")
@@ -337,7 +523,7 @@ class AutoLogin:
                     if el.is_visible(timeout=2000):
                         el.click()
                         time.sleep(2)
-                        page.wait_for_load_state('networkidle', timeout=15000)
+                        self.idle(page, timeout=15000)
                         self.log("已切换到验证码输入页面", "SUCCESS")
                         shot = self.shot(page, "两步验证_code_切换后")
                         break
@@ -409,7 +595,7 @@ class AutoLogin:
                         self.log("已按 Enter 提交", "SUCCESS")
                     
                     time.sleep(3)
-                    page.wait_for_load_state('networkidle', timeout=30000)
+                    self.idle(page, timeout=30000)
                     self.shot(page, "验证码提交后")
                     
                     # 检查是否通过
@@ -428,6 +614,7 @@ class AutoLogin:
         self.tg.send("❌ <b>没找到验证码输入框</b>")
         return False
     
+    @trace.traced("claw.login_github")
     def login_github(self, page, context):
         """登录 GitHub"""
         self.log("登录 GitHub...", "STEP")
@@ -449,7 +636,7 @@ class AutoLogin:
             pass
         
         time.sleep(3)
-        page.wait_for_load_state('networkidle', timeout=30000)
+        self.idle(page, timeout=30000)
         self.shot(page, "github_登录后")
         
         url = page.url
@@ -460,7 +647,7 @@ class AutoLogin:
             if not self.wait_device(page):
                 return False
             time.sleep(2)
-            page.wait_for_load_state('networkidle', timeout=30000)
+            self.idle(page, timeout=30000)
             self.shot(page, "验证后")
         
         # 2FA
@@ -474,7 +661,7 @@ class AutoLogin:
                     return False
                 # 通过后等页面稳定
                 try:
-                    page.wait_for_load_state('networkidle', timeout=30000)
+                    self.idle(page, timeout=30000)
                     time.sleep(2)
                 except:
                     pass
@@ -485,7 +672,7 @@ class AutoLogin:
                     return False
                 # 通过后等页面稳定
                 try:
-                    page.wait_for_load_state('networkidle', timeout=30000)
+                    self.idle(page, timeout=30000)
                     time.sleep(2)
                 except:
                     pass
@@ -501,6 +688,7 @@ class AutoLogin:
         
         return True
     
+    @trace.traced("claw.oauth")
     def oauth(self, page):
         """处理 OAuth"""
         if 'github.com/login/oauth/authorize' in page.url:
@@ -508,31 +696,46 @@ class AutoLogin:
             self.shot(page, "oauth")
             self.click(page, ['button[name="authorize"]', 'button:has-text("Authorize")'], "授权")
             time.sleep(3)
-            page.wait_for_load_state('networkidle', timeout=30000)
+            self.idle(page, timeout=30000)
     
+    @trace.traced("claw.wait_redirect")
     def wait_redirect(self, page, wait=60):
         """等待重定向"""
         self.log("等待重定向...", "STEP")
-        for i in range(wait):
-            url = page.url
-            if 'claw.cloud' in url and 'signin' not in url.lower():
+        deadline = time.monotonic() + wait
+        redirected = lambda u: 'claw.cloud' in u and 'signin' not in u.lower()
+        authorize = lambda u: 'github.com/login/oauth/authorize' in u
+        clicks = 0
+        
+        while True:
+            remaining = deadline - time.monotonic()
+            url = self.wait_url(page, lambda u: redirected(u) or authorize(u), max(remaining, 0),
+                                on_tick=lambda i: self.log(f"  等待... ({wait - int(remaining) + i}秒)"))
+            if url is None:
+                break
+            if redirected(url):
                 self.log("重定向成功！", "SUCCESS")
                 return True
-            if 'github.com/login/oauth/authorize' in url:
-                self.oauth(page)
-            time.sleep(1)
-            if i % 10 == 0:
-                self.log(f"  等待... ({i}秒)")
+            # wait_url 先比对当前 URL 再检查截止时间，停留在授权页时会立即返回，须在这里结束等待并限制点击次数
+            if deadline - time.monotonic() <= 0 or clicks >= OAUTH_CLICKS:
+                break
+            clicks += 1
+            self.oauth(page)
+            # 授权后仍停留在授权页时等待下一次跳转，避免重复点击
+            if authorize(page.url):
+                self.wait_url(page, lambda u: not authorize(u), max(deadline - time.monotonic(), 0))
+        
         self.log("重定向超时", "ERROR")
         return False
     
+    @trace.traced("claw.keepalive")
     def keepalive(self, page):
         """保活"""
         self.log("保活...", "STEP")
         for url, name in [(f"{CLAW_CLOUD_URL}/", "控制台"), (f"{CLAW_CLOUD_URL}/apps", "应用")]:
             try:
                 page.goto(url, timeout=30000)
-                page.wait_for_load_state('networkidle', timeout=15000)
+                self.idle(page, timeout=15000)
                 self.log(f"已访问: {name}", "SUCCESS")
                 time.sleep(2)
             except:
@@ -540,6 +743,9 @@ class AutoLogin:
         self.shot(page, "完成")
     
     def notify(self, ok, err=""):
+        # 每条结束路径都会经过这里，顺带导出指标（整个流程算作一个账号）
+        self.metrics.account(self.username or "", ok, time.time() - self.metrics.start, detail=err)
+        self.metrics.write()
         if not self.tg.ok:
             return
         
@@ -558,10 +764,9 @@ class AutoLogin:
         
         if self.shots:
             if not ok:
-                for s in self.shots[-3:]:
-                    self.tg.photo(s, s)
+                self.tg.album(list(self.shots)[-3:])
             else:
-                self.tg.photo(self.shots[-1], "完成")
+                self.tg.photo(self.shots[-1][0], "完成")
     
     def run(self):
         print("\n" + "="*50)
@@ -571,6 +776,9 @@ class AutoLogin:
         self.log(f"用户名: {self.username}")
         self.log(f"Session: {'有' if self.gh_session else '无'}")
         self.log(f"密码: {'有' if self.password else '无'}")
+        if not self.state.ok:
+            self.log("未设置 STATE_KEY，不保存登录状态快照", "WARN")
+            self.state.discard()
         
         if not self.username or not self.password:
             self.log("缺少凭据", "ERROR")
@@ -578,15 +786,29 @@ class AutoLogin:
             sys.exit(1)
         
         with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True, args=['--no-sandbox'])
+            with trace.span("browser.launch"):
+                browser = p.chromium.launch(headless=True, args=['--no-sandbox'])
+            # 有上次成功后保存的快照时，直接恢复完整的 Cookie 与 localStorage
+            saved_state = self.state.load()
+            if saved_state and self.gh_session:
+                # GH_SESSION 优先于快照中的 GitHub 会话：快照里的会话过期后，轮换过的 Secret 仍能生效
+                saved_state['cookies'] = [
+                    c for c in saved_state.get('cookies', [])
+                    if not (c.get('name') in ('user_session', 'logged_in') and 'github' in c.get('domain', ''))
+                ]
             context = browser.new_context(
                 viewport={'width': 1920, 'height': 1080},
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+                storage_state=saved_state
             )
+            self.blocker.install(context)
             page = context.new_page()
             
             try:
-                # 预加载 Cookie
+                if saved_state:
+                    self.log("已加载登录状态快照", "SUCCESS")
+                
+                # 预加载 Cookie（覆盖快照中的 GitHub 会话）
                 if self.gh_session:
                     try:
                         context.add_cookies([
@@ -599,8 +821,10 @@ class AutoLogin:
                 
                 # 1. 访问 ClawCloud
                 self.log("步骤1: 打开 ClawCloud", "STEP")
-                page.goto(SIGNIN_URL, timeout=60000)
-                page.wait_for_load_state('networkidle', timeout=30000)
+                # 导航超时或 net::ERR_* 时按退避重试，元素类错误不重试
+                with trace.span("claw.goto_signin"):
+                    Retry(log=lambda msg: self.log(msg, "WARN")).call(host_of(SIGNIN_URL), page.goto, SIGNIN_URL, timeout=60000)
+                self.idle(page, timeout=30000)
                 time.sleep(2)
                 self.shot(page, "clawcloud")
                 
@@ -611,6 +835,7 @@ class AutoLogin:
                     new = self.get_session(context)
                     if new:
                         self.save_cookie(new)
+                    self.save_state(context)
                     self.notify(True)
                     print("\n✅ 成功！\n")
                     return
@@ -627,7 +852,7 @@ class AutoLogin:
                     sys.exit(1)
                 
                 time.sleep(3)
-                page.wait_for_load_state('networkidle', timeout=30000)
+                self.idle(page, timeout=30000)
                 self.shot(page, "点击后")
                 
                 url = page.url
@@ -670,6 +895,7 @@ class AutoLogin:
                     self.save_cookie(new)
                 else:
                     self.log("未获取到新 Cookie", "WARN")
+                self.save_state(context)
                 
                 self.notify(True)
                 print("\n" + "="*50)
@@ -684,6 +910,7 @@ class AutoLogin:
                 self.notify(False, str(e))
                 sys.exit(1)
             finally:
+                print(f"📦 {self.blocker.summary()}")
                 browser.close()
 
 if __name__ == "__main__":
@@ -0,0 +1 @@
+"""各保活脚本共用的组件"""
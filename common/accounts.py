@@ -0,0 +1,154 @@
+"""
+账号来源（所有脚本共用）
+每行一个 `名称:密码`（密码中可以再有冒号），空行与 # 开头的行忽略。按以下优先级读取：
+    <ENV>_VAULT  加密账号文件的路径，密钥为 ACCOUNTS_KEY（用本模块的 seal 命令生成）
+    <ENV>_FILE   明文账号文件的路径
+    <ENV>        环境变量本身
+读取是惰性的：逐行解析、逐个产出只读的 Account，不会先把所有账号转成字典。
+
+分片：命令行 `--shard i/N`（或环境变量 ACCOUNT_SHARD=i/N，i 从 1 开始）只保留属于第 i 片的账号，
+按名称的 CRC32 分配，增删账号不会打乱其它账号所在的分片。
+
+生成加密账号文件：
+    ACCOUNTS_KEY=xxx python common/accounts.py seal accounts.txt accounts.vault
+"""
+
+import os
+import io
+import sys
+import zlib
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+Shard = Tuple[int, int]  # (i, N)，i 从 1 开始
+
+
+class Account:
+    """一行账号记录，只保存原始行与分隔符位置，字段在访问时切分；创建后不可修改"""
+
+    __slots__ = ("_line", "_sep", "_width")
+
+    def __init__(self, line: str, sep: int, width: int = 1):
+        object.__setattr__(self, "_line", line)
+        object.__setattr__(self, "_sep", sep)
+        object.__setattr__(self, "_width", width)  # 分隔符长度
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Account 是只读的")
+
+    @property
+    def name(self) -> str:
+        return self._line[:self._sep].strip()
+
+    @property
+    def secret(self) -> str:
+        return self._line[self._sep + self._width:].strip()
+
+    def __iter__(self):
+        # 支持 name, secret = account
+        yield self.name
+        yield self.secret
+
+    def __repr__(self) -> str:
+        return f"Account({self.name!r})"
+
+
+def _vault_key(key: str) -> bytes:
+    from nacl.hash import blake2b
+    from nacl.encoding import RawEncoder
+    return blake2b(key.encode(), digest_size=32, encoder=RawEncoder)
+
+
+def seal(text: str, key: str) -> bytes:
+    """把明文账号列表加密为 vault 文件内容"""
+    from nacl.secret import SecretBox
+    return SecretBox(_vault_key(key)).encrypt(zlib.compress(text.encode("utf-8")))
+
+
+def unseal(blob: bytes, key: str) -> str:
+    from nacl.secret import SecretBox
+    return zlib.decompress(SecretBox(_vault_key(key)).decrypt(blob)).decode("utf-8")
+
+
+def has_source(env: str) -> bool:
+    """是否配置了任意一种账号来源"""
+    return any(os.getenv(name) for name in (f"{env}_VAULT", f"{env}_FILE", env))
+
+
+def _lines(env: str) -> Iterable[str]:
+    vault, path = os.getenv(f"{env}_VAULT"), os.getenv(f"{env}_FILE")
+    if vault:
+        key = os.getenv("ACCOUNTS_KEY")
+        if not key:
+            raise ValueError(f"已设置 {env}_VAULT，但缺少解密密钥 ACCOUNTS_KEY")
+        with open(vault, "rb") as f:
+            return io.StringIO(unseal(f.read(), key))
+    if path:
+        return open(path, "r", encoding="utf-8")
+    return io.StringIO(os.getenv(env, ""))
+
+
+def parse_shard(argv: Optional[Sequence[str]] = None) -> Optional[Shard]:
+    """从命令行 --shard i/N 或环境变量 ACCOUNT_SHARD 解析分片，未设置返回 None"""
+    argv = sys.argv[1:] if argv is None else argv
+    spec = os.getenv("ACCOUNT_SHARD", "")
+    for i, arg in enumerate(argv):
+        if arg == "--shard" and i + 1 < len(argv):
+            spec = argv[i + 1]
+        elif arg.startswith("--shard="):
+            spec = arg.split("=", 1)[1]
+    if not spec.strip():
+        return None
+    try:
+        index, total = (int(x) for x in spec.split("/", 1))
+    except ValueError:
+        raise ValueError(f"分片格式应为 i/N，例如 1/3: {spec}")
+    if total < 1 or not 1 <= index <= total:
+        raise ValueError(f"分片序号超出范围: {spec}")
+    return index, total
+
+
+def in_shard(name: str, shard: Optional[Shard]) -> bool:
+    if not shard or shard[1] == 1:
+        return True
+    return zlib.crc32(name.encode("utf-8")) % shard[1] == shard[0] - 1
+
+
+def iter_accounts(env: str, sep: str = ":", shard: Optional[Shard] = None,
+                  on_invalid: Optional[Callable[[str], None]] = None) -> Iterator[Account]:
+    """
+    惰性读取 env 对应来源中的账号。格式错误（缺少分隔符、名称或密码为空）的行
+    交给 on_invalid(提示信息) 处理，不会输出该行内容以免泄露密码
+    """
+    lines = _lines(env)
+    try:
+        for lineno, raw in enumerate(lines, 1):
+            line = raw.strip()
+            if not line or line.startswith("#"):
+                continue
+            pos = line.find(sep)
+            account = Account(line, pos, len(sep)) if pos > 0 else None
+            if account is None or not account.name or not account.secret:
+                if on_invalid:
+                    on_invalid(f"第 {lineno} 行格式错误，应为 名称{sep}密码")
+                continue
+            if in_shard(account.name, shard):
+                yield account
+    finally:
+        close = getattr(lines, "close", None)
+        if close:
+            close()
+
+
+def load_accounts(env: str, **kwargs) -> List[Account]:
+    return list(iter_accounts(env, **kwargs))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "seal" or not os.getenv("ACCOUNTS_KEY"):
+        print("用法: ACCOUNTS_KEY=密钥 python common/accounts.py seal 明文账号文件 输出的vault文件")
+        sys.exit(1)
+    with open(sys.argv[2], "r", encoding="utf-8") as f:
+        sealed = seal(f.read(), os.environ["ACCOUNTS_KEY"])
+    with open(sys.argv[3], "wb") as f:
+        f.write(sealed)
+    print(f"✅ 已生成 {sys.argv[3]}")
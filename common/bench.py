@@ -0,0 +1,214 @@
+"""
+基准测试（所有脚本共用）
+对每个脚本起一个 common/replay.py 回放服务，生成一批假账号，以子进程完整运行一遍脚本，统计：
+    wall        总耗时（秒）
+    throughput  每秒完成的账号数
+    p50/p90/p99 各账号耗时（回放服务按会话统计，从第一个请求到最后一个响应）
+    peak_rss_kb 子进程的峰值内存
+    exit_code   脚本退出码；以及回放服务的请求、503、断开次数
+
+用法：
+    python common/bench.py --accounts 50 --rounds 3 --latency 0.05 --out bench.json
+    python common/bench.py --scripts koyeb,whm --baseline bench.json --max-regression 0.2
+指定 --baseline 时与之前保存的结果比较，wall 或 p90 比基线慢超过 --max-regression（比例）即以退出码 1 结束，可用于 CI 卡点。
+
+netlib-browser 需要已安装 Playwright 的 Chromium；ClawCloud 的 GitHub 登录与两步验证不在回放范围内。
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # 仓库根目录
+sys.path.insert(0, ROOT)
+
+from common.replay import ReplayServer
+
+Accounts = Callable[[int], str]
+
+
+def _koyeb_accounts(n: int) -> str:
+    return "\n".join(f"user{i}@example.com:tok-user{i}@example.com" for i in range(n))
+
+
+def _login_accounts(n: int) -> str:
+    return "\n".join(f"user{i}:pass{i}" for i in range(n))
+
+
+# 名称 -> (脚本路径, 账号变量, 账号生成函数, 额外环境变量, 是否走 HTTP 快速登录)
+SCRIPTS: Dict[str, Tuple[str, str, Accounts, Dict[str, str], bool]] = {
+    "koyeb": ("koyeb-alive/koyeb-alive.py", "KOYEB_LOGIN", _koyeb_accounts, {"KOYEB_ASYNC": "1"}, False),
+    "koyeb-serial": ("koyeb-alive/koyeb-alive.py", "KOYEB_LOGIN", _koyeb_accounts, {"KOYEB_ASYNC": "0"}, False),
+    "whm": ("webhostmost-checkin/checkin.py", "WHM_ACCOUNT", _login_accounts, {}, False),
+    "netlib-http": ("netlib-login/autologin.py", "NETLIB_ACCOUNTS", _login_accounts, {}, True),
+    "netlib-browser": ("netlib-login/autologin.py", "NETLIB_ACCOUNTS", _login_accounts, {}, False),
+}
+DEFAULT_SCRIPTS = "koyeb,koyeb-serial,whm,netlib-http,tg"
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def _run(cmd: List[str], env: Dict[str, str]) -> Dict[str, Any]:
+    """运行子进程，返回退出码、耗时、峰值内存与标准输出（输出只在失败时打印，便于排查）"""
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = proc.stdout.read()
+    try:
+        _, status, usage = os.wait4(proc.pid, 0)
+        code, peak = os.waitstatus_to_exitcode(status), usage.ru_maxrss
+    except AttributeError:  # Windows 没有 wait4
+        code, peak = proc.wait(), 0
+    proc.returncode = code
+    return {"exit_code": code, "wall": time.perf_counter() - start, "peak_rss_kb": peak,
+            "output": output.decode("utf-8", "replace")}
+
+
+def _base_env(tmp: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    for name in ("KOYEB_LOGIN", "WHM_ACCOUNT", "NETLIB_ACCOUNTS", "ACCOUNT_SHARD", "RESULT_FILE"):
+        for suffix in ("", "_FILE", "_VAULT"):
+            env.pop(name + suffix, None)
+    env.update({
+        "RUN_FORCE": "1",  # 不按上次运行结果跳过账号
+        "RUN_STATE_FILE": os.path.join(tmp, "run-state.json"),
+        "TG_ENTITY_CACHE": os.path.join(tmp, "tg-entities.json"),
+        "PYTHONIOENCODING": "utf-8",
+    })
+    return env
+
+
+def bench_script(name: str, accounts: int, args, tmp: str) -> Dict[str, Any]:
+    path, account_env, generate, extra, netlib_http = SCRIPTS[name]
+    with ReplayServer(latency=args.latency, jitter=args.jitter,
+                      error_rate=args.error_rate, drop_rate=args.drop_rate) as server:
+        env = _base_env(tmp)
+        env.update(server.env(netlib_http=netlib_http))
+        env.update(extra)
+        env[account_env] = generate(accounts)
+        result = _run([sys.executable, path], env)
+        latencies = server.latencies()
+        result.update(counters=dict(server.counters))
+    result.update(accounts=accounts, latencies=latencies)
+    return result
+
+
+def bench_tg(args, tmp: str) -> Dict[str, Any]:
+    """签到插件由 tg-checkin/fake_bot.py 在进程内模拟机器人运行，最后一行输出统计"""
+    env = _base_env(tmp)
+    cmd = [sys.executable, "tg-checkin/fake_bot.py", "--rounds", str(args.accounts),
+           "--latency", str(args.latency), "--jitter", str(args.jitter), "--drop-rate", str(args.drop_rate)]
+    result = _run(cmd, env)
+    lines = result["output"].strip().splitlines()
+    try:
+        stats = json.loads(lines[-1])
+    except (IndexError, ValueError):
+        stats = {"accounts": 0, "latencies": []}
+    result.update(accounts=stats["accounts"], latencies=stats["latencies"], counters={})
+    return result
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """多轮结果取中位数，延迟分位数按所有轮次的账号合并计算"""
+    latencies = [x for run in runs for x in run["latencies"]]
+    wall = statistics.median(run["wall"] for run in runs)
+    accounts = runs[0]["accounts"]
+    counters: Dict[str, int] = {}
+    for run in runs:
+        for key, value in run["counters"].items():
+            counters[key] = counters.get(key, 0) + value
+    return {
+        "accounts": accounts,
+        "rounds": len(runs),
+        "wall": round(wall, 4),
+        "throughput": round(accounts / wall, 2) if wall else 0.0,
+        "p50": round(percentile(latencies, 0.50), 4),
+        "p90": round(percentile(latencies, 0.90), 4),
+        "p99": round(percentile(latencies, 0.99), 4),
+        "peak_rss_kb": max(run["peak_rss_kb"] for run in runs),
+        "exit_codes": sorted({run["exit_code"] for run in runs}),
+        "counters": counters,
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            max_regression: float) -> List[str]:
+    """返回超过允许退化比例的指标说明"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in ("wall", "p90"):
+            if base.get(key) and current[key] > base[key] * (1 + max_regression):
+                regressions.append(f"{name} {key}: {base[key]:.3f}s -> {current[key]:.3f}s "
+                                   f"(+{(current[key] / base[key] - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="用离线回放服务对各脚本做基准测试")
+    parser.add_argument("--scripts", default=DEFAULT_SCRIPTS,
+                        help=f"逗号分隔，可选: {','.join(list(SCRIPTS) + ['tg'])}")
+    parser.add_argument("--accounts", type=int, default=20, help="每个脚本的账号数（tg 为运行轮数）")
+    parser.add_argument("--rounds", type=int, default=3, help="每个脚本重复运行的次数")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--out", help="把结果写入 JSON 文件，可作为之后的 --baseline")
+    parser.add_argument("--baseline", help="之前保存的结果文件")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="允许的退化比例，默认 0.2")
+    args = parser.parse_args()
+
+    names = [s.strip() for s in args.scripts.split(",") if s.strip()]
+    unknown = [s for s in names if s not in SCRIPTS and s != "tg"]
+    if unknown:
+        parser.error(f"未知的脚本: {', '.join(unknown)}")
+
+    results: Dict[str, Dict[str, Any]] = {}
+    print(f"{'脚本':<16}{'账号':>6}{'总耗时':>9}{'吞吐/s':>9}{'p50':>8}{'p90':>8}{'p99':>8}{'峰值内存':>11}  退出码")
+    for name in names:
+        runs = []
+        for _ in range(args.rounds):
+            with tempfile.TemporaryDirectory() as tmp:
+                run = bench_tg(args, tmp) if name == "tg" else bench_script(name, args.accounts, args, tmp)
+            if run["exit_code"] != 0 and not (args.error_rate or args.drop_rate):
+                print(f"⚠️ {name} 退出码 {run['exit_code']}，输出末尾:\n{run['output'][-2000:]}")
+            runs.append(run)
+        s = results[name] = summarize(runs)
+        print(f"{name:<16}{s['accounts']:>6}{s['wall']:>9.2f}{s['throughput']:>9.1f}{s['p50']:>8.3f}"
+              f"{s['p90']:>8.3f}{s['p99']:>8.3f}{s['peak_rss_kb'] / 1024:>9.1f}MB  {s['exit_codes']}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"params": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"📝 结果已写入 {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print(f"❌ 相对基线退化超过 {args.max_regression * 100:.0f}%:")
+            for line in regressions:
+                print(f"    {line}")
+            return 1
+        print("✅ 未超过基线的退化阈值")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Playwright 轻量浏览配置（所有保活脚本共用）
+- 通过 context.route 拦截不需要的资源类型（默认图片、字体、音视频）
+- 按域名拒绝列表拦截统计/广告等第三方请求；设置允许列表后，列表外的第三方域名一律拦截
+- 页面本身（document）永远放行
+- 个别页面被拦坏时，可按站点放行指定资源类型
+- 运行结束输出拦截统计、实际下载量与估算的节省量
+
+环境变量：
+    BLOCK_PROFILE        on（默认）/ off，off 时不做任何拦截，可用于对比下载量
+    BLOCK_RESOURCES      逗号分隔的资源类型，默认 image,media,font
+    BLOCK_DOMAINS        额外拒绝的域名，逗号分隔，与内置统计/广告域名合并
+    BLOCK_ALLOW_DOMAINS  额外允许的域名，逗号分隔，与脚本传入的站点域名合并（各脚本另有自己的变量，
+                         如 NETLIB_ALLOW_DOMAINS、CLAW_ALLOW_DOMAINS，守护进程中多个脚本共用一个进程时互不影响）
+    BLOCK_OVERRIDES      按站点放行的资源类型，如 github.com=image;claw.cloud=font,image
+"""
+
+import os
+from collections import Counter
+from typing import Dict, Iterable, Optional, Set
+from urllib.parse import urlsplit
+
+DEFAULT_RESOURCES = "image,media,font"
+DEFAULT_DENY_DOMAINS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "googleadservices.com", "facebook.net", "hotjar.com", "clarity.ms", "segment.io",
+    "mixpanel.com", "sentry.io", "intercom.io", "cloudflareinsights.com",
+)
+# 被拦截请求的估算大小（字节）：优先用本次运行中同类型已下载响应的平均大小，没有时用下面的典型值。
+# 典型值只是常见网页中各类资源的大致量级，节省量因此只是估算，不是实测
+TYPICAL_SIZES = {"image": 20_000, "font": 30_000, "media": 500_000, "script": 20_000, "stylesheet": 10_000}
+DEFAULT_SIZE = 5_000
+
+
+def _split(value: str, sep: str = ",") -> Set[str]:
+    return {item.strip().lower() for item in value.split(sep) if item.strip()}
+
+
+def _parse_overrides(value: str) -> Dict[str, Set[str]]:
+    overrides: Dict[str, Set[str]] = {}
+    for item in value.split(";"):
+        if "=" in item:
+            site, types = item.split("=", 1)
+            overrides.setdefault(site.strip().lower(), set()).update(_split(types))
+    return overrides
+
+
+def _host(url: str) -> str:
+    try:
+        return (urlsplit(url).hostname or "").lower()
+    except ValueError:
+        return ""
+
+
+def _matches(host: str, domains: Iterable[str]) -> bool:
+    """host 等于某个域名或是其子域名"""
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+
+class ResourceBlocker:
+    """
+    用法：
+        blocker = ResourceBlocker(allow=["github.com", "githubassets.com"])
+        blocker.install(context)              # 同步 API
+        await blocker.install_async(context)  # 异步 API
+        print(blocker.summary())
+    allow 为站点自身的域名；传入后（或设置 BLOCK_ALLOW_DOMAINS 后）列表外的第三方请求会被拦截
+    """
+
+    def __init__(self, allow: Optional[Iterable[str]] = None,
+                 overrides: Optional[Dict[str, Iterable[str]]] = None):
+        self.enabled = os.getenv("BLOCK_PROFILE", "on").strip().lower() not in ("off", "0", "false", "no")
+        self.resources = _split(os.getenv("BLOCK_RESOURCES", DEFAULT_RESOURCES))
+        self.deny = set(DEFAULT_DENY_DOMAINS) | _split(os.getenv("BLOCK_DOMAINS", ""))
+        self.allow = {d.strip().lower() for d in (allow or ()) if d.strip()} | _split(os.getenv("BLOCK_ALLOW_DOMAINS", ""))
+        self.overrides = {site.lower(): set(types) for site, types in (overrides or {}).items()}
+        for site, types in _parse_overrides(os.getenv("BLOCK_OVERRIDES", "")).items():
+            self.overrides.setdefault(site, set()).update(types)
+
+        self.blocked: Counter = Counter()  # 资源类型 -> 拦截数
+        self.responses = 0
+        self.loaded_bytes = 0
+        self.loaded_by_type: Counter = Counter()  # 资源类型 -> 已下载字节数（按 content-length）
+        self.counted_by_type: Counter = Counter()  # 资源类型 -> 带 content-length 的响应数
+
+    def should_block(self, url: str, resource_type: str, page_url: str = "") -> bool:
+        if not self.enabled or resource_type == "document":
+            return False
+        host = _host(url)
+        if _matches(host, self.deny):
+            return True
+        if self.allow and host and not _matches(host, self.allow):
+            return True
+        if resource_type not in self.resources:
+            return False
+        # 站点覆盖：请求所在页面或请求本身的域名命中时，放行对应资源类型
+        for site, types in self.overrides.items():
+            if resource_type in types and (_matches(_host(page_url), (site,)) or _matches(host, (site,))):
+                return False
+        return True
+
+    def _check(self, request) -> bool:
+        try:
+            page_url = request.frame.url
+        except Exception:
+            page_url = ""
+        blocked = self.should_block(request.url, request.resource_type, page_url)
+        if blocked:
+            self.blocked[request.resource_type] += 1
+        return blocked
+
+    def _on_response(self, response):
+        self.responses += 1
+        try:
+            size = int(response.headers.get("content-length") or 0)
+        except (TypeError, ValueError):
+            return
+        self.loaded_bytes += size
+        if size:
+            try:
+                resource_type = response.request.resource_type
+            except Exception:
+                return
+            self.loaded_by_type[resource_type] += size
+            self.counted_by_type[resource_type] += 1
+
+    def estimated_saved_bytes(self) -> int:
+        """被拦截请求的估算大小之和，见 TYPICAL_SIZES"""
+        total = 0
+        for resource_type, count in self.blocked.items():
+            seen = self.counted_by_type[resource_type]
+            average = self.loaded_by_type[resource_type] / seen if seen else TYPICAL_SIZES.get(resource_type, DEFAULT_SIZE)
+            total += int(count * average)
+        return total
+
+    def install(self, context):
+        """同步 API：为 context 下的所有页面安装拦截规则"""
+        context.on("response", self._on_response)
+        if not self.enabled:
+            return
+
+        def handler(route):
+            if self._check(route.request):
+                route.abort("blockedbyclient")
+            else:
+                route.continue_()
+
+        context.route("**/*", handler)
+
+    async def install_async(self, context):
+        """异步 API：为 context 下的所有页面安装拦截规则"""
+        context.on("response", self._on_response)
+        if not self.enabled:
+            return
+
+        async def handler(route):
+            if self._check(route.request):
+                await route.abort("blockedbyclient")
+            else:
+                await route.continue_()
+
+        await context.route("**/*", handler)
+
+    def summary(self) -> str:
+        loaded = f"完成 {self.responses} 个请求，下载约 {self.loaded_bytes / 1024:.0f} KB"
+        if not self.enabled:
+            return f"资源拦截已关闭，{loaded}"
+        total = sum(self.blocked.values())
+        detail = "，".join(f"{t} {n}" for t, n in self.blocked.most_common())
+        saved = f"，估算少下载约 {self.estimated_saved_bytes() / 1024:.0f} KB（按同类型平均大小估算）" if total else ""
+        return f"已拦截 {total} 个请求（{detail or '无'}）{saved}，{loaded}"
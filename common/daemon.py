@@ -0,0 +1,369 @@
+"""
+守护进程模式（所有脚本共用）
+cron / workflow 每次运行都要重新启动 Python、导入 requests/playwright/telethon、启动浏览器并重新建立 TLS 连接。
+守护进程只导入一次各脚本，并在多次运行之间保留以下资源：
+    koyeb   aiohttp 连接池
+    whm     共享连接池（脚本自身的 SHARED_ADAPTER，随模块常驻）
+    netlib  常驻的 Chromium（只在 HTTP 快速登录得不出结论时才启动，之后一直复用）
+    tg      保持连接的 Telethon 客户端
+    claw    Playwright 同步接口只能在创建它的线程中使用，每次运行仍在工作线程中临时启动浏览器，只省去进程启动与导入
+每个脚本由 asyncio 调度器按各自的间隔运行，间隔从上次开始运行时算起，另加随机抖动，同一脚本不会重叠运行。
+各脚本的跳过逻辑（RunState）、指标导出、阶段计时与 Telegram 报告与单次运行完全相同。
+
+用法：
+    python common/daemon.py                      # 按环境变量调度所有已配置账号的脚本
+    python common/daemon.py --only koyeb,tg      # 只调度指定脚本
+    python common/daemon.py --once               # 每个脚本立即运行一次后退出，用于检查配置
+
+环境变量：
+    DAEMON_PROVIDERS         逗号分隔的脚本名称，默认为已配置账号的全部脚本：koyeb,whm,netlib,claw,tg
+    DAEMON_<名称>_INTERVAL   运行间隔，支持 s/m/h/d 后缀（如 30m、6h），默认与原 workflow 的定时相当
+    DAEMON_<名称>_JITTER     每次在间隔之外随机延后的上限，默认为间隔的 10%
+    DAEMON_ENV_FILE          KEY=VALUE 格式的配置文件，启动与重新加载时读取并覆盖进程的环境变量
+
+信号：
+    SIGHUP           平滑重新加载：不再开始新的运行，等进行中的运行结束后关闭常驻资源，重新读取 DAEMON_ENV_FILE、
+                     重新导入各脚本（脚本中的配置与账号随之更新），再按新配置继续调度；已排好的下次运行时间保留
+    SIGTERM / SIGINT 等进行中的运行结束后退出；再收到一次则立即取消
+common/ 下各模块的配置（METRICS_*、TRACE*、RETRY_* 等）只在启动时读取，修改后需要重启守护进程。
+用 systemd 运行时可设置 ExecReload=/bin/kill -HUP $MAINPID，之后 systemctl reload 即可重新加载。
+"""
+
+import os
+import sys
+import time
+import random
+import signal
+import asyncio
+import argparse
+import traceback
+import importlib.util
+from datetime import datetime
+from types import ModuleType
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # 仓库根目录
+sys.path.insert(0, ROOT)
+
+from common import trace
+from common.accounts import has_source
+from common.notify import reset_notifier
+
+Runner = Callable[[ModuleType, 'Resources'], Awaitable[bool]]
+
+
+def log(msg: str):
+    print(f"{datetime.now():%Y-%m-%d %H:%M:%S} {msg}", flush=True)
+
+
+def parse_duration(text: str) -> float:
+    """'90' / '30s' / '15m' / '6h' / '7d' -> 秒"""
+    text = text.strip().lower()
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def load_env_file(path: str):
+    """读取 KEY=VALUE 文件覆盖环境变量，忽略空行与 # 开头的行，值两侧的引号会去掉"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            key = key.strip()
+            if key.startswith("export "):
+                key = key[len("export "):].strip()
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+                value = value[1:-1]
+            os.environ[key] = value
+
+
+class Resources:
+    """常驻资源：第一次使用时创建，重新加载或退出时统一关闭"""
+
+    def __init__(self):
+        self.sessions: Dict[str, Any] = {}  # 名称 -> aiohttp.ClientSession
+        self.playwright = None
+        self.chromium = None
+        self.telegram = None
+        self.browser_lock = asyncio.Lock()  # 多个脚本同时要浏览器时只启动一个
+
+    def http(self, name: str, factory: Callable[[], Any]):
+        session = self.sessions.get(name)
+        if session is None or session.closed:
+            session = self.sessions[name] = factory()
+        return session
+
+    async def browser(self):
+        """常驻的 Chromium，断开（崩溃）后自动重新启动；各账号仍使用独立的 BrowserContext"""
+        async with self.browser_lock:
+            if self.chromium is None or not self.chromium.is_connected():
+                from playwright.async_api import async_playwright
+                if self.playwright is None:
+                    self.playwright = await async_playwright().start()
+                async with trace.span("browser.launch"):
+                    self.chromium = await self.playwright.chromium.launch(headless=True)
+                log("🌐 已启动常驻浏览器")
+            return self.chromium
+
+    def telegram_client(self, runner: ModuleType):
+        if self.telegram is None:
+            if not (runner.TG_API_ID and runner.TG_API_HASH and runner.TG_SESSION_STR):
+                raise ValueError("缺少 TG_API_ID / TG_API_HASH / TG_SESSION_STR")
+            from telethon import TelegramClient
+            from telethon.sessions import StringSession
+            self.telegram = TelegramClient(StringSession(runner.TG_SESSION_STR), int(runner.TG_API_ID), runner.TG_API_HASH)
+        return self.telegram
+
+    async def close(self):
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions.clear()
+        if self.telegram is not None and self.telegram.is_connected():
+            await self.telegram.disconnect()
+        self.telegram = None
+        if self.chromium is not None:
+            try:
+                await self.chromium.close()
+            except Exception as e:
+                log(f"⚠️ 关闭浏览器失败: {e}")
+        if self.playwright is not None:
+            await self.playwright.stop()
+        self.chromium = self.playwright = None
+
+
+# ---------------- 各脚本的运行方式 ----------------
+async def run_koyeb(module: ModuleType, res: Resources) -> bool:
+    if not module.KOYEB_ASYNC:
+        return await asyncio.to_thread(module.run)
+    loop = asyncio.get_running_loop()
+    session = res.http("koyeb", module.new_client_session)
+
+    def verify(accounts):
+        # run() 在工作线程中执行，异步验证回到事件循环上使用常驻的连接池
+        return asyncio.run_coroutine_threadsafe(module.verify_accounts_async(accounts, session), loop).result()
+
+    return await asyncio.to_thread(module.run, verify)
+
+
+async def run_whm(module: ModuleType, res: Resources) -> bool:
+    return await asyncio.to_thread(module.run)
+
+
+async def run_netlib(module: ModuleType, res: Resources) -> bool:
+    results = await module.run(get_browser=res.browser)
+    return await asyncio.to_thread(module.send_report, results)
+
+
+async def run_claw(module: ModuleType, res: Resources) -> bool:
+    def once() -> bool:
+        try:
+            module.AutoLogin().run()
+        except SystemExit as e:  # 脚本在失败时调用 sys.exit
+            return not e.code
+        return True
+
+    return await asyncio.to_thread(once)
+
+
+async def run_tg(module: ModuleType, res: Resources) -> bool:
+    targets = module.resolve_targets(module.RUN_TARGET)
+    return await module.check_in(res.telegram_client(module), targets)
+
+
+# 名称 -> (脚本路径, 判断是否已配置的变量, 默认间隔, 运行方式)
+PROVIDERS: Dict[str, Tuple[str, str, str, Runner]] = {
+    "koyeb": ("koyeb-alive/koyeb-alive.py", "KOYEB_LOGIN", "7d", run_koyeb),
+    "whm": ("webhostmost-checkin/checkin.py", "WHM_ACCOUNT", "30d", run_whm),
+    "netlib": ("netlib-login/autologin.py", "NETLIB_ACCOUNTS", "60d", run_netlib),
+    "claw": ("clawcloud-run/auto-login.py", "GH_USERNAME", "15d", run_claw),
+    "tg": ("tg-checkin/runner.py", "TG_SESSION_STR", "1d", run_tg),
+}
+
+
+def provider_dir(name: str) -> str:
+    return os.path.join(ROOT, os.path.dirname(PROVIDERS[name][0]))
+
+
+def load_provider(name: str) -> ModuleType:
+    """按文件路径导入脚本（不执行 __main__ 部分），脚本所在目录加入 sys.path，与直接运行脚本时一致"""
+    directory = provider_dir(name)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    module_name = f"daemon_{name}"
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(ROOT, PROVIDERS[name][0]))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def unload_providers(names: List[str]):
+    """移除脚本及其目录下被导入的模块（如 tg 的签到插件），下次导入时重新读取配置"""
+    directories = [provider_dir(name) + os.sep for name in names]
+    for module_name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None) or ""
+        if any(path.startswith(d) for d in directories):
+            del sys.modules[module_name]
+
+
+def select_providers(only: Optional[str]) -> List[str]:
+    spec = only or os.getenv("DAEMON_PROVIDERS", "")
+    if spec:
+        names = [s.strip().lower() for s in spec.split(",") if s.strip()]
+        unknown = [s for s in names if s not in PROVIDERS]
+        if unknown:
+            raise ValueError(f"未知的脚本: {', '.join(unknown)}，可选: {','.join(PROVIDERS)}")
+        return names
+    return [name for name, (_, source, _, _) in PROVIDERS.items() if has_source(source)]
+
+
+class Job:
+    """一个脚本的调度参数"""
+
+    def __init__(self, name: str, module: ModuleType):
+        self.name = name
+        self.module = module
+        self.runner = PROVIDERS[name][3]
+        key = f"DAEMON_{name.upper()}"
+        self.interval = parse_duration(os.getenv(f"{key}_INTERVAL", PROVIDERS[name][2]))
+        jitter = os.getenv(f"{key}_JITTER")
+        self.jitter = parse_duration(jitter) if jitter else self.interval * 0.1
+        if self.interval <= 0:
+            raise ValueError(f"{key}_INTERVAL 必须大于 0")
+
+    def describe(self) -> str:
+        return f"{self.name}: 每 {self.interval / 3600:g} 小时，抖动 ≤ {self.jitter / 60:g} 分钟"
+
+    async def run_once(self, res: Resources) -> bool:
+        start = time.monotonic()
+        log(f"▶️ {self.name} 开始运行")
+        try:
+            async with trace.span(f"daemon.{self.name}"):
+                ok = await self.runner(self.module, res)
+        except Exception as e:
+            traceback.print_exc()
+            log(f"❌ {self.name} 运行出错: {type(e).__name__} - {e}")
+            return False
+        log(f"{'✅' if ok else '❌'} {self.name} 运行结束，用时 {time.monotonic() - start:.1f} 秒")
+        return ok
+
+
+class Daemon:
+    def __init__(self, only: Optional[str] = None):
+        self.only = only
+        self.next_due: Dict[str, float] = {}  # 名称 -> 下次运行的时间戳，重新加载后保留
+        self.reload = False
+        self.stop: Optional[asyncio.Event] = None
+        self.tasks: List[asyncio.Task] = []
+
+    def load(self) -> List[Job]:
+        env_file = os.getenv("DAEMON_ENV_FILE")
+        if env_file:
+            load_env_file(env_file)
+        jobs = [Job(name, load_provider(name)) for name in select_providers(self.only)]
+        now = time.time()
+        for job in jobs:
+            # 首次启动时各脚本错开最多一分钟开始；重新加载后沿用原定时间，间隔缩短时提前
+            start = now + random.uniform(0, min(job.jitter, 60))
+            self.next_due[job.name] = min(self.next_due.get(job.name, start), now + job.interval)
+        return jobs
+
+    async def schedule(self, job: Job, res: Resources):
+        while not self.stop.is_set():
+            delay = self.next_due[job.name] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.stop.wait(), timeout=delay)
+                    return
+                except asyncio.TimeoutError:
+                    pass
+            started = time.time()
+            await job.run_once(res)
+            self.next_due[job.name] = started + job.interval + random.uniform(0, job.jitter)
+            log(f"⏰ {job.name} 下次运行: {datetime.fromtimestamp(self.next_due[job.name]):%Y-%m-%d %H:%M:%S}")
+
+    def on_reload(self):
+        log("🔄 收到 SIGHUP，等待进行中的运行结束后重新加载")
+        self.reload = True
+        self.stop.set()
+
+    def on_terminate(self):
+        if self.stop.is_set() and not self.reload:
+            log("⛔ 再次收到退出信号，取消进行中的运行")
+            for task in self.tasks:
+                task.cancel()
+            return
+        log("🛑 收到退出信号，等待进行中的运行结束")
+        self.reload = False
+        self.stop.set()
+
+    def install_signals(self):
+        loop = asyncio.get_running_loop()
+        handlers = [(getattr(signal, "SIGHUP", None), self.on_reload),
+                    (signal.SIGTERM, self.on_terminate), (signal.SIGINT, self.on_terminate)]
+        for sig, handler in handlers:
+            if sig is None:
+                continue
+            try:
+                loop.add_signal_handler(sig, handler)
+            except NotImplementedError:  # Windows 的事件循环不支持，只能用 Ctrl+C 结束
+                pass
+
+    async def serve(self) -> int:
+        self.install_signals()
+        while True:
+            self.stop = asyncio.Event()
+            self.reload = False
+            try:
+                jobs = self.load()
+            except Exception as e:  # 重新加载时配置有误也直接退出，由 systemd 等进程管理器提示并重启
+                traceback.print_exc()
+                log(f"❌ 加载脚本或配置失败: {e}")
+                return 1
+            if not jobs:
+                log("⚠️ 没有已配置的脚本，请设置账号变量或 DAEMON_PROVIDERS")
+                return 1
+            log("🚀 守护进程已启动，调度:\n    " + "\n    ".join(job.describe() for job in jobs))
+            res = Resources()
+            self.tasks = [asyncio.create_task(self.schedule(job, res)) for job in jobs]
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            await res.close()
+            reset_notifier()
+            if not self.reload:
+                log("👋 守护进程已退出")
+                return 0
+            unload_providers([job.name for job in jobs])
+
+    async def once(self) -> int:
+        jobs = self.load()
+        if not jobs:
+            log("⚠️ 没有已配置的脚本，请设置账号变量或 DAEMON_PROVIDERS")
+            return 1
+        res = Resources()
+        try:
+            results = await asyncio.gather(*(job.run_once(res) for job in jobs))
+        finally:
+            await res.close()
+            reset_notifier()  # 报告发送完再退出，不依赖 atexit
+        for job, ok in zip(jobs, results):
+            log(f"{'✅' if ok else '❌'} {job.name}")
+        return 0 if all(results) else 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="常驻运行各保活脚本，按各自的间隔调度")
+    parser.add_argument("--only", help=f"逗号分隔的脚本名称，覆盖 DAEMON_PROVIDERS，可选: {','.join(PROVIDERS)}")
+    parser.add_argument("--once", action="store_true", help="每个脚本立即运行一次后退出")
+    args = parser.parse_args()
+
+    daemon = Daemon(args.only)
+    return asyncio.run(daemon.once() if args.once else daemon.serve())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
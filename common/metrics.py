@@ -0,0 +1,310 @@
+"""
+OpenMetrics 导出（所有 Python 入口共用）
+运行结束时把本次结果写成指标，供 Prometheus 抓取后按趋势告警，不必再从 Telegram 消息里看。
+以下环境变量都未设置时不导出，也不产生任何文件：
+    METRICS_TEXTFILE_DIR  node-exporter textfile collector 目录，写入 <脚本名>.prom（先写临时文件再改名，不会被读到一半）
+    METRICS_PUSHGATEWAY   Pushgateway 地址，如 http://127.0.0.1:9091，整组 PUT 到 /metrics/job/<脚本名>[/instance/<实例>]
+    METRICS_FILE          写出一份 OpenMetrics 1.0 文本（带 # EOF 与 _created），供支持 OpenMetrics 的采集器使用
+其它可选变量：
+    METRICS_INSTANCE       推送时的 instance 分组标签，默认主机名
+    METRICS_STATE_FILE     计数器、直方图与最近成功时间的保存位置；设置了 METRICS_TEXTFILE_DIR 时默认为该目录下的 .<脚本名>.state.json
+                           （node-exporter 只读取 .prom 文件），两者都没有时计数器只反映本次运行，只用 Pushgateway 时建议设置
+    METRICS_ACCOUNT_LABEL  账号标签取值：hash（默认，只保存哈希）或 name（原始名称，适合自己的机器）
+
+textfile 与 Pushgateway 使用两者都能解析的 Prometheus 文本格式 0.0.4；指标名与 METRICS_FILE 的 OpenMetrics 输出一致。
+
+指标：
+    keepalive_account_duration_seconds         histogram  {script}                  各账号处理耗时
+    keepalive_account_results_total            counter    {script, result, reason}  各账号结果，reason 为归类后的原因
+    keepalive_days_remaining                   gauge      {script, account}         剩余保活天数（如 webhostmost）
+    keepalive_accounts                         gauge      {script, result}          本次运行各结果的账号数
+    keepalive_last_run_timestamp_seconds       gauge      {script}
+    keepalive_last_success_timestamp_seconds   gauge      {script}                  最近一次至少一个账号成功的时间，每次都输出（失败的运行沿用
+                                                                                       保存的值，从未成功过为 0），可用 time() - 该值 告警
+    keepalive_run_duration_seconds             gauge      {script}
+脚本也可用 gauge() 补充自己的指标，如 icmp9 的流量配额。
+
+用法：
+    metrics = Metrics("webhostmost-checkin", shard)
+    metrics.account(email, ok, seconds, detail="账号或密码错误", days=45)
+    metrics.write()
+"""
+
+import os
+import re
+import json
+import time
+import socket
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+METRICS_TEXTFILE_DIR = os.getenv("METRICS_TEXTFILE_DIR", "")
+METRICS_PUSHGATEWAY = os.getenv("METRICS_PUSHGATEWAY", "").rstrip("/")
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+METRICS_INSTANCE = os.getenv("METRICS_INSTANCE", "") or socket.gethostname()
+METRICS_STATE_FILE = os.getenv("METRICS_STATE_FILE", "")
+METRICS_ACCOUNT_LABEL = os.getenv("METRICS_ACCOUNT_LABEL", "hash").strip().lower()
+
+PREFIX = "keepalive"
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# 失败原因归类：按顺序匹配说明文字中的关键词，避免把原始错误信息当作标签值导致序列数量失控
+REASONS: List[Tuple[str, Tuple[str, ...]]] = [
+    ("unavailable", ("熔断", "服务不可用", "暂时不可用", "503", "502", "504")),
+    ("timeout", ("超时", "timeout", "timed out")),
+    ("auth", ("密码错误", "无效或已过期", "invalid credentials", "已失效", "token 无效")),
+    ("csrf", ("csrf",)),
+    ("account_state", ("非活跃", "未验证")),
+    ("network", ("网络", "连接", "connection", "resolve")),
+    ("no_reply", ("未收到", "没有回复")),
+    ("config", ("未配置", "为空", "缺少")),
+]
+
+
+def classify(detail: str) -> str:
+    """把失败说明归为少数几类原因"""
+    text = (detail or "").lower()
+    for reason, keywords in REASONS:
+        if any(k.lower() in text for k in keywords):
+            return reason
+    return "other"
+
+
+def account_label(name: str) -> str:
+    if METRICS_ACCOUNT_LABEL == "name":
+        return name
+    return hashlib.sha256(name.encode("utf-8")).hexdigest()[:16]
+
+
+_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "TB": 1024 ** 4}
+
+
+def parse_bytes(text: str) -> Optional[float]:
+    """'47.7 GB' -> 字节数（按 1024 进制），无法解析返回 None"""
+    m = re.match(r"\s*([\d.]+)\s*([KMGT]?B)\b", str(text or ""), re.IGNORECASE)
+    if not m:
+        return None
+    try:
+        return float(m.group(1)) * _UNITS[m.group(2).upper()]
+    except ValueError:
+        return None
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Dict[str, Any], extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels.items()]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Metrics:
+    def __init__(self, script: str, shard: Optional[Tuple[int, int]] = None):
+        self.script = script
+        self.job = script if not shard or shard[1] == 1 else f"{script}-shard{shard[0]}"
+        self.base = {"script": script}
+        if shard and shard[1] > 1:
+            self.base["shard"] = f"{shard[0]}/{shard[1]}"
+        self.start = time.time()
+        self.lock = threading.Lock()
+        self.help: Dict[str, Tuple[str, str]] = {}  # 指标名 -> (类型, 说明)
+        self.gauges: Dict[Key, float] = {}
+        self.counters: Dict[Key, float] = {}
+        self.histograms: Dict[Key, Dict[str, Any]] = {}
+        self.created = self.start
+        self.last_success = 0.0  # 跨运行保存，失败的运行也照常输出
+        self.results = {"success": 0, "failure": 0, "skipped": 0}
+        self.state_path = METRICS_STATE_FILE or (
+            os.path.join(METRICS_TEXTFILE_DIR, f".{self.job}.state.json") if METRICS_TEXTFILE_DIR else "")
+        self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(METRICS_TEXTFILE_DIR or METRICS_PUSHGATEWAY or METRICS_FILE)
+
+    # ---------------- 记录 ----------------
+    def _key(self, name: str, labels: Dict[str, Any]) -> Key:
+        merged = dict(self.base, **{k: str(v) for k, v in labels.items()})
+        return name, tuple(sorted(merged.items()))
+
+    def gauge(self, name: str, value: Optional[float], help: str = "", **labels: Any):
+        """设置一个 gauge；value 为 None 时忽略（例如没有解析到数值）"""
+        if value is None:
+            return
+        with self.lock:
+            self.help.setdefault(name, ("gauge", help))
+            self.gauges[self._key(name, labels)] = float(value)
+
+    def inc(self, name: str, amount: float = 1, help: str = "", **labels: Any):
+        with self.lock:
+            self.help.setdefault(name, ("counter", help))
+            key = self._key(name, labels)
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, help: str = "", buckets=DURATION_BUCKETS, **labels: Any):
+        with self.lock:
+            self.help.setdefault(name, ("histogram", help))
+            key = self._key(name, labels)
+            h = self.histograms.get(key)
+            if h is None or len(h["buckets"]) != len(buckets):
+                h = self.histograms[key] = {"le": list(buckets), "buckets": [0] * len(buckets), "sum": 0.0, "count": 0}
+            for i, le in enumerate(h["le"]):
+                if value <= le:
+                    h["buckets"][i] += 1
+            h["sum"] += value
+            h["count"] += 1
+
+    def account(self, name: str, ok: bool, seconds: Optional[float] = None, reason: Optional[str] = None,
+                detail: str = "", days: Optional[float] = None, skipped: bool = False):
+        """记录一个账号的结果；reason 未给出时由 detail 归类，跳过的账号不计入耗时"""
+        result = "skipped" if skipped else ("success" if ok else "failure")
+        self.results[result] += 1
+        self.inc(f"{PREFIX}_account_results", help="各账号的处理结果",
+                 result=result, reason="" if ok or skipped else (reason or classify(detail)))
+        if seconds is not None and not skipped:
+            self.observe(f"{PREFIX}_account_duration_seconds", seconds, help="单个账号的处理耗时")
+        if days is not None:
+            self.gauge(f"{PREFIX}_days_remaining", days, help="剩余保活天数", account=account_label(name))
+
+    # ---------------- 累计值 ----------------
+    def _load(self):
+        if not self.state_path:
+            return
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.created = data.get("created", self.start)
+        self.last_success = data.get("last_success", 0.0)
+        for name, kind, help_text in data.get("help", []):
+            self.help[name] = (kind, help_text)
+        for name, labels, value in data.get("counters", []):
+            self.counters[(name, tuple(map(tuple, labels)))] = value
+        for name, labels, h in data.get("histograms", []):
+            self.histograms[(name, tuple(map(tuple, labels)))] = h
+
+    def _save(self):
+        if not self.state_path:
+            return
+        data = {
+            "created": self.created,
+            "last_success": self.last_success,
+            "help": [[name, kind, text] for name, (kind, text) in self.help.items() if kind != "gauge"],
+            "counters": [[name, labels, value] for (name, labels), value in self.counters.items()],
+            "histograms": [[name, labels, h] for (name, labels), h in self.histograms.items()],
+        }
+        tmp = f"{self.state_path}.tmp"
+        try:
+            directory = os.path.dirname(self.state_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.state_path)
+        except OSError as e:
+            print(f"⚠️ 保存指标累计值失败: {e}")
+
+    # ---------------- 输出 ----------------
+    def _finish(self):
+        now = time.time()
+        for result, count in self.results.items():
+            self.gauge(f"{PREFIX}_accounts", count, help="本次运行各结果的账号数", result=result)
+        self.gauge(f"{PREFIX}_last_run_timestamp_seconds", now, help="最近一次运行结束的时间")
+        self.gauge(f"{PREFIX}_run_duration_seconds", now - self.start, help="本次运行的总耗时")
+        if self.results["success"] or (self.results["skipped"] and not self.results["failure"]):
+            self.last_success = now
+        self.gauge(f"{PREFIX}_last_success_timestamp_seconds", self.last_success, help="最近一次有账号成功的时间")
+
+    def render(self, openmetrics: bool = True) -> str:
+        """openmetrics=False 时输出 Prometheus 文本格式 0.0.4（计数器的 TYPE 行带 _total，不输出 _created 与 # EOF）"""
+        lines: List[str] = []
+        with self.lock:
+            for name in sorted(self.help):
+                kind, help_text = self.help[name]
+                family = name if openmetrics or kind != "counter" else f"{name}_total"
+                lines.append(f"# HELP {family} {_escape(help_text)}")
+                lines.append(f"# TYPE {family} {kind}")
+                if kind == "gauge":
+                    for (n, labels), value in sorted(self.gauges.items()):
+                        if n == name:
+                            lines.append(f"{name}{_labels(dict(labels))} {_number(value)}")
+                elif kind == "counter":
+                    for (n, labels), value in sorted(self.counters.items()):
+                        if n == name:
+                            lines.append(f"{name}_total{_labels(dict(labels))} {_number(value)}")
+                            if openmetrics:
+                                lines.append(f"{name}_created{_labels(dict(labels))} {_number(self.created)}")
+                else:
+                    for (n, labels), h in sorted(self.histograms.items()):
+                        if n != name:
+                            continue
+                        labels = dict(labels)
+                        for le, count in zip(h["le"] + [float("inf")], h["buckets"] + [h["count"]]):
+                            bound = 'le="%s"' % _number(float(le))
+                            lines.append(f"{name}_bucket{_labels(labels, bound)} {count}")
+                        lines.append(f"{name}_count{_labels(labels)} {h['count']}")
+                        lines.append(f"{name}_sum{_labels(labels)} {_number(h['sum'])}")
+                        if openmetrics:
+                            lines.append(f"{name}_created{_labels(labels)} {_number(self.created)}")
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def _write_file(self, path: str, text: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def push(self, text: str) -> bool:
+        import requests
+        url = f"{METRICS_PUSHGATEWAY}/metrics/job/{quote(self.job, safe='')}/instance/{quote(METRICS_INSTANCE, safe='')}"
+        try:
+            r = requests.put(url, data=text.encode("utf-8"),
+                             headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}, timeout=10)
+        except requests.RequestException as e:
+            print(f"⚠️ 推送指标失败: {e}")
+            return False
+        if r.status_code >= 300:
+            print(f"⚠️ 推送指标失败: {r.status_code} {r.text[:200]}")
+            return False
+        return True
+
+    def write(self):
+        """输出到已配置的目标；没有配置任何目标时什么也不做。导出失败只打印提示，不影响脚本结果"""
+        if not self.enabled:
+            return
+        self._finish()
+        written = []
+        try:
+            if METRICS_TEXTFILE_DIR:
+                self._write_file(os.path.join(METRICS_TEXTFILE_DIR, f"{self.job}.prom"), self.render(openmetrics=False))
+                written.append(METRICS_TEXTFILE_DIR)
+            if METRICS_FILE:
+                self._write_file(METRICS_FILE, self.render(openmetrics=True))
+                written.append(METRICS_FILE)
+        except OSError as e:
+            print(f"⚠️ 写入指标文件失败: {e}")
+        if METRICS_PUSHGATEWAY and self.push(self.render(openmetrics=False)):
+            written.append(METRICS_PUSHGATEWAY)
+        self._save()
+        if written:
+            print(f"📈 指标已导出: {', '.join(written)}")
@@ -0,0 +1,267 @@
+"""
+Telegram 通知发送器（所有脚本共用）
+- 后台线程异步发送，调用方不会被网络请求阻塞
+- 复用 keep-alive 连接池
+- 短时间内的多条消息合并为一条发送
+- 按 UTF-16 长度在行边界拆分超长消息（Telegram 限制 4096 个 UTF-16 码元）
+- 遵守 429 的 retry_after，其它临时错误指数退避重试
+- 图片可以是文件路径或内存中的字节，多张图片用 sendMediaGroup 一次上传
+"""
+
+import os
+import json
+import time
+import atexit
+import random
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Sequence, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common import trace
+
+TG_API = os.getenv("TG_API_URL", "https://api.telegram.org").rstrip("/")  # 可指向本地回放服务
+MAX_MESSAGE_UNITS = 4096   # sendMessage 文本上限（UTF-16 码元）
+MAX_CAPTION_UNITS = 1024   # sendPhoto 说明文字上限
+MAX_MEDIA_GROUP = 10       # sendMediaGroup 每组最多图片数
+COALESCE_WINDOW = 0.5      # 合并窗口（秒）
+MAX_ATTEMPTS = 5           # 单条消息最大尝试次数
+BACKOFF_BASE = 1.0         # 退避基数（秒）
+BACKOFF_MAX = 30.0         # 单次退避上限（秒）
+
+
+Photo = Union[str, bytes]  # 文件路径或图片内容
+
+
+def utf16_len(text: str) -> int:
+    """Telegram 按 UTF-16 码元计算长度，BMP 之外的字符（如大部分 emoji）占 2 个"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _hard_split(line: str, limit: int) -> List[str]:
+    """单行超长时按码元硬切，不拆开代理对"""
+    parts, buf, units = [], [], 0
+    for ch in line:
+        n = 2 if ord(ch) > 0xFFFF else 1
+        if units + n > limit:
+            parts.append(''.join(buf))
+            buf, units = [], 0
+        buf.append(ch)
+        units += n
+    if buf:
+        parts.append(''.join(buf))
+    return parts
+
+
+def split_message(text: str, limit: int = MAX_MESSAGE_UNITS) -> List[str]:
+    """在行边界拆分消息，每段不超过 limit 个 UTF-16 码元"""
+    if utf16_len(text) <= limit:
+        return [text]
+
+    chunks, buf, units = [], [], 0
+    for line in text.split('\n'):
+        n = utf16_len(line)
+        pieces = _hard_split(line, limit) if n > limit else [line]
+        for piece in pieces:
+            n = utf16_len(piece)
+            extra = n + (1 if buf else 0)
+            if buf and units + extra > limit:
+                chunks.append('\n'.join(buf))
+                buf, units, extra = [], 0, n
+            buf.append(piece)
+            units += extra
+    if buf:
+        chunks.append('\n'.join(buf))
+    return chunks
+
+
+class TelegramNotifier:
+    """异步 Telegram 通知器，send()/photo() 只入队，由后台线程负责投递"""
+
+    def __init__(self, token: Optional[str] = None, chat_id: Optional[str] = None,
+                 parse_mode: Optional[str] = None, coalesce: float = COALESCE_WINDOW):
+        self.token = token if token is not None else os.getenv('TG_BOT_TOKEN')
+        self.chat_id = chat_id if chat_id is not None else os.getenv('TG_CHAT_ID')
+        self.parse_mode = parse_mode
+        self.coalesce = coalesce
+        self.ok = bool(self.token and self.chat_id)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        self.session.mount('https://', adapter)
+
+        self.queue: Deque[Dict] = deque()
+        self.cond = threading.Condition()
+        self.pending = 0
+        self.worker: Optional[threading.Thread] = None
+
+    # ---------------- 入队 ----------------
+    def send(self, text: str, parse_mode: Optional[str] = None, merge: bool = True):
+        """merge=False 的消息已由调用方切分好，不与前后消息合并"""
+        if not self.ok or not text:
+            return
+        self._put({'method': 'sendMessage', 'text': text, 'parse_mode': parse_mode or self.parse_mode, 'merge': merge})
+
+    def photo(self, photo: Photo, caption: str = ""):
+        if not self.ok or not photo or (isinstance(photo, str) and not os.path.exists(photo)):
+            return
+        self._put({'method': 'sendPhoto', 'photo': photo, 'caption': caption})
+
+    def album(self, photos: Sequence[Tuple[Photo, str]]):
+        """多张图片合并为一次 sendMediaGroup（每组最多 10 张），单张时退化为 sendPhoto"""
+        photos = [(p, c) for p, c in photos if p and not (isinstance(p, str) and not os.path.exists(p))]
+        if not self.ok or not photos:
+            return
+        if len(photos) == 1:
+            self.photo(*photos[0])
+            return
+        self._put({'method': 'sendMediaGroup', 'photos': photos})
+
+    def _put(self, item: Dict):
+        with self.cond:
+            self.queue.append(item)
+            self.pending += 1
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name='tg-notifier', daemon=True)
+                self.worker.start()
+            self.cond.notify_all()
+
+    def flush(self, timeout: float = 60) -> bool:
+        """等待队列中的消息发送完毕，返回是否全部处理完"""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while self.pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    # ---------------- 后台投递 ----------------
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    if not self.cond.wait(timeout=30):
+                        self.worker = None
+                        return
+                item = self.queue.popleft()
+
+            # 合并窗口：等待片刻，把同类的后续消息拼进同一条
+            taken = 1
+            if item['method'] == 'sendMessage' and item['merge'] and self.coalesce > 0:
+                time.sleep(self.coalesce)
+                with self.cond:
+                    while self.queue and self.queue[0]['method'] == 'sendMessage' and self.queue[0]['merge'] \
+                            and self.queue[0]['parse_mode'] == item['parse_mode']:
+                        item = dict(item, text=f"{item['text']}\n\n{self.queue.popleft()['text']}")
+                        taken += 1
+
+            try:
+                if item['method'] == 'sendMessage':
+                    for chunk in split_message(item['text']):
+                        self._deliver('sendMessage', {'text': chunk, 'parse_mode': item['parse_mode']})
+                elif item['method'] == 'sendPhoto':
+                    self._deliver_photo(item['photo'], item['caption'])
+                else:
+                    for i in range(0, len(item['photos']), MAX_MEDIA_GROUP):
+                        self._deliver_album(item['photos'][i:i + MAX_MEDIA_GROUP])
+            except Exception as e:
+                print(f"⚠️ Telegram 通知发送异常: {e}")
+            finally:
+                with self.cond:
+                    self.pending -= taken
+                    self.cond.notify_all()
+
+    @trace.traced("tg.deliver", method="method")
+    def _deliver(self, method: str, data: Dict, files: Optional[Dict] = None) -> bool:
+        payload = {'chat_id': self.chat_id}
+        payload.update({k: v for k, v in data.items() if v})
+        url = f"{TG_API}/bot{self.token}/{method}"
+
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                r = self.session.post(url, data=payload, files=files, timeout=30)
+            except requests.RequestException as e:
+                delay = self._backoff(attempt)
+                print(f"⚠️ Telegram 请求失败（第 {attempt} 次）: {e}，{delay:.1f} 秒后重试")
+                time.sleep(delay)
+                continue
+
+            if r.status_code == 200:
+                return True
+
+            try:
+                body = r.json()
+            except ValueError:
+                body = {}
+
+            if r.status_code == 429:
+                delay = float((body.get('parameters') or {}).get('retry_after', self._backoff(attempt)))
+                print(f"⚠️ Telegram 限流，{delay:.0f} 秒后重试")
+                time.sleep(delay)
+                continue
+            if r.status_code >= 500:
+                time.sleep(self._backoff(attempt))
+                continue
+            # 格式解析失败时去掉 parse_mode 以纯文本重发一次，保证报告能送达
+            if r.status_code == 400 and payload.get('parse_mode') and "parse" in body.get('description', '').lower():
+                print("⚠️ Telegram 格式解析失败，改为纯文本发送")
+                payload.pop('parse_mode')
+                continue
+
+            print(f"⚠️ Telegram 通知发送失败: {r.status_code} {r.text}")
+            return False
+
+        print("⚠️ Telegram 通知多次重试后仍失败，已放弃")
+        return False
+
+    @staticmethod
+    def _read(photo: Photo, name: str) -> Tuple[str, bytes]:
+        if isinstance(photo, bytes):
+            return name, photo
+        with open(photo, 'rb') as f:
+            return os.path.basename(photo), f.read()
+
+    def _deliver_photo(self, photo: Photo, caption: str) -> bool:
+        caption = split_message(caption, MAX_CAPTION_UNITS)[0] if caption else ""
+        return self._deliver('sendPhoto', {'caption': caption}, files={'photo': self._read(photo, 'photo.jpg')})
+
+    def _deliver_album(self, photos: Sequence[Tuple[Photo, str]]) -> bool:
+        if len(photos) == 1:
+            return self._deliver_photo(*photos[0])
+        media, files = [], {}
+        for i, (photo, caption) in enumerate(photos):
+            key = f"photo{i}"
+            files[key] = self._read(photo, f"{key}.jpg")
+            entry = {'type': 'photo', 'media': f"attach://{key}"}
+            if caption:
+                entry['caption'] = split_message(caption, MAX_CAPTION_UNITS)[0]
+            media.append(entry)
+        return self._deliver('sendMediaGroup', {'media': json.dumps(media, ensure_ascii=False)}, files=files)
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+
+_default: Optional[TelegramNotifier] = None
+
+
+def get_notifier() -> TelegramNotifier:
+    """进程内共用的通知器，读取 TG_BOT_TOKEN / TG_CHAT_ID，进程退出前自动等待发送完毕"""
+    global _default
+    if _default is None:
+        _default = TelegramNotifier()
+        atexit.register(_default.flush)
+    return _default
+
+
+def reset_notifier(timeout: float = 60):
+    """等待共用通知器发送完毕后丢弃它，下次 get_notifier() 重新读取 TG_BOT_TOKEN / TG_CHAT_ID（守护进程重新加载时使用）"""
+    global _default
+    if _default is not None:
+        _default.flush(timeout)
+        _default = None
@@ -0,0 +1,295 @@
+"""
+离线回放服务（所有脚本共用）
+在本地起一个 HTTP 服务，用 common/fixtures/ 中录制的响应代替各个外部站点，脚本通过环境变量指向它：
+    /koyeb/v1/account/profile           KOYEB_API_URL=http://127.0.0.1:端口/koyeb
+    /whm/login、/whm/clientarea.php      WHM_BASE_URL=http://127.0.0.1:端口/whm
+    /netlib/、/netlib/login              NETLIB_HOME=http://127.0.0.1:端口/netlib/（登录表单从首页解析）
+    /bot<token>/<method>                TG_API_URL=http://127.0.0.1:端口
+账号约定：密码或 PAT 以 bad 开头的账号登录失败；Koyeb 的 PAT 写成 tok-<邮箱>，服务据此返回该邮箱的资料。
+Telegram 机器人回复由 tg-checkin/fake_bot.py 模拟。
+
+延迟与故障注入（只作用于站点，不影响 /bot 通知接口）：
+    --latency 秒       每个请求的固定延迟
+    --jitter 秒        额外的随机延迟（0 到该值之间均匀分布）
+    --error-rate 比例  返回 503
+    --drop-rate 比例   不返回响应直接断开连接
+
+单独运行：
+    python common/replay.py --port 8787 --latency 0.05 --error-rate 0.1
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import string
+import secrets
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+Response = Tuple[int, Dict[str, str], bytes]
+
+
+def fixture(name: str, **values: Any) -> bytes:
+    with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as f:
+        return string.Template(f.read()).safe_substitute(values).encode("utf-8")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 注入断开或客户端超时放弃时对端会重置连接，属于预期情况
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class Session:
+    """同一个 Cookie（或 Koyeb 的同一个 PAT）上的请求，视为同一个账号的一次登录"""
+
+    __slots__ = ("account", "start", "end", "requests")
+
+    def __init__(self, now: float):
+        self.account = ""
+        self.start = now
+        self.end = now
+        self.requests = 0
+
+
+class ReplayServer:
+    """
+    用法：
+        with ReplayServer(latency=0.05, error_rate=0.1) as server:
+            env = server.env()        # 指向本服务的环境变量
+            ...                       # 运行脚本
+            print(server.latencies())  # 各账号从第一个请求开始到最后一个响应结束的耗时
+    """
+
+    def __init__(self, port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, drop_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.lock = threading.Lock()
+        self.sessions: Dict[str, Session] = {}
+        self.counters: Dict[str, int] = {"requests": 0, "errors": 0, "dropped": 0, "telegram": 0}
+        self.httpd = _Server(("127.0.0.1", port), self._handler())
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def env(self, netlib_http: bool = False) -> Dict[str, str]:
+        env = {
+            "KOYEB_API_URL": f"{self.url}/koyeb",
+            "WHM_BASE_URL": f"{self.url}/whm",
+            "NETLIB_HOME": f"{self.url}/netlib/",
+            "TG_API_URL": self.url,
+            "TG_BOT_TOKEN": "replay",
+            "TG_CHAT_ID": "1",
+        }
+        if not netlib_http:
+            env["NETLIB_HTTP_LOGIN"] = "off"
+        return env
+
+    def start(self) -> "ReplayServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "ReplayServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset(self):
+        with self.lock:
+            self.sessions.clear()
+            self.counters = dict.fromkeys(self.counters, 0)
+
+    def latencies(self) -> List[float]:
+        """各账号的耗时（秒），同一账号的多次会话（如重试）合并计算"""
+        spans: Dict[str, List[float]] = {}
+        with self.lock:
+            for key, session in self.sessions.items():
+                span = spans.setdefault(session.account or key, [session.start, session.end])
+                span[0], span[1] = min(span[0], session.start), max(span[1], session.end)
+        return [end - start for start, end in spans.values()]
+
+    # ---------------- 请求处理 ----------------
+    def _session(self, key: str) -> Session:
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                session = self.sessions[key] = Session(time.monotonic())
+            session.requests += 1
+            return session
+
+    def _finish(self, session: Session):
+        with self.lock:
+            session.end = time.monotonic()
+
+    def _inject(self) -> Optional[str]:
+        """按配置延迟，并决定本次请求是否返回 503 或直接断开"""
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+        roll = random.random()
+        if roll < self.drop_rate:
+            return "drop"
+        if roll < self.drop_rate + self.error_rate:
+            return "error"
+        return None
+
+    def koyeb_profile(self, headers, session: Session) -> Response:
+        token = (headers.get("Authorization") or "").replace("Bearer ", "", 1)
+        if not token or token.startswith("bad"):
+            return 401, {"Content-Type": "application/json"}, b'{"error": "invalid token", "code": "unauthorized"}'
+        email = token[4:] if token.startswith("tok-") else "unknown@example.com"
+        session.account = email
+        body = fixture("koyeb_profile.json", email=email, user_id=token[-8:])
+        return 200, {"Content-Type": "application/json"}, body
+
+    def whm_login(self, method: str, form: Dict[str, str], session: Session, sid: str) -> Response:
+        token = sid[:16]
+        if method == "GET":
+            return 200, {"Content-Type": "text/html; charset=utf-8"}, fixture("whm_login.html", token=token)
+        session.account = form.get("username", "")
+        if form.get("token") != token:
+            return 200, {"Content-Type": "text/html; charset=utf-8"}, b"Invalid CSRF token"
+        if form.get("password", "").startswith("bad"):
+            return 200, {"Content-Type": "text/html; charset=utf-8"}, fixture("whm_login_failed.html", token=token)
+        return 302, {"Location": "clientarea.php"}, b""
+
+    def netlib(self, method: str, path: str, form: Dict[str, str], session: Session) -> Response:
+        html = {"Content-Type": "text/html; charset=utf-8"}
+        if method == "GET":
+            return 200, html, fixture("netlib_home.html")
+        session.account = form.get("login", "")
+        if not session.account or form.get("password", "").startswith("bad"):
+            return 200, html, fixture("netlib_invalid.html")
+        return 200, html, fixture("netlib_domains.html", login=session.account)
+
+    def telegram(self, path: str) -> Response:
+        with self.lock:
+            self.counters["telegram"] += 1
+        method = path.rsplit("/", 1)[-1]
+        result: Any = [] if method in ("getUpdates", "sendMediaGroup") else True if "Webhook" in method else {"message_id": 1}
+        return 200, {"Content-Type": "application/json"}, json.dumps({"ok": True, "result": result}).encode()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _cookie(self) -> Tuple[str, bool]:
+                for part in (self.headers.get("Cookie") or "").split(";"):
+                    name, _, value = part.strip().partition("=")
+                    if name == "sid" and value:
+                        return value, False
+                return secrets.token_hex(16), True
+
+            def _reply(self, response: Response, set_sid: Optional[str] = None):
+                status, headers, body = response
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if set_sid:
+                    self.send_header("Set-Cookie", f"sid={set_sid}; Path=/; HttpOnly")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self, method: str):
+                path = urlsplit(self.path).path
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                form = {k: v[0] for k, v in parse_qs(raw.decode("utf-8", "replace")).items()}
+
+                if path.startswith("/bot"):
+                    return self._reply(server.telegram(path))
+
+                with server.lock:
+                    server.counters["requests"] += 1
+                if path.startswith("/koyeb/"):
+                    key, new_sid = self.headers.get("Authorization") or "anonymous", None
+                else:
+                    key, created = self._cookie()
+                    new_sid = key if created else None
+                session = server._session(key)
+                try:
+                    fault = server._inject()
+                    if fault == "drop":
+                        with server.lock:
+                            server.counters["dropped"] += 1
+                        self.close_connection = True
+                        return
+                    if fault == "error":
+                        with server.lock:
+                            server.counters["errors"] += 1
+                        return self._reply((503, {"Retry-After": "0"}, b"Service Unavailable"), new_sid)
+
+                    if path == "/koyeb/v1/account/profile":
+                        response = server.koyeb_profile(self.headers, session)
+                    elif path == "/whm/login":
+                        response = server.whm_login(method, form, session, key)
+                    elif path == "/whm/clientarea.php":
+                        response = 200, {"Content-Type": "text/html; charset=utf-8"}, fixture("whm_clientarea.html", email=session.account)
+                    elif path.startswith("/netlib/"):
+                        response = server.netlib(method, path, form, session)
+                    else:
+                        response = 404, {"Content-Type": "text/plain"}, b"not found"
+                    self._reply(response, new_sid)
+                finally:
+                    server._finish(session)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线回放服务")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = ReplayServer(args.port, args.latency, args.jitter, args.error_rate, args.drop_rate)
+    print(f"🎬 回放服务已启动: {server.url}")
+    for name, value in server.env(netlib_http=True).items():
+        print(f"    {name}={value}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"📊 {server.counters}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+结果记录与报告渲染（所有脚本共用）
+- Result：每个账号一条只含固定字段的记录（__slots__），可与 dict / JSON 互转，供分片结果文件等下游使用
+- Renderer：按 Telegram 的 parse_mode（Markdown / HTML / 纯文本）转义动态内容，
+  逐条消费结果、按账号边界切成不超过 4096 个 UTF-16 码元的消息，不会先拼出整份报告
+"""
+
+import html
+import json
+import string
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from common.notify import MAX_MESSAGE_UNITS, get_notifier, split_message, utf16_len
+
+# Telegram 旧版 Markdown 只有这四个特殊字符
+_MARKDOWN_SPECIAL = {ord(c): "\\" + c for c in "_*`["}
+
+
+class Result:
+    """单个账号的执行结果"""
+
+    __slots__ = ("name", "ok", "status", "detail", "data")
+
+    def __init__(self, name: str, ok: bool, status: str = "", detail: str = "",
+                 data: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.ok = ok
+        self.status = status    # 简短状态，如 成功 / 失败 / 跳过
+        self.detail = detail    # 说明或失败原因
+        self.data = data or {}  # 解析到的其它数据，如剩余天数
+
+    @property
+    def skipped(self) -> bool:
+        return self.status == "跳过"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "ok": self.ok, "status": self.status, "detail": self.detail, "data": self.data}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Result":
+        return cls(d.get("name", ""), bool(d.get("ok")), d.get("status", ""), d.get("detail", ""), d.get("data"))
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+    def __repr__(self) -> str:
+        return f"Result({self.name!r}, ok={self.ok}, status={self.status!r})"
+
+
+class Raw(str):
+    """已经渲染好的标记片段，fmt 不再转义"""
+
+
+class _EscapingFormatter(string.Formatter):
+    def __init__(self, escape):
+        self.escape = escape
+
+    def format_field(self, value, format_spec):
+        if isinstance(value, Raw) and not format_spec:
+            return value
+        return self.escape(super().format_field(value, format_spec))
+
+
+class Renderer:
+    """
+    用法：
+        r = Renderer("Markdown")
+        head = r.fmt("🤖 *报告*\\n⏰ 日期: {}", now)              # 模板原样保留，只转义参数
+        lines = (r.fmt("账户: {}\\n状态: {}", r.code(x.name), x.detail) for x in results)
+        r.send(head, lines)
+    """
+
+    def __init__(self, parse_mode: Optional[str] = None, limit: int = MAX_MESSAGE_UNITS):
+        self.parse_mode = parse_mode
+        self.limit = limit
+        mode = (parse_mode or "").lower()
+        if mode == "html":
+            self.esc = lambda text: html.escape(str(text), quote=False)
+        elif mode == "markdown":
+            self.esc = lambda text: str(text).translate(_MARKDOWN_SPECIAL)
+        else:
+            self.esc = str
+        self.formatter = _EscapingFormatter(self.esc)
+
+    def fmt(self, template: str, *args, **kwargs) -> str:
+        """模板中的标记原样保留，填入的参数按 parse_mode 转义；已经渲染好的片段用 Raw 包装可跳过转义"""
+        return self.formatter.vformat(template, args, kwargs)
+
+    def code(self, value) -> Raw:
+        mode = (self.parse_mode or "").lower()
+        if mode == "html":
+            return Raw(f"<code>{html.escape(str(value), quote=False)}</code>")
+        if mode == "markdown":
+            # 代码块内只需处理反引号本身
+            return Raw(f"`{str(value).replace('`', chr(39))}`")
+        return Raw(str(value))
+
+    def chunks(self, head: str, lines: Iterable[str], sep: str = "\n") -> Iterator[str]:
+        """逐条拼接，按条目边界切分为不超过 limit 的消息；单条过长时再按行拆分"""
+        buf = [head] if head else []
+        units = utf16_len(head)
+        for line in lines:
+            n = utf16_len(line) + utf16_len(sep)
+            if units + n > self.limit and buf:
+                yield sep.join(buf)
+                buf, units = [], 0
+            if n > self.limit:
+                yield from split_message(line, self.limit)
+                continue
+            buf.append(line)
+            units += n
+        if buf:
+            yield sep.join(buf)
+
+    def send(self, head: str, lines: Iterable[str], sep: str = "\n",
+             echo: Optional[Callable[[str], None]] = None) -> int:
+        """渲染并逐条交给共用通知器发送（echo 用于同时输出到日志），返回消息条数"""
+        notifier = get_notifier()
+        count = 0
+        for chunk in self.chunks(head, lines, sep):
+            if echo:
+                echo(chunk)
+            notifier.send(chunk, parse_mode=self.parse_mode, merge=False)
+            count += 1
+        return count
+
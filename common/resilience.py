@@ -0,0 +1,224 @@
+"""
+重试与熔断（所有脚本共用）
+- 把异常或 HTTP 状态码分为暂时性（超时、连接错误、429、5xx）与永久性（认证失败、其它 4xx、页面内容不符等）
+- 暂时性错误按带抖动的指数退避重试，遵守 Retry-After；永久性错误立即交还调用方
+- 按主机熔断：同一主机连续的暂时性失败达到阈值后，剩余账号直接跳过，不再消耗限速额度；
+  冷却时间过后放行一个试探请求，成功即恢复
+
+环境变量：
+    RETRY_ATTEMPTS     单次操作的最多尝试次数，默认 3，1 表示不重试
+    RETRY_BASE         退避基数（秒），默认 1
+    RETRY_MAX_DELAY    单次退避上限（秒），默认 20
+    BREAKER_THRESHOLD  同一主机连续暂时性失败达到该次数后熔断，默认 5，0 表示不熔断
+    BREAKER_COOLDOWN   熔断后经过多少秒放行一次试探请求，默认 300
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from common import trace
+
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "3"))
+RETRY_BASE = float(os.getenv("RETRY_BASE", "1"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "20"))
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "300"))
+
+# 408 请求超时、425 过早、429 限流，以及所有 5xx
+TRANSIENT_STATUS = {408, 425, 429}
+
+
+class TransientError(Exception):
+    """调用方主动标记的暂时性错误，例如服务返回 503"""
+
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(Exception):
+    """主机已熔断，本次请求未发出"""
+
+    def __init__(self, host: str):
+        super().__init__(f"{host} 连续失败已熔断，服务不可用，已跳过")
+        self.host = host
+
+
+def host_of(url: str) -> str:
+    return (urlsplit(url).hostname or url).lower()
+
+
+def is_transient_status(status: int) -> bool:
+    return status in TRANSIENT_STATUS or status >= 500
+
+
+def parse_retry_after(value: Any) -> Optional[float]:
+    """只支持秒数形式的 Retry-After，其它形式交给退避策略"""
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def raise_for_transient(status: int, retry_after: Any = None):
+    """状态码属于暂时性错误时抛出 TransientError，其它状态码交给调用方自行判断"""
+    if is_transient_status(status):
+        raise TransientError(f"HTTP {status}", status, parse_retry_after(retry_after))
+
+
+def is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, (TransientError, TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    if isinstance(exc, (requests.Timeout, requests.ConnectionError)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return is_transient_status(exc.response.status_code)
+    # aiohttp 与 Playwright 按类名判断，避免只用 requests 的脚本也要安装它们
+    module = type(exc).__module__
+    if module.startswith("aiohttp"):
+        status = getattr(exc, "status", None)
+        if isinstance(status, int):
+            return is_transient_status(status)
+        # ClientConnectorError / ClientOSError 是 OSError 的子类；连接中途断开是 ServerDisconnectedError
+        return isinstance(exc, OSError) or type(exc).__name__ in ("ServerDisconnectedError", "ClientPayloadError")
+    if module.startswith("playwright"):
+        # 导航超时与 net::ERR_*（连接被拒、DNS 失败等）视为暂时性，元素找不到等页面问题不重试
+        return type(exc).__name__ == "TimeoutError" or "net::ERR_" in str(exc)
+    return False
+
+
+def backoff(attempt: int, base: float = RETRY_BASE, cap: float = RETRY_MAX_DELAY) -> float:
+    """第 attempt 次（从 1 开始）失败后的等待秒数，在上限的一半到全部之间随机，避免多个账号同时重试"""
+    return min(cap, base * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+
+class CircuitBreaker:
+    """
+    按主机统计连续的暂时性失败（线程安全，同一个实例可在线程池与协程中共用）。
+    永久性错误说明服务本身可达，与成功一样会清零计数
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.failures: Dict[str, int] = {}
+        self.opened: Dict[str, float] = {}   # 主机 -> 熔断（或最近一次放行试探）的时间
+        self.short_circuited: Dict[str, int] = {}
+
+    def is_open(self, host: str) -> bool:
+        """只查询不占用试探名额"""
+        with self.lock:
+            opened = self.opened.get(host)
+            return opened is not None and time.monotonic() - opened < self.cooldown
+
+    def allow(self, host: str) -> bool:
+        """请求前调用：未熔断时放行；熔断且已冷却时放行一个试探请求"""
+        if self.threshold <= 0:
+            return True
+        with self.lock:
+            opened = self.opened.get(host)
+            if opened is None:
+                return True
+            now = time.monotonic()
+            if now - opened >= self.cooldown:
+                self.opened[host] = now  # 试探期间其它请求继续被拦下
+                return True
+            self.short_circuited[host] = self.short_circuited.get(host, 0) + 1
+            return False
+
+    def success(self, host: str):
+        with self.lock:
+            self.failures.pop(host, None)
+            self.opened.pop(host, None)
+
+    def failure(self, host: str) -> bool:
+        """记录一次暂时性失败，返回本次是否触发熔断"""
+        if self.threshold <= 0:
+            return False
+        with self.lock:
+            count = self.failures[host] = self.failures.get(host, 0) + 1
+            if count >= self.threshold:
+                first = host not in self.opened
+                self.opened[host] = time.monotonic()
+                return first
+            return False
+
+    def summary(self) -> str:
+        with self.lock:
+            if not self.short_circuited:
+                return ""
+            return "，".join(f"{host} 熔断后跳过 {n} 次请求" for host, n in self.short_circuited.items())
+
+
+class Retry:
+    """
+    用法：
+        retry = Retry(breaker, log=logging.warning)
+        data = retry.call(host, fetch, pat)                  # 同步
+        data = await retry.call_async(host, fetch_async, pat)  # 异步，func 返回 awaitable
+    暂时性错误在用尽次数后原样抛出；主机熔断时抛出 CircuitOpenError
+    """
+
+    def __init__(self, breaker: Optional[CircuitBreaker] = None, attempts: int = RETRY_ATTEMPTS,
+                 log: Callable[[str], None] = print):
+        self.breaker = breaker
+        self.attempts = max(attempts, 1)
+        self.log = log
+
+    def _before(self, host: str):
+        if self.breaker and not self.breaker.allow(host):
+            raise CircuitOpenError(host)
+
+    def _after_error(self, host: str, exc: Exception, attempt: int) -> float:
+        """返回重试前需要等待的秒数；不应重试时重新抛出异常"""
+        if not is_transient(exc):
+            if self.breaker:
+                self.breaker.success(host)
+            raise exc
+        if self.breaker and self.breaker.failure(host):
+            self.log(f"⛔ {host} 连续失败 {self.breaker.threshold} 次，已熔断，{self.breaker.cooldown:.0f} 秒内的请求将直接跳过")
+        if attempt >= self.attempts or (self.breaker and self.breaker.is_open(host)):
+            raise exc
+        delay = backoff(attempt)
+        retry_after = getattr(exc, "retry_after", None)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, RETRY_MAX_DELAY))
+        self.log(f"🔁 {host} 暂时性错误（{exc}），{delay:.1f} 秒后第 {attempt + 1}/{self.attempts} 次尝试")
+        return delay
+
+    def call(self, host: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        for attempt in range(1, self.attempts + 1):
+            self._before(host)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                delay = self._after_error(host, e, attempt)
+                with trace.span("retry.backoff", host=host, attempt=attempt):
+                    time.sleep(delay)
+                continue
+            if self.breaker:
+                self.breaker.success(host)
+            return result
+
+    async def call_async(self, host: str, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        for attempt in range(1, self.attempts + 1):
+            self._before(host)
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                delay = self._after_error(host, e, attempt)
+                async with trace.span("retry.backoff", host=host, attempt=attempt):
+                    await asyncio.sleep(delay)
+                continue
+            if self.breaker:
+                self.breaker.success(host)
+            return result
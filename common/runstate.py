@@ -0,0 +1,95 @@
+"""
+运行状态记录（所有脚本共用）
+- 每个账号记录最近一次运行的结果、状态文字与解析到的数据，以及最近一次成功的时间
+- 保存为一个 JSON 文件，由 workflow 的 actions/cache 在两次运行之间保留
+- 账号标识只保存哈希，文件中不出现邮箱/用户名
+- 设置 RUN_FORCE=1 时忽略记录，所有账号照常处理
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Optional
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+RUN_FORCE = os.getenv("RUN_FORCE", "0").strip().lower() in ("1", "true", "yes")
+
+
+def _key(account: str) -> str:
+    return hashlib.sha256(account.encode("utf-8")).hexdigest()[:16]
+
+
+class RunState:
+    """
+    用法：
+        state = RunState(os.path.join(os.path.dirname(__file__), "run_state.json"))
+        if state.fresh(email, 3 * 24 * 3600):
+            ...  # 保活窗口仍然充足，本次跳过
+        state.record(email, ok, "登录成功", {"days": 45})
+        state.save()
+    """
+
+    def __init__(self, path: str):
+        self.path = os.getenv("RUN_STATE_FILE") or path
+        self.lock = threading.Lock()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries: Dict[str, Dict[str, Any]] = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, account: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(_key(account))
+
+    def age(self, account: str) -> Optional[float]:
+        """距最近一次成功过去的秒数，从未成功返回 None"""
+        entry = self.get(account)
+        if not entry or not entry.get("last_success"):
+            return None
+        return time.time() - entry["last_success"]
+
+    def fresh(self, account: str, window: float) -> bool:
+        """最近一次成功在 window 秒以内"""
+        if RUN_FORCE or window <= 0:
+            return False
+        age = self.age(account)
+        return age is not None and age < window
+
+    def done_today(self, account: str) -> bool:
+        """今天（北京时间）已经成功过"""
+        if RUN_FORCE:
+            return False
+        entry = self.get(account)
+        if not entry or not entry.get("last_success"):
+            return False
+        last = datetime.fromtimestamp(entry["last_success"], BEIJING_TZ).date()
+        return last == datetime.now(BEIJING_TZ).date()
+
+    def record(self, account: str, ok: bool, status: str = "", data: Optional[Dict[str, Any]] = None):
+        now = int(time.time())
+        with self.lock:
+            entry = self.entries.setdefault(_key(account), {})
+            entry.update({"last_run": now, "ok": ok, "status": status, "data": data or {}})
+            if ok:
+                entry["last_success"] = now
+
+    def save(self):
+        tmp = f"{self.path}.tmp"
+        try:
+            with self.lock, open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"⚠️ 保存运行状态失败: {e}")
+
+
+def describe_age(seconds: float) -> str:
+    """把秒数转成便于阅读的“x 天/小时/分钟前”"""
+    if seconds >= 86400:
+        return f"{seconds / 86400:.1f} 天前"
+    if seconds >= 3600:
+        return f"{seconds / 3600:.1f} 小时前"
+    return f"{max(seconds, 0) / 60:.0f} 分钟前"
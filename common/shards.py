@@ -0,0 +1,162 @@
+"""
+分片结果文件与汇总（所有账号类脚本共用）
+矩阵任务中每个分片用 `--shard i/N --result-file 路径` 运行脚本：脚本只把各账号的结果写入 JSON 文件，不发送通知；
+最后由汇总任务合并所有分片的结果，调用脚本自己的 send_report(entries) 发出与单任务运行时相同的一条报告：
+    python common/shards.py koyeb-alive/koyeb-alive.py results/
+
+结果文件格式：
+    {"script": "koyeb-alive", "shard": [1, 3], "entries": [Result.to_dict(), ...]}
+entries 的内容由各脚本决定，通常是 common.report.Result 转成的 dict
+
+分片任务拿不到 TG 密钥，自己无法通知。矩阵任务改用下面的方式运行脚本：
+    python common/shards.py run koyeb-alive/koyeb-alive.py --shard 1/3 --result-file results/koyeb-1.json
+脚本在写出结果文件之前出错（导入失败、配置错误、异常或以非零状态码退出）时，补写一条带错误信息的失败记录，
+汇总任务据此在报告中说明该分片失败的原因，而不是只提示缺少分片
+"""
+
+import os
+import sys
+import json
+import glob
+import runpy
+import traceback
+import importlib.util
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+Entry = Dict[str, Any]
+
+
+def result_file(argv: Optional[Sequence[str]] = None) -> Optional[str]:
+    """从命令行 --result-file 路径 或环境变量 RESULT_FILE 读取结果文件路径，未设置返回 None"""
+    argv = sys.argv[1:] if argv is None else argv
+    path = os.getenv("RESULT_FILE", "")
+    for i, arg in enumerate(argv):
+        if arg == "--result-file" and i + 1 < len(argv):
+            path = argv[i + 1]
+        elif arg.startswith("--result-file="):
+            path = arg.split("=", 1)[1]
+    return path.strip() or None
+
+
+def write_result(path: str, script: str, shard: Optional[Tuple[int, int]], entries: List[Entry]):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"script": script, "shard": list(shard or (1, 1)), "entries": entries}, f, ensure_ascii=False)
+    print(f"📝 已写入分片结果: {path}（{len(entries)} 个账号）")
+
+
+def describe_failure(error: BaseException) -> str:
+    """把导致分片失败的异常转成一行说明；sys.exit("说明") 时直接使用该说明"""
+    if isinstance(error, SystemExit):
+        return str(error.code) if isinstance(error.code, str) else f"脚本以状态码 {error.code} 退出，详见该分片的运行日志"
+    return f"{type(error).__name__}: {error}"
+
+
+@contextmanager
+def failure_result(script: str, shard: Optional[Tuple[int, int]], path: Optional[str]) -> Iterator[None]:
+    """
+    with 块内出错且尚未写出结果文件时，写入一条失败记录后继续抛出；path 为空（非分片运行）时不做任何处理。
+    正常结束或以状态码 0 退出时不写
+    """
+    try:
+        yield
+    except BaseException as e:
+        if path and not os.path.exists(path) and not (isinstance(e, SystemExit) and not e.code):
+            from common.report import Result
+            index, count = shard or (1, 1)
+            write_result(path, script, shard, [Result(f"分片 {index}/{count}", False, "失败", describe_failure(e)).to_dict()])
+        raise
+
+
+def run_script(path: str, argv: Sequence[str]):
+    """以 __main__ 方式运行脚本（参数与直接运行时相同），出错时按 failure_result 补写失败记录"""
+    from common.accounts import parse_shard
+
+    argv = list(argv)
+    script = os.path.basename(os.path.dirname(os.path.abspath(path)))  # 脚本所在目录名，如 koyeb-alive
+    output = result_file(argv)
+    try:
+        shard = parse_shard(argv)
+    except Exception:
+        shard = None
+    sys.argv = [path] + argv
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    with failure_result(script, shard, output):
+        runpy.run_path(path, run_name="__main__")
+
+
+def load_results(paths: Sequence[str]) -> Tuple[List[Entry], List[str]]:
+    """
+    读取结果文件（参数可以是文件或目录），按分片序号合并各账号结果。
+    返回 (合并后的结果, 缺失分片的描述)
+    """
+    files: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, "**", "*.json"), recursive=True))
+        else:
+            files.append(path)
+
+    if not files:
+        raise FileNotFoundError(f"未找到分片结果文件: {', '.join(paths)}")
+
+    shards: Dict[int, List[Entry]] = {}
+    total = 0
+    for file in sorted(files):
+        with open(file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index, count = data.get("shard") or (1, 1)
+        total = max(total, count)
+        shards.setdefault(index, []).extend(data.get("entries", []))
+
+    missing = [f"{i}/{total}" for i in range(1, total + 1) if i not in shards]
+    entries = [entry for index in sorted(shards) for entry in shards[index]]
+    return entries, missing
+
+
+def load_script(path: str):
+    """按文件路径加载脚本模块（脚本名可以带连字符），不会执行其 __main__ 部分"""
+    spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(path))[0].replace("-", "_"), path)
+    module = importlib.util.module_from_spec(spec)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("用法: python common/shards.py 脚本路径 结果文件或目录...\n"
+              "      python common/shards.py run 脚本路径 --shard i/N --result-file 路径")
+        sys.exit(1)
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 仓库根目录，用于导入 common
+    if sys.argv[1] == "run":
+        try:
+            run_script(sys.argv[2], sys.argv[3:])
+        except Exception:
+            traceback.print_exc()
+            sys.exit(1)
+        return
+
+    from common.notify import get_notifier
+
+    module = load_script(sys.argv[1])
+    entries, missing = load_results(sys.argv[2:])
+    print(f"📦 共合并 {len(entries)} 个账号的结果")
+
+    ok = module.send_report(entries)
+    if missing:
+        warning = f"⚠️ {os.path.basename(sys.argv[1])} 缺少分片结果: {', '.join(missing)}，对应账号未包含在报告中"
+        print(warning)
+        get_notifier().send(warning)
+    get_notifier().flush()
+
+    if not ok or missing:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+"""
+阶段计时（所有脚本共用）
+默认关闭。关闭时 span() 返回同一个空对象，traced() 直接返回原函数，几乎没有额外开销。
+以下任意一个环境变量设置后开启：
+    TRACE=1              运行结束时打印各阶段耗时汇总表
+    TRACE_FILE=路径      写出 JSON lines，每个结束的阶段一行（边运行边写，任务被中断也能保留已完成的部分）
+    TRACE_CHROME=路径    运行结束时写出 Chrome trace-event 文件，可在 chrome://tracing 或 https://ui.perfetto.dev 打开
+
+开启后还会自动记录底层网络阶段：
+    net.dns      域名解析（socket.getaddrinfo，包括 aiohttp、Telethon 在线程池中的解析）
+    net.connect  requests/urllib3 建立 TCP 连接（含解析）
+    net.tls      requests/urllib3 的 TLS 握手
+    http.请求方法 requests 的每个请求，属性含主机与状态码
+aiohttp 的请求与建连需要把 aiohttp_configs() 传给 ClientSession(trace_configs=...)。
+
+用法：
+    from common import trace
+    with trace.span("whm.csrf", account=email) as sp:
+        ...
+        sp.set(status=r.status_code)
+    async with trace.span("netlib.goto"):   # 协程中同样可用
+        ...
+    @trace.traced("koyeb.verify", account="email")   # 整个函数作为一个阶段，参数 email 记为属性
+    def verify(email, pat): ...
+
+名为 account 的属性只保存哈希，轨迹文件中不出现邮箱/用户名。
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import asyncio
+import hashlib
+import itertools
+import threading
+import contextvars
+import functools
+import inspect
+from typing import Any, Callable, Dict, List, Optional
+
+TRACE_SUMMARY = os.getenv("TRACE", "0").strip().lower() in ("1", "true", "yes")
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_CHROME = os.getenv("TRACE_CHROME", "")
+
+_current: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("trace_span", default=None)
+
+
+def _account_key(value: Any) -> str:
+    return hashlib.sha256(str(value).encode("utf-8")).hexdigest()[:12]
+
+
+class _NoopSpan:
+    """关闭时共用的空对象"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NOOP = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "attrs", "id", "parent", "start", "token")
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.id = 0
+        self.parent: Optional[int] = None
+        self.start = 0.0
+        self.token = None
+
+    def set(self, **attrs):
+        """补充属性，如状态码、结果"""
+        self.attrs.update(attrs)
+
+    def begin(self) -> "Span":
+        self.id = next(self.tracer.ids)
+        self.parent = _current.get()
+        self.token = _current.set(self.id)
+        self.start = time.perf_counter()
+        return self
+
+    def end(self, error: Optional[BaseException] = None):
+        end = time.perf_counter()
+        try:
+            _current.reset(self.token)
+        except ValueError:  # 在另一个上下文中结束（如回调中），不影响记录
+            pass
+        if error is not None:
+            self.attrs["error"] = type(error).__name__
+        self.tracer.record(self, end)
+
+    def __enter__(self):
+        return self.begin()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(exc)
+        return False
+
+    async def __aenter__(self):
+        return self.begin()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.end(exc)
+        return False
+
+
+class Tracer:
+    def __init__(self, summary: bool = False, path: str = "", chrome: str = ""):
+        self.summary = summary
+        self.chrome = chrome
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.t0 = time.perf_counter()
+        self.epoch = time.time()
+        self.records: List[Dict[str, Any]] = []
+        self.lanes: Dict[str, int] = {}
+        self.file = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.file = open(path, "a", encoding="utf-8")
+
+    def _lane(self) -> str:
+        """Chrome trace 中的一行：线程名，协程中再加上任务名"""
+        lane = threading.current_thread().name
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        return f"{lane}/{task.get_name()}" if task else lane
+
+    def record(self, span: Span, end: float):
+        attrs = span.attrs
+        if "account" in attrs:
+            attrs["account"] = _account_key(attrs["account"])
+        rec = {
+            "id": span.id,
+            "parent": span.parent,
+            "name": span.name,
+            "start": round(self.epoch + span.start - self.t0, 6),
+            "dur": round(end - span.start, 6),
+            "lane": self._lane(),
+            "attrs": attrs,
+        }
+        with self.lock:
+            self.records.append(rec)
+            if self.file:
+                self.file.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+                self.file.flush()
+
+    # ---------------- 输出 ----------------
+    def write_chrome(self, path: str):
+        with self.lock:
+            records = list(self.records)
+        events: List[Dict[str, Any]] = []
+        pid = os.getpid()
+        for rec in records:
+            tid = self.lanes.setdefault(rec["lane"], len(self.lanes) + 1)
+            events.append({
+                "name": rec["name"], "cat": rec["name"].split(".", 1)[0], "ph": "X",
+                "ts": round((rec["start"] - self.epoch) * 1e6, 1), "dur": round(rec["dur"] * 1e6, 1),
+                "pid": pid, "tid": tid, "args": dict(rec["attrs"], id=rec["id"], parent=rec["parent"]),
+            })
+        events.extend({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": lane}}
+                      for lane, tid in self.lanes.items())
+        events.append({"name": "process_name", "ph": "M", "pid": pid, "tid": 0,
+                       "args": {"name": os.path.basename(sys.argv[0]) or "python"}})
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False, default=str)
+        print(f"📝 已写入 Chrome trace: {path}（{len(records)} 个阶段）")
+
+    def summary_table(self) -> str:
+        """按阶段名汇总：次数、合计、平均、p50、p90、最大（毫秒），按合计耗时降序"""
+        groups: Dict[str, List[float]] = {}
+        with self.lock:
+            for rec in self.records:
+                groups.setdefault(rec["name"], []).append(rec["dur"])
+        if not groups:
+            return "（没有记录到任何阶段）"
+
+        def pct(values: List[float], q: float) -> float:
+            return values[min(len(values) - 1, int(q * len(values)))]
+
+        def pad(text: str, width: int) -> str:
+            # 中文按两列宽计算，保证表头与数值对齐
+            return " " * (width - len(text) - sum(1 for ch in text if ord(ch) > 0x2E80)) + text
+
+        width = max(8, max(len(name) for name in groups) + 2)
+        lines = ["阶段" + " " * (width - 4) + "".join(pad(title, w) for title, w in (
+            ("次数", 6), ("合计ms", 11), ("平均ms", 10), ("p50", 10), ("p90", 10), ("最大", 10)))]
+        for name, durs in sorted(groups.items(), key=lambda kv: -sum(kv[1])):
+            durs.sort()
+            total = sum(durs)
+            lines.append(f"{name:<{width}}{len(durs):>6}{total * 1e3:>11.1f}{total / len(durs) * 1e3:>10.1f}"
+                         f"{pct(durs, 0.5) * 1e3:>10.1f}{pct(durs, 0.9) * 1e3:>10.1f}{durs[-1] * 1e3:>10.1f}")
+        return "\n".join(lines)
+
+    def close(self):
+        if self.chrome:
+            try:
+                self.write_chrome(self.chrome)
+            except OSError as e:
+                print(f"⚠️ 写入 Chrome trace 失败: {e}")
+        if self.summary:
+            print(f"\n⏱️ 阶段耗时汇总\n{self.summary_table()}")
+        if self.file:
+            with self.lock:
+                self.file.close()
+                self.file = None
+
+
+_tracer: Optional[Tracer] = None
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def span(name: str, **attrs: Any):
+    """计时一个阶段，with / async with 均可；关闭时返回空对象"""
+    if _tracer is None:
+        return NOOP
+    return Span(_tracer, name, attrs)
+
+
+def traced(name: Optional[str] = None, **params: str) -> Callable[[Callable], Callable]:
+    """
+    把整个函数（或协程函数）作为一个阶段计时，关闭时不包装。
+    params 把参数值记为属性，如 traced("whm.login", account="email") 记录参数 email
+    """
+    def decorate(func: Callable) -> Callable:
+        if _tracer is None:
+            return func
+        label = name or func.__qualname__
+        signature = inspect.signature(func)
+
+        def attrs(args, kwargs) -> Dict[str, Any]:
+            if not params:
+                return {}
+            bound = signature.bind_partial(*args, **kwargs).arguments
+            return {attr: bound.get(param) for attr, param in params.items()}
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(label, **attrs(args, kwargs)):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(label, **attrs(args, kwargs)):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def aiohttp_configs() -> list:
+    """传给 aiohttp.ClientSession(trace_configs=...)，记录每个请求与新建连接；关闭时返回空列表"""
+    if _tracer is None:
+        return []
+    import aiohttp
+
+    async def request_start(session, ctx, params):
+        ctx.trace_span = span(f"http.{params.method}", host=params.url.host).begin()
+
+    async def request_end(session, ctx, params):
+        ctx.trace_span.set(status=params.response.status)
+        ctx.trace_span.end()
+
+    async def request_exception(session, ctx, params):
+        ctx.trace_span.end(params.exception)
+
+    async def connect_start(session, ctx, params):
+        ctx.connect_span = span("net.connect").begin()
+
+    async def connect_end(session, ctx, params):
+        ctx.connect_span.end()
+
+    config = aiohttp.TraceConfig()
+    config.on_request_start.append(request_start)
+    config.on_request_end.append(request_end)
+    config.on_request_exception.append(request_exception)
+    config.on_connection_create_start.append(connect_start)
+    config.on_connection_create_end.append(connect_end)
+    return [config]
+
+
+def _wrap(owner: Any, attr: str, label: Callable[..., str], attrs: Callable[..., Dict[str, Any]] = lambda *a, **k: {}):
+    original = getattr(owner, attr, None)
+    if original is None or getattr(original, "_traced", False):
+        return
+
+    @functools.wraps(original)
+    def wrapper(*args, **kwargs):
+        with span(label(*args, **kwargs), **attrs(*args, **kwargs)):
+            return original(*args, **kwargs)
+
+    wrapper._traced = True
+    setattr(owner, attr, wrapper)
+
+
+def _instrument_network():
+    """开启时给解析、建连、TLS 与 requests 请求加上计时"""
+    import socket
+    _wrap(socket, "getaddrinfo", lambda *a, **k: "net.dns", lambda host, *a, **k: {"host": host})
+    try:
+        import urllib3.connection
+        import urllib3.util.connection
+        import requests
+    except ImportError:
+        return
+    _wrap(urllib3.util.connection, "create_connection", lambda *a, **k: "net.connect",
+          lambda address, *a, **k: {"host": address[0]})
+    _wrap(urllib3.connection, "ssl_wrap_socket", lambda *a, **k: "net.tls",
+          lambda *a, **k: {"host": k.get("server_hostname")})
+
+    original = requests.Session.request
+    if getattr(original, "_traced", False):
+        return
+
+    @functools.wraps(original)
+    def request(self, method, url, *args, **kwargs):
+        from urllib.parse import urlsplit
+        with span(f"http.{method.upper()}", host=urlsplit(url).hostname) as sp:
+            response = original(self, method, url, *args, **kwargs)
+            sp.set(status=response.status_code)
+            return response
+
+    request._traced = True
+    requests.Session.request = request
+
+
+def configure(summary: bool = False, path: str = "", chrome: str = "") -> Optional[Tracer]:
+    """按参数开启（或在都为空时保持关闭），模块导入时按环境变量调用一次"""
+    global _tracer
+    if _tracer is not None or not (summary or path or chrome):
+        return _tracer
+    _tracer = Tracer(summary, path, chrome)
+    _instrument_network()
+    atexit.register(_tracer.close)
+    return _tracer
+
+
+configure(TRACE_SUMMARY, TRACE_FILE, TRACE_CHROME)
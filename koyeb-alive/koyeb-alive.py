@@ -1,14 +1,37 @@
 import os
+import sys
+import asyncio
 import requests
+import aiohttp
 import json
 import time
 import logging
-from typing import List, Dict, Tuple, Any, Optional
+from urllib.parse import urlparse
+from typing import Callable, List, Dict, Optional, Tuple, Any
 from datetime import datetime, timezone, timedelta
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 仓库根目录，用于导入 common
+from common.accounts import Account, has_source, iter_accounts, parse_shard
+from common.notify import get_notifier
+from common.report import Raw, Renderer, Result
+from common.shards import result_file, write_result
+from common.runstate import RunState, describe_age
+from common.resilience import CircuitBreaker, CircuitOpenError, Retry, TransientError, host_of, raise_for_transient
+from common.metrics import Metrics
+from common import trace
+
 # --- 常量定义 ---
-KOYEB_PROFILE_URL = "https://app.koyeb.com/v1/account/profile"
+KOYEB_API_URL = os.getenv("KOYEB_API_URL", "https://app.koyeb.com").rstrip("/")  # 可指向本地回放服务，见 common/replay.py
+KOYEB_PROFILE_URL = f"{KOYEB_API_URL}/v1/account/profile"
+KOYEB_HOST = host_of(KOYEB_PROFILE_URL)
 REQUEST_TIMEOUT = 30  # 请求超时，单位：秒
+KOYEB_ASYNC = os.getenv("KOYEB_ASYNC", "1") != "0"  # 是否启用异步并发验证，设为 0 回退为逐个验证
+KOYEB_CONCURRENCY = int(os.getenv("KOYEB_CONCURRENCY", "10"))  # 同时进行的最大请求数
+KOYEB_RATE = float(os.getenv("KOYEB_RATE", "2"))  # 每个主机每秒允许的请求数
+KOYEB_BURST = int(os.getenv("KOYEB_BURST", "5"))  # 令牌桶容量，允许的瞬时突发请求数
+KOYEB_KEEPALIVE = float(os.getenv("KOYEB_KEEPALIVE", "60"))  # 空闲连接保留的秒数，守护进程按分钟级间隔运行时可调大
+KOYEB_SKIP_HOURS = float(os.getenv("KOYEB_SKIP_HOURS", "72"))  # 距上次验证成功不足该小时数的账户本次跳过，0 表示不跳过
+RUN_STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run_state.json")
 BEIJING_TZ = timezone(timedelta(hours=8))
 
 # --- 日志配置 ---
@@ -31,88 +54,148 @@ handler.setFormatter(BeijingTimeFormatter(
 
 logging.basicConfig(level=logging.INFO, handlers=[handler])
 
+# 同步与异步路径共用的重试策略与熔断器：Koyeb 连续出错时剩余账户直接判为失败，不再消耗限速额度
+breaker = CircuitBreaker()
+retry = Retry(breaker, log=logging.warning)
+
 # --- 账户加载/验证函数 ---
-def validate_and_load_accounts() -> List[Dict[str, str]]:
+def validate_and_load_accounts() -> List[Account]:
     """
-    从环境变量 KOYEB_LOGIN 加载账户信息。
-    格式: "email1:PAT1\nemail2:PAT2"
+    从 KOYEB_LOGIN（或 KOYEB_LOGIN_FILE / KOYEB_LOGIN_VAULT）加载账户信息，支持 --shard i/N 分片。
+    格式: "email1:PAT1\nemail2:PAT2"，只按第一个冒号分割，防止PAT中包含冒号被误分
     """
-    koyeb_login_env = os.getenv("KOYEB_LOGIN")
-    if not koyeb_login_env:
+    if not has_source("KOYEB_LOGIN"):
         logging.error(f"❌ KOYEB_LOGIN 变量未配置，脚本无法继续执行")
         raise ValueError("必须配置 KOYEB_LOGIN 环境变量")
 
-    accounts = []
-    lines = koyeb_login_env.strip().split('\n') # 按行分割，并处理空行
-    
-    for line in lines:
-        line = line.strip()
-        if not line or ':' not in line:
-            logging.warning(f"⚠️ 跳过无效或空行: {line}")
-            continue
+    shard = parse_shard()
+    accounts = list(iter_accounts(
+        "KOYEB_LOGIN", shard=shard,
+        on_invalid=lambda msg: logging.warning(f"⚠️ KOYEB_LOGIN {msg}，已跳过")
+    ))
+    if shard:
+        logging.info(f"🧩 分片 {shard[0]}/{shard[1]}: 本分片共 {len(accounts)} 个账户")
 
-        try:
-            email, pat = line.split(':', 1) # 只按第一个冒号分割，防止PAT中包含冒号被误分
-            accounts.append({
-                'email': email.strip(),
-                'pat': pat.strip()
-            })
-        except ValueError:
-            logging.error(f"⚠️ KOYEB_LOGIN 行格式错误，应为 email:PAT -> {line}")
-            continue
-            
-    if not accounts:
+    if not accounts and not shard:
         raise ValueError("KOYEB_LOGIN 环境变量未包含任何有效账户信息")
     
     return accounts
 
 # --- Telegram 发送函数 ---
-def send_tg_message(message: str) -> Optional[Dict[str, Any]]:
-    bot_token = os.getenv("TG_BOT_TOKEN")
-    chat_id = os.getenv("TG_CHAT_ID")
-
-    if not bot_token or not chat_id:
+def send_tg_message(message: str) -> None:
+    """
+    交给共用通知器在后台发送（带重试与限流处理），不阻塞验证流程。
+    """
+    notifier = get_notifier()
+    if not notifier.ok:
         logging.warning("⚠️ TG_BOT_TOKEN 或 TG_CHAT_ID 未设置，跳过发送 Telegram 消息。")
-        return None
+        return
+    notifier.send(message, parse_mode="Markdown")
 
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-    payload = {
-        "chat_id": chat_id,
-        "text": message,
-        "parse_mode": "Markdown"
-    }
-    try:
-        response = requests.post(url, data=payload, timeout=REQUEST_TIMEOUT)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.HTTPError as http_err:
-        logging.error(f"❌ 发送 Telegram 消息时发生HTTP错误: {http_err}")
-        logging.error(f"❌ 响应内容: {http_err.response.text}")
-        return None
-    except requests.exceptions.RequestException as e:
-        logging.error(f"❌ 发送 Telegram 消息失败: {e}")
-        return None
+# --- 限速器 ---
+class TokenBucket:
+    """
+    令牌桶：以 rate 个/秒的速度补充令牌，最多积攒 capacity 个。
+    令牌不足时预支令牌并返回需要等待的秒数，保证请求按顺序均匀放行。
+    """
+    def __init__(self, rate: float, capacity: int):
+        self.rate = max(rate, 0.001)
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
 
-# --- 账户验证函数 ---
-def verify_koyeb_account_status(email: str, pat: str) -> Tuple[bool, str]:
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def wait(self) -> None:
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire(self) -> None:
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class HostRateLimiter:
     """
-    使用 PAT 调用 /v1/account/profile 端点，并验证账户状态。
+    按主机划分的限速器，每个主机各自拥有一个令牌桶。
     """
-    if not email or not pat:
-        return False, "邮箱或个人访问令牌 (PAT) 为空"
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets: Dict[str, TokenBucket] = {}
 
-    headers = {
+    async def acquire(self, url: str) -> None:
+        host = urlparse(url).netloc
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            bucket = self.buckets[host] = TokenBucket(self.rate, self.capacity)
+        await bucket.acquire()
+
+# --- 账户验证函数 ---
+def build_headers(pat: str) -> Dict[str, str]:
+    return {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {pat}", 
         "User-Agent": "KoyebAccountStatusChecker/1.0"
     }
 
-    try:
+def check_profile(email: str, profile_data: Dict[str, Any]) -> Tuple[bool, str]:
+    """
+    根据 /v1/account/profile 返回的 JSON 判断账户状态。
+    """
+    user_info = profile_data.get('user', {})
+    returned_email = user_info.get('email', '')
+    flags = user_info.get('flags', [])
+    email_validated = user_info.get('email_validated', False)
+    
+    # 严格验证逻辑
+    if returned_email.lower() != email.lower():
+        return False, f"验证失败：API返回邮箱({returned_email})与提供邮箱不匹配。"
+    
+    is_active = "ACTIVE" in flags
+    
+    if is_active and email_validated:
+        return True, "活跃且邮箱已验证"
+    elif not is_active:
+        return False, f"原因: 非活跃 (Flags: {', '.join(flags)})"
+    elif not email_validated:
+        return False, "原因: 邮箱未验证"
+    else:
+        return False, f"原因: 未知账户: {user_info}"
+
+def get_profile(pat: str, limiter: Optional[TokenBucket] = None) -> requests.Response:
+    """
+    请求 /v1/account/profile，每次尝试（包括重试）都先向限速器申请令牌；429 与 5xx 抛出 TransientError 交给重试层
+    """
+    if limiter:
+        with trace.span("koyeb.rate_wait"):
+            limiter.wait()
+    with trace.span("koyeb.profile"):
         response = requests.get(
-            KOYEB_PROFILE_URL,  
-            headers=headers,  
+            KOYEB_PROFILE_URL,
+            headers=build_headers(pat),
             timeout=REQUEST_TIMEOUT,
         )
+    raise_for_transient(response.status_code, response.headers.get("Retry-After"))
+    return response
+
+@trace.traced("koyeb.verify", account="email")
+def verify_koyeb_account_status(email: str, pat: str, limiter: Optional[TokenBucket] = None) -> Tuple[bool, str]:
+    """
+    使用 PAT 调用 /v1/account/profile 端点，并验证账户状态；给出 limiter 时每次请求前申请令牌。
+    超时、连接错误与 429/5xx 按退避重试；Koyeb 已熔断时直接返回失败，不再发出请求。
+    """
+    if not email or not pat:
+        return False, "邮箱或个人访问令牌 (PAT) 为空"
+
+    try:
+        response = retry.call(KOYEB_HOST, get_profile, pat, limiter)
         
         # 检查 HTTP 状态码
         if response.status_code == 401 or response.status_code == 403:
@@ -122,27 +205,13 @@ def verify_koyeb_account_status(email: str, pat: str) -> Tuple[bool, str]:
 
         # 解析并验证返回的 JSON 数据
         profile_data = response.json() 
-        user_info = profile_data.get('user', {})
-        returned_email = user_info.get('email', '')
-        flags = user_info.get('flags', [])
-        email_validated = user_info.get('email_validated', False)
-        
-        # 严格验证逻辑
-        if returned_email.lower() != email.lower():
-            return False, f"验证失败：API返回邮箱({returned_email})与提供邮箱不匹配。"
-        
-        is_active = "ACTIVE" in flags
-        
-        if is_active and email_validated:
-            return True, "活跃且邮箱已验证"
-        elif not is_active:
-            return False, f"原因: 非活跃 (Flags: {', '.join(flags)})"
-        elif not email_validated:
-            return False, "原因: 邮箱未验证"
-        else:
-            return False, f"原因: 未知账户: {user_info}"
+        return check_profile(email, profile_data)
 
 
+    except CircuitOpenError as e:
+        return False, f"原因: {e}"
+    except TransientError as e:
+        return False, f"原因: 服务暂时不可用 ({e})，重试 {retry.attempts} 次后放弃"
     except requests.exceptions.HTTPError as http_err:
         try:
             error_data = http_err.response.json()
@@ -156,69 +225,219 @@ def verify_koyeb_account_status(email: str, pat: str) -> Tuple[bool, str]:
         return False, f"原因: 网络请求异常: {e}"
     except Exception as e:
         return False, f"原因: 处理响应时发生异常: {e}"
-        
-def main():
+
+async def get_profile_async(
+    session: aiohttp.ClientSession, limiter: HostRateLimiter, pat: str
+) -> Tuple[int, str]:
+    """get_profile 的异步版本，每次尝试（包括重试）都先向限速器申请令牌，返回 (状态码, 响应正文)"""
+    async with trace.span("koyeb.rate_wait"):
+        await limiter.acquire(KOYEB_PROFILE_URL)
+    async with trace.span("koyeb.profile"):
+        async with session.get(KOYEB_PROFILE_URL, headers=build_headers(pat)) as response:
+            raise_for_transient(response.status, response.headers.get("Retry-After"))
+            return response.status, await response.text()
+
+@trace.traced("koyeb.verify", account="email")
+async def verify_koyeb_account_status_async(
+    session: aiohttp.ClientSession, limiter: HostRateLimiter, email: str, pat: str
+) -> Tuple[bool, str]:
+    """
+    verify_koyeb_account_status 的异步版本，复用 session 的连接池，并在请求前向限速器申请令牌。
+    """
+    if not email or not pat:
+        return False, "邮箱或个人访问令牌 (PAT) 为空"
+
     try:
-        koyeb_accounts = validate_and_load_accounts()
-        
-        results = []
-        current_time_dt = datetime.now(BEIJING_TZ)
-        current_time = current_time_dt.strftime("%Y-%m-%d %H:%M:%S")
-        total_accounts = len(koyeb_accounts)
-        success_count = 0
+        status, text = await retry.call_async(KOYEB_HOST, get_profile_async, session, limiter, pat)
+        if status == 401 or status == 403:
+            return False, "验证失败：PAT 无效或已过期。"
+
+        if status >= 400:
+            try:
+                error_data = json.loads(text)
+                error_message = error_data.get('error', text)
+                return False, f"原因: API错误 (状态码 {status}): {error_message}"
+            except json.JSONDecodeError:
+                return False, f"原因: HTTP错误 (状态码 {status}): {text}"
 
-        for index, account in enumerate(koyeb_accounts, 1):
-            email = account.get('email', '').strip()
-            pat = account.get('pat', '')
+        return check_profile(email, json.loads(text))
 
-            if not email or not pat:
-                logging.warning(f"⚠️ 第 {index}/{total_accounts} 个账户信息不完整，已跳过")
-                results.append(f"账户: 未提供邮箱\n状态: ❌ 信息不完整\n")
-                continue
+    except CircuitOpenError as e:
+        return False, f"原因: {e}"
+    except TransientError as e:
+        return False, f"原因: 服务暂时不可用 ({e})，重试 {retry.attempts} 次后放弃"
+    except asyncio.TimeoutError:
+        return False, "原因: 请求超时"
+    except aiohttp.ClientError as e:
+        return False, f"原因: 网络请求异常: {e}"
+    except Exception as e:
+        return False, f"原因: 处理响应时发生异常: {e}"
 
-            logging.info(f"🚀 正在处理第 {index}/{total_accounts} 个账户: {email}")
-            time.sleep(10)
+def new_client_session() -> aiohttp.ClientSession:
+    """
+    带 keep-alive 连接池的会话；守护进程（common/daemon.py）在多次运行之间复用同一个会话。
+    """
+    connector = aiohttp.TCPConnector(limit=max(KOYEB_CONCURRENCY, 1), keepalive_timeout=KOYEB_KEEPALIVE)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=trace.aiohttp_configs())
+
+async def verify_accounts_async(
+    accounts: List[Account], session: Optional[aiohttp.ClientSession] = None
+) -> List[Tuple[bool, str, float]]:
+    """
+    在共享的 keep-alive 连接池上并发验证所有账户，返回 (是否成功, 说明, 耗时秒数)，顺序与 accounts 一致。
+    未给出 session 时本次临时创建，结束后关闭。
+    """
+    if session is None:
+        async with new_client_session() as session:
+            return await verify_accounts_async(accounts, session)
+
+    semaphore = asyncio.Semaphore(max(KOYEB_CONCURRENCY, 1))
+    limiter = HostRateLimiter(KOYEB_RATE, KOYEB_BURST)
+    total_accounts = len(accounts)
 
+    async def worker(index: int, account: Account) -> Tuple[bool, str, float]:
+        email = account.name
+        async with semaphore:
+            logging.info(f"🚀 正在处理第 {index}/{total_accounts} 个账户: {email}")
+            start = time.perf_counter()
             try:
-                # 调用验证函数
-                success, message = verify_koyeb_account_status(email, pat)
-                if success:
-                    status_line = f"状态: ✅ {message}"
-                    success_count += 1
-                else:
-                    status_line = f"状态: ❌ 验证失败\n  {message}"
+                success, message = await verify_koyeb_account_status_async(session, limiter, email, account.secret)
             except Exception as e:
                 logging.error(f"❌ 处理账户 {email} 时发生未知异常: {e}")
-                status_line = f"状态: ❌ 验证失败\n  执行时发生未知异常 - {e}"
-
-            results.append(f"账户: `{email}`\n{status_line}\n")
-
-        summary = f"📊 总计: {total_accounts} 个账户\n✅ 成功: {success_count} 个 | ❌ 失败: {total_accounts - success_count} 个"
-        report_body = "".join(results)
-        tg_message = (
-            f"🤖 *Koyeb 账户状态报告* 🤖\n"
-            f"=====================\n"
-            f"⏰ 日期: {current_time}\n"
-            f"{summary}\n"
-            f"---------------------------\n"
-            f"{report_body}"
-        )
+                success, message = False, f"执行时发生未知异常 - {e}"
+            return success, message, time.perf_counter() - start
+
+    return await asyncio.gather(*(worker(i, acc) for i, acc in enumerate(accounts, 1)))
+
+def verify_accounts_serial(accounts: List[Account]) -> List[Tuple[bool, str, float]]:
+    """
+    逐个验证账户，每次请求（包括重试）的间隔由令牌桶控制。
+    """
+    limiter = TokenBucket(KOYEB_RATE, 1)
+    total_accounts = len(accounts)
+    outcomes = []
 
-        logging.info("📊 --- 报告预览 ---\n" + tg_message)
-        send_tg_message(tg_message)
+    for index, account in enumerate(accounts, 1):
+        email = account.name
+        logging.info(f"🚀 正在处理第 {index}/{total_accounts} 个账户: {email}")
+        start = time.perf_counter()
+        try:
+            success, message = verify_koyeb_account_status(email, account.secret, limiter)
+        except Exception as e:
+            logging.error(f"❌ 处理账户 {email} 时发生未知异常: {e}")
+            success, message = False, f"执行时发生未知异常 - {e}"
+        outcomes.append((success, message, time.perf_counter() - start))
+
+    return outcomes
+
+def to_results(entries: List[Any]) -> List[Result]:
+    """分片结果文件中的 dict 转回 Result"""
+    return [e if isinstance(e, Result) else Result.from_dict(e) for e in entries]
+
+def render_lines(r: Renderer, results: List[Result]):
+    """逐个账户渲染报告条目，动态内容按 Markdown 转义"""
+    for res in results:
+        if res.skipped:
+            status_line = r.fmt("状态: ⏭️ 上次验证成功于 {}，本次跳过", res.detail)
+        elif res.ok:
+            status_line = r.fmt("状态: ✅ {}", res.detail)
+        else:
+            status_line = r.fmt("状态: ❌ 验证失败\n  {}", res.detail)
+        yield r.fmt("账户: {}\n{}", r.code(res.name), Raw(status_line))
+
+def send_report(entries: List[Any]) -> bool:
+    """按账户逐条渲染并发送报告（超长时按账户边界分成多条消息），返回是否至少有一个账户成功（没有账户时视为成功）"""
+    results = to_results(entries)
+    r = Renderer("Markdown")
+    current_time = datetime.now(BEIJING_TZ).strftime("%Y-%m-%d %H:%M:%S")
+    total_accounts = len(results)
+    skipped_count = sum(1 for res in results if res.skipped)
+    success_count = sum(1 for res in results if res.ok) - skipped_count  # 跳过的账户本次未验证，不计入成功
+    failed_count = total_accounts - success_count - skipped_count
+    head = (
+        f"🤖 *Koyeb 账户状态报告* 🤖\n"
+        f"=====================\n"
+        f"⏰ 日期: {current_time}\n"
+        f"📊 总计: {total_accounts} 个账户\n"
+        f"✅ 成功: {success_count} 个 | ⏭️ 跳过: {skipped_count} 个 | ❌ 失败: {failed_count} 个\n"
+        f"---------------------------"
+    )
+
+    if not get_notifier().ok:
+        logging.warning("⚠️ TG_BOT_TOKEN 或 TG_CHAT_ID 未设置，跳过发送 Telegram 消息。")
+    r.send(head, render_lines(r, results), echo=lambda chunk: logging.info("📊 --- 报告预览 ---\n" + chunk))
+    return not results or any(res.ok for res in results)
+
+Verifier = Callable[[List[Account]], List[Tuple[bool, str, float]]]
+
+def run(verify: Optional[Verifier] = None) -> bool:
+    """
+    验证所有账户并发送报告（分片运行时写结果文件），返回是否至少有一个账户成功。
+    verify 默认按 KOYEB_ASYNC 选择并发或逐个验证；守护进程传入复用常驻连接池的验证函数。
+    """
+    koyeb_accounts = validate_and_load_accounts()
+    results: List[Result] = []
+    metrics = Metrics("koyeb-alive", parse_shard())
+
+    state = RunState(RUN_STATE_FILE)
+    skip_window = KOYEB_SKIP_HOURS * 3600
+    skipped: Dict[int, float] = {}  # 账户序号 -> 距上次成功的秒数
+    valid_accounts = []
+    for index, account in enumerate(koyeb_accounts, 1):
+        if state.fresh(account.name, skip_window):
+            skipped[index] = state.age(account.name)
+            continue
+        valid_accounts.append(account)
+    if skipped:
+        logging.info(f"⏭️ {len(skipped)} 个账户在 {KOYEB_SKIP_HOURS:g} 小时内已验证成功，本次跳过（RUN_FORCE=1 可强制验证）")
+
+    if verify:
+        outcomes = iter(verify(valid_accounts))
+    elif KOYEB_ASYNC:
+        logging.info(f"⚡ 异步并发验证: 并发 {KOYEB_CONCURRENCY}，限速 {KOYEB_RATE} 次/秒")
+        outcomes = iter(asyncio.run(verify_accounts_async(valid_accounts)))
+    else:
+        outcomes = iter(verify_accounts_serial(valid_accounts))
+    if breaker.summary():
+        logging.warning(f"⛔ {breaker.summary()}")
+
+    for index, account in enumerate(koyeb_accounts, 1):
+        email = account.name
+        if index in skipped:
+            results.append(Result(email, True, "跳过", describe_age(skipped[index])))
+            metrics.account(email, True, skipped=True)
+            continue
+
+        success, message, seconds = next(outcomes)
+        state.record(email, success, message)
+        results.append(Result(email, success, "成功" if success else "失败", message))
+        metrics.account(email, success, seconds, detail=message)
+
+    state.save()
+    metrics.write()
+
+    # 分片运行时只写结果文件，由汇总任务统一发送报告
+    path = result_file()
+    if path:
+        write_result(path, "koyeb-alive", parse_shard(), [res.to_dict() for res in results])
+        return True
+
+    return send_report(results)
+
+def main():
+    try:
+        ok = run()
         logging.info("🎉 脚本执行完毕。")
 
-        if success_count == 0 and total_accounts > 0:
+        if not ok:
             logging.error("❌ 所有账户验证失败，脚本将以非零状态码退出")
-            import sys
             sys.exit(1)
 
     except Exception as e:
         error_message = f"❌ 程序初始化失败: {e}"
-        logging.error(error_message)
-        send_tg_message(error_message)
-        import sys
-        sys.exit(1)
+        send_tg_message(Renderer("Markdown").esc(error_message))
+        sys.exit(error_message)  # 输出到 stderr 并以状态码 1 退出；分片运行时作为失败原因写入结果文件
             
 if __name__ == "__main__":
     main()
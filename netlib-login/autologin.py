@@ -1,123 +1,390 @@
 import os
+import sys
 import time
+import asyncio
 import requests
+from html.parser import HTMLParser
+from urllib.parse import urljoin
 from datetime import datetime, timedelta
-from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright, Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
 
-# -------------------------------
-log_buffer = []
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 仓库根目录，用于导入 common
+from common.blocking import ResourceBlocker
+from common.accounts import iter_accounts, parse_shard
+from common.notify import get_notifier
+from common.report import Renderer, Result
+from common.resilience import CircuitBreaker, CircuitOpenError, Retry, TransientError, host_of, raise_for_transient
+from common.runstate import RunState, describe_age
+from common.shards import result_file, write_result
+from common.metrics import Metrics
+from common import trace
 
-def log(msg):
-    print(msg)
-    log_buffer.append(msg)
-# -------------------------------
-
-# Telegram 推送函数
-def send_tg_log():
-    token = os.getenv("TG_BOT_TOKEN")
-    chat_id = os.getenv("TG_CHAT_ID")
-    if not token or not chat_id:
-        print("⚠️ Telegram 未配置，跳过推送")
-        return
-
-    utc_now = datetime.utcnow()
-    beijing_now = utc_now + timedelta(hours=8)
-    now_str = beijing_now.strftime("%Y-%m-%d %H:%M:%S") + " UTC+8"
+NETLIB_WORKERS = int(os.environ.get("NETLIB_WORKERS", "3"))  # 同时登录的账号数
+NETLIB_TIMEOUT = int(os.environ.get("NETLIB_TIMEOUT", "30"))  # 单个账号登录流程的总超时（秒）
+NETLIB_HTTP_LOGIN = os.environ.get("NETLIB_HTTP_LOGIN", "on").lower() not in ("off", "0", "false")  # 先尝试 HTTP 快速登录
+NETLIB_HTTP_LOGIN_URL = os.environ.get("NETLIB_HTTP_LOGIN_URL", "")  # 可选，登录表单的提交地址，默认从首页的 <form> 解析
+NETLIB_HTTP_FIELDS = [f.strip() for f in os.environ.get("NETLIB_HTTP_FIELDS", "").split(",", 1) if f.strip()]  # 可选，用户名、密码字段名，默认从表单解析
+NETLIB_SKIP_DAYS = float(os.environ.get("NETLIB_SKIP_DAYS", "7"))  # 距上次登录成功不足该天数的账号本次跳过，0 表示不跳过
+NETLIB_HOME = os.environ.get("NETLIB_HOME", "https://www.netlib.re/")  # 可指向本地回放服务，见 common/replay.py
+RUN_STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run_state.json")
 
-    final_msg = f"📌 Netlib 保活执行日志\n🕒 {now_str}\n\n" + "\n".join(log_buffer)
+# 所有账号共用一套拦截规则与统计；NETLIB_ALLOW_DOMAINS 设置后只放行这些域名（及其子域名）
+blocker = ResourceBlocker(allow=os.environ.get("NETLIB_ALLOW_DOMAINS", "").split(","))
+NETLIB_HOST = host_of(NETLIB_HOME)
+breaker = CircuitBreaker()  # HTTP 与浏览器登录共用：站点连续出错后剩余账号直接判为失败，不再启动浏览器重试
 
-    for i in range(0, len(final_msg), 3900):
-        chunk = final_msg[i:i+3900]
-        try:
-            resp = requests.get(
-                f"https://api.telegram.org/bot{token}/sendMessage",
-                params={"chat_id": chat_id, "text": chunk},
-                timeout=10
-            )
-            if resp.status_code == 200:
-                print(f"✅ Telegram 推送成功 [{i//3900 + 1}]")
-            else:
-                print(f"⚠️ Telegram 推送失败 [{i//3900 + 1}]: HTTP {resp.status_code}, 响应: {resp.text}")
-        except Exception as e:
-            print(f"⚠️ Telegram 推送异常 [{i//3900 + 1}]: {e}")
-
-# 从环境变量解析多个账号, 格式为多行，每行: username:password
-accounts_env = os.environ.get("NETLIB_ACCOUNTS", "")
-accounts = []
+def log(msg):
+    print(msg)
 
-# 使用换行符分割，处理可能的 \r\n 或 \n
-for item in accounts_env.strip().split('\n'):
-    item = item.strip()
-    if item:
-        try:
-            # 使用冒号:分割用户名和密码
-            username, password = item.split(":", 1)
-            accounts.append({"username": username.strip(), "password": password.strip()})
-        except ValueError:
-            log(f"⚠️ 忽略格式错误的账号项: {item} (预期格式: username:password)")
+# 从 NETLIB_ACCOUNTS（或 NETLIB_ACCOUNTS_FILE / NETLIB_ACCOUNTS_VAULT）解析多个账号，每行: username:password，支持 --shard i/N 分片
+shard = parse_shard()
+accounts = list(iter_accounts(
+    "NETLIB_ACCOUNTS", shard=shard,
+    on_invalid=lambda msg: log(f"⚠️ 忽略格式错误的账号项: {msg}")
+))
 
 fail_msgs = [
     "Invalid credentials.",
     "Not connected to server.",
     "Error with the login: login size should be between 2 and 50 (currently: 1)"
 ]
+success_text = "You are the exclusive owner of the following domains."
+
+# 在页面内等待结果：先检查一次，之后只在 DOM 变化时才重新读取 body 文本（不定时轮询），
+# 每次读取同时比对成功文本与所有失败消息；超时返回 null
+OUTCOME_JS = """
+([success, fails, timeout]) => new Promise(resolve => {
+    const check = () => {
+        const text = document.body ? document.body.innerText : "";
+        if (text.includes(success)) return success;
+        for (const msg of fails) {
+            if (text.includes(msg)) return msg;
+        }
+        return null;
+    };
+    const first = check();
+    if (first) return resolve(first);
+    const finish = outcome => {
+        observer.disconnect();
+        clearTimeout(timer);
+        resolve(outcome);
+    };
+    const observer = new MutationObserver(() => {
+        const outcome = check();
+        if (outcome) finish(outcome);
+    });
+    observer.observe(document.documentElement, {childList: true, subtree: true, characterData: true});
+    const timer = setTimeout(() => finish(null), timeout);
+})
+"""
+
+def match_outcome(text):
+    """与 OUTCOME_JS 相同的判定，用于 HTTP 响应正文"""
+    if success_text in text:
+        return success_text
+    for msg in fail_msgs:
+        if msg in text:
+            return msg
+    return None
+
+@trace.traced("netlib.http_login", account="USER")
+class LoginFormParser(HTMLParser):
+    """找出页面中第一个带密码输入框的 <form>，记录提交地址、用户名/密码字段名与隐藏字段（如 CSRF token）"""
+
+    def __init__(self):
+        super().__init__()
+        self.form = None  # 正在解析的表单
+        self.found = None  # 第一个带密码框的表单
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "form" and self.found is None:
+            self.form = {"action": attrs.get("action") or "", "user": None, "password": None, "hidden": {}}
+        elif tag == "input" and self.form is not None and attrs.get("name"):
+            kind = (attrs.get("type") or "text").lower()
+            if kind == "password" and self.form["password"] is None:
+                self.form["password"] = attrs["name"]
+            elif kind == "hidden":
+                self.form["hidden"][attrs["name"]] = attrs.get("value") or ""
+            elif kind in ("text", "email") and self.form["user"] is None:
+                self.form["user"] = attrs["name"]
+
+    def handle_endtag(self, tag):
+        if tag == "form" and self.form is not None:
+            if self.form["password"] and self.form["user"]:
+                self.found = self.form
+            self.form = None
+
+def find_login_form(html, base_url):
+    """解析登录表单，返回 (提交地址, 用户名字段, 密码字段, 隐藏字段)；找不到返回 None。环境变量中的地址/字段名优先"""
+    parser = LoginFormParser()
+    parser.feed(html)
+    parser.close()
+    form = parser.found
+    if form is None and not (NETLIB_HTTP_LOGIN_URL and NETLIB_HTTP_FIELDS):
+        return None
+    form = form or {"action": "", "user": None, "password": None, "hidden": {}}
+    action = NETLIB_HTTP_LOGIN_URL or urljoin(base_url, form["action"])
+    user_field, pass_field = NETLIB_HTTP_FIELDS if len(NETLIB_HTTP_FIELDS) == 2 else (form["user"], form["password"])
+    if not (user_field and pass_field):
+        return None
+    return action, user_field, pass_field, form["hidden"]
+
+# 首页上找不到登录表单（如改成了纯前端渲染）时记下来，后面的账号不再白跑一次首页请求
+http_form_missing = False
+
+def http_login(USER, PWD):
+    """
+    HTTP 快速登录：带 Cookie 的会话先打开首页，从中解析登录表单，再直接提交表单，共两次请求。
+    返回 (是否成功, 说明)；是否成功为 None 表示无法判定，需要回退到浏览器登录
+    """
+    global http_form_missing
+    if not NETLIB_HTTP_LOGIN:
+        return None, "已关闭 HTTP 快速登录"
+    if http_form_missing:
+        return None, "首页没有可提交的登录表单"
+
+    def attempt():
+        with requests.Session() as session:
+            session.headers["User-Agent"] = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+            home = session.get(NETLIB_HOME, timeout=NETLIB_TIMEOUT)
+            raise_for_transient(home.status_code, home.headers.get("Retry-After"))
+            home.raise_for_status()
+            form = find_login_form(home.text, home.url)
+            if form is None:
+                return None
+            action, user_field, pass_field, hidden = form
+            r = session.post(action, data={**hidden, user_field: USER, pass_field: PWD},
+                             headers={"Referer": home.url}, timeout=NETLIB_TIMEOUT)
+            raise_for_transient(r.status_code, r.headers.get("Retry-After"))
+            return r
+
+    try:
+        r = Retry(breaker, log=log).call(NETLIB_HOST, attempt)
+    except CircuitOpenError as e:
+        log(f"❌ 账号 {USER} 登录失败: {e}")
+        return False, str(e)
+    except (TransientError, requests.RequestException) as e:
+        log(f"⚠️ 账号 {USER} HTTP 快速登录请求失败，改用浏览器: {e}")
+        return None, str(e)
+    if r is None:
+        http_form_missing = True
+        log("⚠️ 首页没有找到登录表单，改用浏览器登录")
+        return None, "首页没有可提交的登录表单"
+
+    outcome = match_outcome(r.text) if r.ok else None
+    if outcome == success_text:
+        log(f"✅ 账号 {USER} 登录成功（HTTP）")
+        return True, "HTTP 登录成功"
+    if outcome:
+        log(f"❌ 账号 {USER} 登录失败: {outcome}")
+        return False, outcome
+    log(f"⚠️ 账号 {USER} HTTP 快速登录返回了意外的响应 ({r.status_code})，改用浏览器")
+    return None, f"意外的响应 ({r.status_code})"
+
+async def wait_for_outcome(page, timeout_ms):
+    """等待成功文本或任一失败消息出现，返回先出现的那一条；超时返回 None"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout_ms / 1000
+
+    def remaining_ms():
+        return max(int((deadline - loop.time()) * 1000), 1)
+
+    while True:
+        try:
+            return await page.evaluate(OUTCOME_JS, [success_text, fail_msgs, remaining_ms()])
+        except PlaywrightError as e:
+            # 提交表单引起整页跳转时页面内的监听随旧文档销毁，等新页面加载后重新开始监听
+            if "destroyed" not in str(e) or loop.time() >= deadline:
+                raise
+        try:
+            await page.wait_for_load_state("domcontentloaded", timeout=remaining_ms())
+        except PlaywrightTimeoutError:
+            return None
 
-def login_account(playwright, USER, PWD):
+@trace.traced("netlib.login", account="USER")
+async def login_account(browser, USER, PWD):
+    """浏览器登录，返回 (是否成功, 说明)"""
+    if breaker.is_open(NETLIB_HOST):
+        error = CircuitOpenError(NETLIB_HOST)
+        log(f"❌ 账号 {USER} 登录失败: {error}")
+        return False, str(error)
     log(f"🚀 开始登录账号: {USER}")
+    # 整个登录流程共用一个截止时间
+    deadline = asyncio.get_running_loop().time() + NETLIB_TIMEOUT
+
+    def remaining_ms():
+        return max(int((deadline - asyncio.get_running_loop().time()) * 1000), 1)
+
+    context = None
     try:
-        # 使用 headless=True (无头模式)
-        browser = playwright.chromium.launch(headless=True)
-        context = browser.new_context()
-        page = context.new_page()
-
-        page.goto("https://www.netlib.re/")
-        time.sleep(5)
-
-        page.get_by_text("Login").click()
-        time.sleep(2)
-        page.get_by_role("textbox", name="Username").fill(USER)
-        time.sleep(2)
-        page.get_by_role("textbox", name="Password").fill(PWD)
-        time.sleep(2)
-        page.get_by_role("button", name="Validate").click()
-        page.wait_for_load_state("networkidle")
-        time.sleep(2)
-
-        # 检查是否登录成功
-        success_text = "You are the exclusive owner of the following domains."
-        if page.query_selector(f"text={success_text}"):
-            log(f"✅ 账号 {USER} 登录成功")
-            time.sleep(5)
-        else:
-            # 检查是否有预设的失败消息
-            failed_msg = None
-            for msg in fail_msgs:
-                # 使用 page.inner_text() 或其他方式检查页面内容
-                if page.locator("body").inner_text().find(msg) != -1:
-                    failed_msg = msg
-                    break
-            
-            if failed_msg:
-                log(f"❌ 账号 {USER} 登录失败: {failed_msg}")
-            else:
-                log(f"❌ 账号 {USER} 登录失败: 未知错误 (当前URL: {page.url})")
+        # 每个账号使用独立的 BrowserContext，Cookie 与存储互不影响；浏览器崩溃或断开时只影响本账号
+        async with trace.span("netlib.new_context"):
+            context = await browser.new_context()
+            await blocker.install_async(context)
+        page = await context.new_page()
+        # 打开首页遇到超时或连接错误时按退避重试（仍受总截止时间约束）
+        async with trace.span("netlib.goto"):
+            await Retry(breaker, log=log).call_async(
+                NETLIB_HOST, lambda: page.goto(NETLIB_HOME, wait_until="domcontentloaded", timeout=remaining_ms())
+            )
 
-        context.close()
-        browser.close()
+        # fill/click 会自动等待元素可见可操作，无需固定等待
+        async with trace.span("netlib.fill_form"):
+            await page.get_by_text("Login").click(timeout=remaining_ms())
+            await page.get_by_role("textbox", name="Username").fill(USER, timeout=remaining_ms())
+            await page.get_by_role("textbox", name="Password").fill(PWD, timeout=remaining_ms())
+            await page.get_by_role("button", name="Validate").click(timeout=remaining_ms())
+
+        # 成功文本与失败消息赛跑，谁先出现就以谁为准
+        async with trace.span("netlib.wait_outcome") as sp:
+            outcome = await wait_for_outcome(page, remaining_ms())
+            sp.set(outcome=outcome)
+        if outcome == success_text:
+            log(f"✅ 账号 {USER} 登录成功")
+            return True, "浏览器登录成功"
+        detail = outcome or f"未知错误 (当前URL: {page.url})"
+        log(f"❌ 账号 {USER} 登录失败: {detail}")
+        return False, detail
 
     except Exception as e:
         log(f"❌ 账号 {USER} 登录异常: {e}")
+        return False, f"登录异常: {e}"
+    finally:
+        if context is not None:
+            try:
+                await context.close()
+            except Exception as e:
+                log(f"⚠️ 账号 {USER} 关闭浏览器上下文失败: {e}")
 
-def run():
+def render_lines(r, results):
+    """逐个账号渲染报告条目，动态内容按 Markdown 转义"""
+    for res in results:
+        if res.skipped:
+            yield r.fmt("⏭️ {} 上次登录成功于 {}，本次跳过", r.code(res.name), res.detail)
+        elif res.ok:
+            yield r.fmt("✅ {} {}", r.code(res.name), res.detail)
+        else:
+            yield r.fmt("❌ {} 登录失败: {}", r.code(res.name), res.detail or "未知错误")
+
+def send_report(entries):
+    """
+    按账号逐条渲染并发送报告（超长时按账号边界分成多条消息），单任务运行与分片汇总共用。
+    返回是否至少有一个账号登录成功（没有账号时视为成功）
+    """
+    results = [e if isinstance(e, Result) else Result.from_dict(e) for e in entries]
+    skipped = sum(1 for res in results if res.skipped)
+    success = sum(1 for res in results if res.ok) - skipped
+    now_str = (datetime.utcnow() + timedelta(hours=8)).strftime("%Y-%m-%d %H:%M:%S") + " UTC+8"
+    head = (
+        f"📌 *Netlib 保活报告*\n🕒 {now_str}\n"
+        f"✅ 成功: {success} 个 | ⏭️ 跳过: {skipped} 个 | ❌ 失败: {len(results) - success - skipped} 个\n"
+    )
+
+    notifier = get_notifier()
+    if not notifier.ok:
+        print("⚠️ Telegram 未配置，跳过推送")
+    r = Renderer("Markdown")
+    r.send(head, render_lines(r, results), echo=lambda chunk: print("\n" + chunk))
+    if notifier.ok:
+        print("✅ Telegram 推送完成" if notifier.flush() else "⚠️ Telegram 推送超时")
+    return not results or any(res.ok for res in results)
+
+async def run(get_browser=None):
+    """
+    登录所有账号，按账号顺序返回各账号的 Result。
+    get_browser 为返回已启动浏览器的协程函数时使用该浏览器且不关闭（守护进程的常驻浏览器），否则本次临时启动
+    """
     if not accounts:
-        log("⚠️ 未找到任何账号配置，请检查 NETLIB_ACCOUNTS 环境变量。")
-        return
+        if not shard:
+            log("⚠️ 未找到任何账号配置，请检查 NETLIB_ACCOUNTS 环境变量。")
+        return []
+
+    results = {}  # 账号 -> Result
+    state = RunState(RUN_STATE_FILE)
+    metrics = Metrics("netlib-login", shard)
+    elapsed = {}  # 账号 -> HTTP 与浏览器登录累计耗时
+
+    def record(acc, ok, how, detail):
+        state.record(acc.name, ok, how)
+        results[acc.name] = Result(acc.name, ok, "成功" if ok else "失败", detail)
+        metrics.account(acc.name, ok, elapsed.get(acc.name), detail=detail)
+
+    def timed_http_login(acc):
+        start = time.perf_counter()
+        try:
+            return http_login(acc.name, acc.secret)
+        finally:
+            elapsed[acc.name] = time.perf_counter() - start
+
+    # 近期已登录成功的账号本次跳过
+    due = []
+    for acc in accounts:
+        if state.fresh(acc.name, NETLIB_SKIP_DAYS * 86400):
+            age = describe_age(state.age(acc.name))
+            log(f"⏭️ 账号 {acc.name} 上次登录成功于 {age}，本次跳过")
+            results[acc.name] = Result(acc.name, True, "跳过", age)
+            metrics.account(acc.name, True, skipped=True)
+        else:
+            due.append(acc)
+
+    # 先并发尝试 HTTP 快速登录，只有得不出结论的账号才需要浏览器
+    outcomes = await asyncio.gather(*(asyncio.to_thread(timed_http_login, acc) for acc in due))
+    pending = []
+    for acc, (ok, detail) in zip(due, outcomes):
+        if ok is None:
+            pending.append(acc)
+        else:
+            record(acc, ok, "HTTP 登录", detail)
+
+    if pending:
+        semaphore = asyncio.Semaphore(max(NETLIB_WORKERS, 1))
+
+        async def worker(acc):
+            async with semaphore:
+                start = time.perf_counter()
+                ok, detail = await login_account(browser, acc.name, acc.secret)
+                elapsed[acc.name] = elapsed.get(acc.name, 0) + time.perf_counter() - start
+                record(acc, ok, "浏览器登录", detail)
+
+        # 整个运行只启动一次浏览器，各账号在各自的 context 中并发执行
+        playwright = None
+        try:
+            if get_browser:
+                browser = await get_browser()
+            else:
+                playwright = await async_playwright().start()
+                async with trace.span("browser.launch"):
+                    browser = await playwright.chromium.launch(headless=True)
+        except Exception as e:
+            log(f"❌ 浏览器启动失败: {e}")
+            for acc in pending:
+                results[acc.name] = Result(acc.name, False, "失败", f"浏览器启动失败: {e}")
+                metrics.account(acc.name, False, reason="browser")
+        else:
+            try:
+                await asyncio.gather(*(worker(acc) for acc in pending))
+            finally:
+                if playwright:
+                    await browser.close()
+            print(f"📦 {blocker.summary()}")
+        finally:
+            if playwright:
+                await playwright.stop()
+
+    if breaker.summary():
+        print(f"⛔ {breaker.summary()}")
+    state.save()
+    metrics.write()
 
-    with sync_playwright() as playwright:
-        for acc in accounts:
-            login_account(playwright, acc["username"], acc["password"])
-            time.sleep(2)
+    # 按账号顺序返回，避免并发完成的顺序影响报告
+    return [results[acc.name] for acc in accounts]
 
 if __name__ == "__main__":
-    run()
-    send_tg_log()  # 发送日志
+    results = asyncio.run(run())
+    path = result_file()
+    if path:
+        # 分片运行时只写结果文件，由汇总任务统一推送
+        write_result(path, "netlib-login", shard, [res.to_dict() for res in results])
+    else:
+        send_report(results)
@@ -0,0 +1 @@
+# common/ 与 tg-checkin/reply_parser.py 中纯逻辑部分的单元测试，运行：python -m pytest tests（或 python -m unittest discover -s tests -t .）
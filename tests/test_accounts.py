@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from common.accounts import Account, in_shard, iter_accounts, load_accounts, parse_shard
+
+ENV = "TEST_ACCOUNTS"
+
+
+class ParseShardTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {}, clear=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        os.environ.pop("ACCOUNT_SHARD", None)
+
+    def test_unset(self):
+        self.assertIsNone(parse_shard([]))
+
+    def test_argv_forms(self):
+        self.assertEqual(parse_shard(["--shard", "2/3"]), (2, 3))
+        self.assertEqual(parse_shard(["x", "--shard=1/4"]), (1, 4))
+
+    def test_env_overridden_by_argv(self):
+        os.environ["ACCOUNT_SHARD"] = "1/2"
+        self.assertEqual(parse_shard([]), (1, 2))
+        self.assertEqual(parse_shard(["--shard", "3/3"]), (3, 3))
+
+    def test_invalid(self):
+        for spec in ("a/b", "3", "0/2", "3/2", "1/0"):
+            with self.subTest(spec=spec), self.assertRaises(ValueError):
+                parse_shard(["--shard", spec])
+
+
+class ShardingTest(unittest.TestCase):
+    def test_shards_partition_accounts(self):
+        names = [f"user{i}@example.com" for i in range(200)]
+        total = 4
+        owners = [[i for i in range(1, total + 1) if in_shard(name, (i, total))] for name in names]
+        self.assertTrue(all(len(o) == 1 for o in owners))  # 每个账号恰好属于一片
+        sizes = [sum(1 for o in owners if o == [i]) for i in range(1, total + 1)]
+        self.assertTrue(all(size > 0 for size in sizes))
+
+    def test_single_shard_keeps_all(self):
+        self.assertTrue(in_shard("anyone", None))
+        self.assertTrue(in_shard("anyone", (1, 1)))
+
+    def test_stable_when_accounts_added(self):
+        before = {n for n in ("a", "b", "c", "d") if in_shard(n, (1, 3))}
+        after = {n for n in ("a", "b", "c", "d", "e", "f") if in_shard(n, (1, 3))}
+        self.assertEqual(before, after & {"a", "b", "c", "d"})
+
+
+class IterAccountsTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {ENV: ""})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for suffix in ("_FILE", "_VAULT"):
+            os.environ.pop(ENV + suffix, None)
+
+    def test_parses_and_reports_invalid_lines(self):
+        os.environ[ENV] = "# 注释\n\na@x.com:p:w\nbroken\n:nopass\nb@x.com: q \n"
+        errors = []
+        accounts = list(iter_accounts(ENV, on_invalid=errors.append))
+        self.assertEqual([tuple(a) for a in accounts], [("a@x.com", "p:w"), ("b@x.com", "q")])
+        self.assertEqual(len(errors), 2)
+        self.assertTrue(all("broken" not in e and "nopass" not in e for e in errors))  # 不泄露行内容
+
+    def test_custom_separator(self):
+        os.environ[ENV] = "user----pass"
+        self.assertEqual([tuple(a) for a in iter_accounts(ENV, sep="----")], [("user", "pass")])
+
+    def test_file_source_and_shard(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="utf-8") as f:
+            f.write("\n".join(f"u{i}:p{i}" for i in range(30)))
+        self.addCleanup(os.unlink, f.name)
+        os.environ[ENV + "_FILE"] = f.name
+        parts = [{a.name for a in load_accounts(ENV, shard=(i, 3))} for i in (1, 2, 3)]
+        self.assertEqual(set().union(*parts), {f"u{i}" for i in range(30)})
+        self.assertEqual(sum(len(p) for p in parts), 30)
+
+    def test_account_read_only(self):
+        account = Account("a:b", 1)
+        with self.assertRaises(AttributeError):
+            account.name = "c"
+        self.assertNotIn("b", repr(account))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from common.daemon import load_env_file, parse_duration
+
+
+class ParseDurationTest(unittest.TestCase):
+    def test_units(self):
+        self.assertEqual(parse_duration("90"), 90)
+        self.assertEqual(parse_duration("30s"), 30)
+        self.assertEqual(parse_duration("15m"), 900)
+        self.assertEqual(parse_duration(" 6H "), 6 * 3600)
+        self.assertEqual(parse_duration("1.5d"), 1.5 * 86400)
+
+    def test_invalid(self):
+        for text in ("", "m", "abc", "5w"):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                parse_duration(text)
+
+
+class LoadEnvFileTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def load(self, content):
+        with tempfile.NamedTemporaryFile("w", suffix=".env", delete=False, encoding="utf-8") as f:
+            f.write(content)
+        self.addCleanup(os.unlink, f.name)
+        load_env_file(f.name)
+
+    def test_parses_lines(self):
+        self.load(
+            "# 注释\n"
+            "\n"
+            "DAEMON_TEST_A=1\n"
+            "export DAEMON_TEST_B = two words \n"
+            "DAEMON_TEST_C=\"quoted = value\"\n"
+            "DAEMON_TEST_D='x'\n"
+            "DAEMON_TEST_E=a=b\n"
+            "not a setting\n"
+        )
+        self.assertEqual(os.environ["DAEMON_TEST_A"], "1")
+        self.assertEqual(os.environ["DAEMON_TEST_B"], "two words")
+        self.assertEqual(os.environ["DAEMON_TEST_C"], "quoted = value")
+        self.assertEqual(os.environ["DAEMON_TEST_D"], "x")
+        self.assertEqual(os.environ["DAEMON_TEST_E"], "a=b")
+
+    def test_overrides_existing(self):
+        os.environ["DAEMON_TEST_A"] = "old"
+        self.load("DAEMON_TEST_A=new\n")
+        self.assertEqual(os.environ["DAEMON_TEST_A"], "new")
+
+    def test_unbalanced_quote_kept(self):
+        self.load("DAEMON_TEST_A=\"x\n")
+        self.assertEqual(os.environ["DAEMON_TEST_A"], "\"x")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+from common.notify import split_message, utf16_len
+
+
+class Utf16LenTest(unittest.TestCase):
+    def test_counts_code_units(self):
+        self.assertEqual(utf16_len("abc"), 3)
+        self.assertEqual(utf16_len("签到"), 2)
+        self.assertEqual(utf16_len("✅"), 1)   # BMP 内
+        self.assertEqual(utf16_len("🎉"), 2)   # BMP 之外占两个码元
+        self.assertEqual(utf16_len(""), 0)
+
+
+class SplitMessageTest(unittest.TestCase):
+    def test_short_message_unchanged(self):
+        self.assertEqual(split_message("a\nb", limit=10), ["a\nb"])
+
+    def test_splits_on_line_boundaries(self):
+        text = "\n".join(["aaaa", "bbbb", "cccc"])
+        self.assertEqual(split_message(text, limit=9), ["aaaa\nbbbb", "cccc"])
+
+    def test_chunks_within_limit_and_lossless(self):
+        text = "\n".join(f"🎉 第 {i} 行 " + "x" * (i % 7) for i in range(200))
+        chunks = split_message(text, limit=100)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(utf16_len(c) <= 100 for c in chunks))
+        self.assertEqual("\n".join(chunks), text)
+
+    def test_hard_split_keeps_surrogate_pairs(self):
+        text = "🎉" * 5  # 10 个码元
+        chunks = split_message(text, limit=3)
+        self.assertEqual(chunks, ["🎉", "🎉", "🎉", "🎉", "🎉"])
+        self.assertTrue(all(utf16_len(c) <= 3 for c in chunks))
+
+    def test_long_line_between_short_lines(self):
+        text = "head\n" + "x" * 25 + "\ntail"
+        chunks = split_message(text, limit=10)
+        self.assertTrue(all(utf16_len(c) <= 10 for c in chunks))
+        self.assertEqual("".join(chunks).replace("\n", ""), text.replace("\n", ""))
+
+
+if __name__ == "__main__":
+    unittest.main()
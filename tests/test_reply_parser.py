@@ -0,0 +1,67 @@
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tg-checkin"))
+
+from reply_corpus import CORPUS  # noqa: E402
+from reply_parser import Field, ReplySpec  # noqa: E402
+
+
+class ParseEquivalenceTest(unittest.TestCase):
+    def assertSame(self, spec, text, only=None):
+        a, b = spec.parse(text, only), spec.parse_each(text, only)
+        self.assertEqual(a.values, b.values)
+        self.assertEqual(a.matched, b.matched)
+
+    def test_corpus(self):
+        for spec, text, only in CORPUS:
+            with self.subTest(spec=spec.name, text=text[:30]):
+                self.assertSame(spec, text, only)
+                self.assertSame(spec, text)  # 不限字段时也一致
+
+    def test_empty_and_unrelated_text(self):
+        for spec in dict.fromkeys(spec for spec, _, _ in CORPUS):
+            with self.subTest(spec=spec.name):
+                self.assertSame(spec, "")
+                self.assertSame(spec, "机器人维护中，请稍后再试")
+
+
+def small_balance(value):
+    if int(value) >= 100:
+        raise ValueError(value)
+    return int(value)
+
+
+class ReplySpecTest(unittest.TestCase):
+    SPEC = ReplySpec("test", [
+        Field("total", r"当前积分\D*(\d+)", int),
+        Field("gained", r"获得积分\D*(\d+)", lambda v: f"{v}分"),
+        Field("days", r"(\d+)\s*days?", int, ignore_case=True),
+        Field("flag", r"签到成功"),
+        Field("bad", r"余额\D*(\d+)", small_balance),
+    ])
+
+    def test_values_and_order(self):
+        parsed = self.SPEC.parse("签到成功\n获得积分: 5\n当前积分: 230\n3 DAYS")
+        self.assertEqual(parsed.values, {"flag": "签到成功", "gained": "5分", "total": 230, "days": 3})
+        self.assertEqual(parsed.matched, ("flag", "gained", "total", "days"))
+        self.assertIn("total", parsed)
+        self.assertEqual(parsed.get("missing", "未知"), "未知")
+
+    def test_only(self):
+        parsed = self.SPEC.parse("获得积分: 5\n当前积分: 230", only={"total"})
+        self.assertEqual(parsed.values, {"total": 230})
+
+    def test_normalize_value_error_is_miss(self):
+        self.assertNotIn("bad", self.SPEC.parse("余额 500"))
+        self.assertEqual(self.SPEC.parse("余额 50").get("bad"), 50)
+
+    def test_invalid_pattern_fails_early(self):
+        with self.assertRaises(re.error):
+            ReplySpec("broken", [Field("x", r"(unclosed")])
+
+
+if __name__ == "__main__":
+    unittest.main()
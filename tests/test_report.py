@@ -0,0 +1,66 @@
+import unittest
+
+from common.notify import utf16_len
+from common.report import Raw, Renderer, Result
+
+
+class RendererEscapeTest(unittest.TestCase):
+    def test_markdown_escapes_arguments_only(self):
+        r = Renderer("Markdown")
+        self.assertEqual(r.fmt("*{}*", "a_b*c`d[e"), "*a\\_b\\*c\\`d\\[e*")
+
+    def test_html_escapes_arguments_only(self):
+        r = Renderer("HTML")
+        self.assertEqual(r.fmt("<b>{}</b>", "<x> & y"), "<b>&lt;x&gt; &amp; y</b>")
+
+    def test_plain_text_unchanged(self):
+        self.assertEqual(Renderer().fmt("{} {}", "a_b", "<c>"), "a_b <c>")
+
+    def test_raw_not_escaped(self):
+        r = Renderer("Markdown")
+        self.assertEqual(r.fmt("{}", Raw("*bold*")), "*bold*")
+        self.assertEqual(r.fmt("账户: {}", r.code("u_1")), "账户: `u_1`")
+
+    def test_code(self):
+        self.assertEqual(Renderer("Markdown").code("a`b"), "`a'b`")
+        self.assertEqual(Renderer("HTML").code("a<b"), "<code>a&lt;b</code>")
+        self.assertEqual(Renderer().code(42), "42")
+
+    def test_format_spec_applied_before_escape(self):
+        self.assertEqual(Renderer("Markdown").fmt("{:.1f}", 3.14159), "3.1")
+
+
+class RendererChunksTest(unittest.TestCase):
+    def test_single_chunk(self):
+        self.assertEqual(list(Renderer(limit=100).chunks("head", ["a", "b"])), ["head\na\nb"])
+
+    def test_splits_on_entry_boundaries(self):
+        lines = [f"entry {i:02d}" for i in range(20)]
+        chunks = list(Renderer(limit=40).chunks("head", lines))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(utf16_len(c) <= 40 for c in chunks))
+        self.assertEqual("\n".join(chunks).split("\n"), ["head"] + lines)
+
+    def test_oversized_entry_split_by_lines(self):
+        entry = "\n".join(["line"] * 20)
+        chunks = list(Renderer(limit=30).chunks("", ["short", entry]))
+        self.assertEqual(chunks[0], "short")
+        self.assertTrue(all(utf16_len(c) <= 30 for c in chunks))
+
+    def test_empty(self):
+        self.assertEqual(list(Renderer().chunks("", [])), [])
+
+
+class ResultTest(unittest.TestCase):
+    def test_round_trip(self):
+        res = Result("a@x.com", True, "成功", "还剩 3 天", {"days": 3})
+        back = Result.from_dict(res.to_dict())
+        self.assertEqual(back.to_dict(), res.to_dict())
+
+    def test_skipped(self):
+        self.assertTrue(Result("a", True, "跳过").skipped)
+        self.assertFalse(Result("a", True, "成功").skipped)
+
+
+if __name__ == "__main__":
+    unittest.main()
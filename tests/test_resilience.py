@@ -0,0 +1,118 @@
+import unittest
+from unittest import mock
+
+from common import resilience
+from common.resilience import CircuitBreaker, CircuitOpenError, Retry, TransientError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch.object(resilience.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(threshold=3, cooldown=60)
+
+    def test_opens_after_threshold(self):
+        self.assertFalse(self.breaker.failure("h"))
+        self.assertFalse(self.breaker.failure("h"))
+        self.assertTrue(self.breaker.failure("h"))  # 只有第一次触发熔断时返回 True
+        self.assertFalse(self.breaker.failure("h"))
+        self.assertTrue(self.breaker.is_open("h"))
+        self.assertFalse(self.breaker.allow("h"))
+        self.assertTrue(self.breaker.allow("other"))
+
+    def test_success_resets_count(self):
+        self.breaker.failure("h")
+        self.breaker.failure("h")
+        self.breaker.success("h")
+        self.assertFalse(self.breaker.failure("h"))
+        self.assertFalse(self.breaker.is_open("h"))
+
+    def test_half_open_allows_one_probe(self):
+        for _ in range(3):
+            self.breaker.failure("h")
+        self.clock.now += 61
+        self.assertFalse(self.breaker.is_open("h"))
+        self.assertTrue(self.breaker.allow("h"))   # 冷却后放行一次试探
+        self.assertFalse(self.breaker.allow("h"))  # 试探期间其它请求仍被拦下
+        self.breaker.success("h")
+        self.assertTrue(self.breaker.allow("h"))
+
+    def test_failed_probe_reopens(self):
+        for _ in range(3):
+            self.breaker.failure("h")
+        self.clock.now += 61
+        self.assertTrue(self.breaker.allow("h"))
+        self.breaker.failure("h")
+        self.assertTrue(self.breaker.is_open("h"))
+        self.clock.now += 30
+        self.assertFalse(self.breaker.allow("h"))
+
+    def test_summary_counts_short_circuits(self):
+        for _ in range(3):
+            self.breaker.failure("h")
+        self.breaker.allow("h")
+        self.breaker.allow("h")
+        self.assertEqual(self.breaker.summary(), "h 熔断后跳过 2 次请求")
+
+    def test_zero_threshold_disables(self):
+        breaker = CircuitBreaker(threshold=0)
+        for _ in range(10):
+            self.assertFalse(breaker.failure("h"))
+        self.assertTrue(breaker.allow("h"))
+
+
+class RetryTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(resilience.time, "sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retries_transient_then_succeeds(self):
+        func = mock.Mock(side_effect=[TransientError("503", 503), TransientError("503", 503), "ok"])
+        self.assertEqual(Retry(attempts=3, log=lambda msg: None).call("h", func), "ok")
+        self.assertEqual(func.call_count, 3)
+        self.assertEqual(self.sleep.call_count, 2)
+
+    def test_gives_up_after_attempts(self):
+        func = mock.Mock(side_effect=TransientError("503", 503))
+        with self.assertRaises(TransientError):
+            Retry(attempts=2, log=lambda msg: None).call("h", func)
+        self.assertEqual(func.call_count, 2)
+
+    def test_permanent_error_not_retried_and_resets_breaker(self):
+        breaker = CircuitBreaker(threshold=2)
+        breaker.failure("h")
+        func = mock.Mock(side_effect=ValueError("bad"))
+        with self.assertRaises(ValueError):
+            Retry(breaker, attempts=3, log=lambda msg: None).call("h", func)
+        self.assertEqual(func.call_count, 1)
+        self.assertNotIn("h", breaker.failures)
+
+    def test_stops_when_breaker_opens(self):
+        breaker = CircuitBreaker(threshold=2, cooldown=60)
+        func = mock.Mock(side_effect=TransientError("503", 503))
+        with self.assertRaises(TransientError):
+            Retry(breaker, attempts=5, log=lambda msg: None).call("h", func)
+        self.assertEqual(func.call_count, 2)
+        with self.assertRaises(CircuitOpenError):
+            Retry(breaker, attempts=5, log=lambda msg: None).call("h", func)
+        self.assertEqual(func.call_count, 2)
+
+    def test_retry_after_extends_delay(self):
+        func = mock.Mock(side_effect=[TransientError("429", 429, retry_after=7), "ok"])
+        Retry(attempts=2, log=lambda msg: None).call("h", func)
+        self.assertGreaterEqual(self.sleep.call_args[0][0], 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
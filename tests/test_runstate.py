@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from common import runstate
+from common.runstate import RunState, describe_age
+
+
+class RunStateTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "run_state.json")
+        patcher = mock.patch.dict(os.environ)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        os.environ.pop("RUN_STATE_FILE", None)
+
+    def test_fresh_within_window(self):
+        state = RunState(self.path)
+        self.assertFalse(state.fresh("a", 3600))
+        state.record("a", True, "成功")
+        self.assertTrue(state.fresh("a", 3600))
+        self.assertFalse(state.fresh("a", 0))  # 0 表示不跳过
+
+    def test_failure_does_not_refresh(self):
+        state = RunState(self.path)
+        state.record("a", False, "失败")
+        self.assertFalse(state.fresh("a", 3600))
+        self.assertIsNone(state.age("a"))
+
+    def test_stale_after_window(self):
+        state = RunState(self.path)
+        state.record("a", True)
+        with mock.patch.object(runstate.time, "time", return_value=runstate.time.time() + 7200):
+            self.assertFalse(state.fresh("a", 3600))
+            self.assertTrue(state.fresh("a", 3 * 3600))
+
+    def test_run_force_ignores_state(self):
+        state = RunState(self.path)
+        state.record("a", True)
+        with mock.patch.object(runstate, "RUN_FORCE", True):
+            self.assertFalse(state.fresh("a", 3600))
+            self.assertFalse(state.done_today("a"))
+
+    def test_done_today(self):
+        state = RunState(self.path)
+        self.assertFalse(state.done_today("a"))
+        state.record("a", True)
+        self.assertTrue(state.done_today("a"))
+
+    def test_save_and_reload_hashes_names(self):
+        state = RunState(self.path)
+        state.record("someone@example.com", True, "成功", {"days": 3})
+        state.save()
+        with open(self.path, encoding="utf-8") as f:
+            raw = f.read()
+        self.assertNotIn("someone@example.com", raw)
+        self.assertEqual(len(json.loads(raw)), 1)
+        reloaded = RunState(self.path)
+        self.assertEqual(reloaded.get("someone@example.com")["data"], {"days": 3})
+        self.assertTrue(reloaded.fresh("someone@example.com", 60))
+
+    def test_corrupt_file_starts_empty(self):
+        with open(self.path, "w") as f:
+            f.write("{not json")
+        self.assertEqual(RunState(self.path).entries, {})
+
+    def test_env_overrides_path(self):
+        other = os.path.join(self.dir.name, "other.json")
+        os.environ["RUN_STATE_FILE"] = other
+        self.assertEqual(RunState(self.path).path, other)
+
+
+class DescribeAgeTest(unittest.TestCase):
+    def test_units(self):
+        self.assertEqual(describe_age(120), "2 分钟前")
+        self.assertEqual(describe_age(5400), "1.5 小时前")
+        self.assertEqual(describe_age(86400 * 2), "2.0 天前")
+        self.assertEqual(describe_age(-5), "0 分钟前")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,13 +1,20 @@
 import os
-import re
 import sys
+import time
 import asyncio
-import requests  # type: ignore
 import traceback
 from telethon import TelegramClient
 from telethon.tl.custom.message import Message
 from telethon.sessions import StringSession
-from typing import Dict, Any, Tuple
+from typing import Dict, Tuple
+from reply_waiter import ReplyWaiter
+from reply_parser import Field, ReplySpec
+import entity_cache
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 仓库根目录，用于导入 common
+from common import trace
+from common.metrics import Metrics
+from common.notify import get_notifier
+from common.report import Raw, Renderer
 
 # Windows事件循环策略，兼容win系统运行
 if sys.platform == 'win32':
@@ -21,7 +28,9 @@ TG_BOT_TOKEN = os.getenv('TG_BOT_TOKEN')      # 你的通知机器人 Token
 TG_CHAT_ID = os.getenv('TG_CHAT_ID')          # 你的个人或群组 Chat ID
 TG_CHANNEL = '@cloudcatgroup'                 # 签到目标频道名, 格式: @username
 TARGET_BOT_USERNAME = '@CloudCatOfficialBot'  # 签到机器人用户名, 格式: @username
-CHECK_WAIT_TIME = 10                          # 等待机器人回复的时间（秒）
+CHECK_WAIT_TIME = 10                          # 等待机器人回复的最长时间（秒），收到签到结果即返回
+SUCCESS_KEYWORDS = ['成功', 'successful']                          # 签到成功的回复关键词
+SIGNED_KEYWORDS = ['已经签到过了', '今天已经签到', '今日已签到']      # 今日已签到的回复关键词
 DEFAULT_GAINED_POINTS = "未知"                # 获得积分的默认值
 DEFAULT_TOTAL_POINTS = "未知"                 # 当前总分的默认值
 # ============================================
@@ -39,75 +48,140 @@ def log(color: str, symbol: str, message: str):
     print(f"{COLORS[color]}{SYMBOLS[symbol]} {message}{COLORS['reset']}")
 
 
-# 发送 Telegram 消息通知模板
-def send_tg_notification(status: str, gained: str, total: str):
+# 签到结果通知模板
+def build_notification(result: Dict[str, str]) -> str:
+    status = result['status']
+    channel_link = TG_CHANNEL.replace('@', 't.me/') if TG_CHANNEL.startswith('@') else TG_CHANNEL  # 构造频道链接
+    status_emoji = "✅" if status == "成功" else ("ℹ️" if status == "今日已签到" else "❌")  # 状态 Emoji
+    r = Renderer("Markdown")  # 机器人回复中解析出的内容需要转义，避免 Markdown 解析失败
+    return r.fmt(
+        "🎉 *Cloud Cat 签到通知* 🎉\n"
+        "====================\n"
+        "{} 状态: {}\n"
+        "📢 频道: [{}]({})\n"
+        "📌 今日签到积分: {}\n"
+        "📊 您的总积分: {}",
+        status_emoji, status, TG_CHANNEL, Raw(channel_link), result['gained'], result['total']
+    )
+
+
+# 签到是否成功（含今日已签到）
+def is_success(result: Dict[str, str]) -> bool:
+    return not any(k in result['status'] for k in ["失败", "错误"])
+
+
+# 发送 Telegram 消息通知
+def send_tg_notification(notification_text: str):
     if not (TG_BOT_TOKEN and TG_CHAT_ID):
         log('yellow', 'warning', "未设置 TG_BOT_TOKEN 或 TG_CHAT_ID，跳过通知")
         return
 
-    channel_link = TG_CHANNEL.replace('@', 't.me/') if TG_CHANNEL.startswith('@') else TG_CHANNEL  # 构造频道链接
-    status_emoji = "✅" if status == "成功" else ("ℹ️" if status == "今日已签到" else "❌")  # 状态 Emoji
-    notification_text = (
-        f"🎉 *Cloud Cat 签到通知* 🎉\n"
-        f"====================\n"
-        f"{status_emoji} 状态: {status}\n"
-        f"📢 频道: [{TG_CHANNEL}]({channel_link})\n"
-        f"📌 今日签到积分: {gained}\n"
-        f"📊 您的总积分: {total}"
-    )
+    get_notifier().send(notification_text, parse_mode='Markdown')
 
-    url = f"https://api.telegram.org/bot{TG_BOT_TOKEN}/sendMessage"
-    payload: Dict[str, Any] = {
-        'chat_id': TG_CHAT_ID,
-        'text': notification_text,
-        'parse_mode': 'Markdown'
-    }
 
-    try:
-        requests.post(url, data=payload, timeout=10).raise_for_status()
-    except requests.exceptions.RequestException as e:
-        log('red', 'error', f"Telegram 通知发送失败: {e}")
+# 机器人回复的字段表：签到成功的回复与 /points 的回复格式不同，各编译一次
+def _stars(value: str) -> str:
+    return f"{value} ⭐"
+
+
+def _int_stars(value: str) -> str:
+    return f"{int(float(value))} ⭐"
+
 
+CHECKIN_REPLY = ReplySpec('cloudcat.checkin', [
+    Field('gained', r'(?:获得|you got)\s*(\d+\.?\d*)\s?⭐', _stars, ignore_case=True),
+    Field('total', r'(?:当前积分[:：]|current points:\s*)(\d+\.?\d*)\s?⭐', _int_stars, ignore_case=True),
+])
+POINTS_REPLY = ReplySpec('cloudcat.points', [
+    Field('gained', r'CheckInAddPoint[:：]\s*(\d+\.?\d*)\s*⭐?', _stars, ignore_case=True),
+    Field('total', r'(?:当前积分[:：]|current points[:：]\s*)(\d+\.?\d*)', _int_stars, ignore_case=True),
+])
 
-# 解析今日签到积分和总积分
+
+# 解析今日签到积分和总积分（今日已签到时解析 /points 的回复）
 def parse_points_from_message(message_text: str, is_points_command_reply: bool) -> Tuple[str, str]:
-    gained_points = DEFAULT_GAINED_POINTS
-    total_points = DEFAULT_TOTAL_POINTS
+    parsed = (POINTS_REPLY if is_points_command_reply else CHECKIN_REPLY).parse(message_text)
+    return parsed.get('gained', DEFAULT_GAINED_POINTS), parsed.get('total', DEFAULT_TOTAL_POINTS)
 
-    # 今日已签到的情况
-    if is_points_command_reply:
-        gained_match = re.search(r'CheckInAddPoint[:：]\s*(\d+\.?\d*)\s*⭐?', message_text, re.IGNORECASE)
-        total_match = re.search(r'(?:当前积分[:：]|current points[:：]\s*)(\d+\.?\d*)', message_text, re.IGNORECASE)
-    # 今日未签到的情况
-    else:
-        gained_match = re.search(r'(?:获得|you got)\s*(\d+\.?\d*)\s?⭐', message_text, re.IGNORECASE)
-        total_match = re.search(r'(?:当前积分[:：]|current points:\s*)(\d+\.?\d*)\s?⭐', message_text, re.IGNORECASE)
 
-    if gained_match:
-        gained_points = f"{gained_match.group(1)} ⭐"
-    if total_match:
-        try:
-            total_points = f"{int(float(total_match.group(1)))} ⭐"
-        except ValueError:
-            pass
+def is_checkin_result(text: str) -> bool:
+    return any(keyword in text for keyword in SUCCESS_KEYWORDS + SIGNED_KEYWORDS)
+
+
+def is_points_result(text: str) -> bool:
+    return 'total' in POINTS_REPLY.parse(text, only={'total'})
+
 
-    return gained_points, total_points
+# 等待并获取目标机器人最新回复（match 判断回复是否为最终结果，跳过“处理中”之类的中间消息）
+async def get_bot_reply(waiter: ReplyWaiter, min_id: int = 0, match=None) -> Message | None:
+    log('cyan', 'arrow', f"等待机器人回复（最长 {CHECK_WAIT_TIME} 秒）...")
+    msg = await waiter.wait(min_id=min_id, timeout=CHECK_WAIT_TIME, match=match)
+    if msg:
+        log('green', 'check', f"找到来自 {TARGET_BOT_USERNAME} 的回复")
+    return msg
+
+
+# 签到流程（插件入口），client 需已连接并授权，多个签到可共用同一连接
+@trace.traced("cloudcat.run")
+async def run(client: TelegramClient) -> Dict[str, str]:
+    status = "失败"
+    gained_points = DEFAULT_GAINED_POINTS
+    total_points = DEFAULT_TOTAL_POINTS
+
+    # 签到逻辑：先发送 /checkin，成功则直接获取积分；若为“已签到”则发送 /points 获取积分
+    try:
+        # 获取频道对象（优先使用本地实体缓存，避免每次 ResolveUsername）
+        channel_entity = await entity_cache.resolve(client, TG_CHANNEL)
+        log('cyan', 'arrow', f"已成功连接频道：{TG_CHANNEL}")
 
+        # 动态获取机器人 ID
+        target_bot_entity = await entity_cache.resolve(client, TARGET_BOT_USERNAME)
+        current_bot_id = entity_cache.peer_id(target_bot_entity)
+        log('green', 'check', f"已成功获取签到机器人ID: {current_bot_id}")
+        
+        # 先注册回复监听，再发送指令
+        async with ReplyWaiter(client, channel_entity, current_bot_id) as waiter:
+            # 发送签到指令 /checkin
+            log('cyan', 'arrow', "发送 /checkin 签到")
+            channel_entity, sent_msg = await entity_cache.send_message(client, TG_CHANNEL, channel_entity, '/checkin')
+
+            # 获取机器人回复
+            reply = await get_bot_reply(waiter, min_id=sent_msg.id, match=is_checkin_result)
+            if reply and reply.text:
+                log('green', 'check', f"收到 /checkin 回复，内容:\n{reply.text}")
+
+                # 检查是否签到成功
+                if any(keyword in reply.text for keyword in SUCCESS_KEYWORDS):
+                    status = "成功"
+                    log('green', 'check', "签到成功")
+                    gained_points, total_points = parse_points_from_message(reply.text, False)
+
+                # 检查是否已签到
+                elif any(keyword in reply.text for keyword in SIGNED_KEYWORDS):
+                    status = "今日已签到"
+                    log('yellow', 'warning', "今日已签到，发送 /points 获取积分详情")
+                    sent_points_msg = await client.send_message(channel_entity, '/points')
+                
+                    points_reply = await get_bot_reply(waiter, min_id=sent_points_msg.id, match=is_points_result)
+                    if points_reply and points_reply.text:
+                        log('green', 'check', f"收到 /points 回复，内容:\n{points_reply.text}")
+                        gained_points, total_points = parse_points_from_message(points_reply.text, True)
+                    else:
+                        log('red', 'error', "发送 /points 后未收到机器人回复")
+                else:
+                    status = "失败"
+                    log('red', 'error', "未找到预期的签到成功或已签到关键词")
+            else:
+                status = "失败"
+                log('red', 'error', "发送 /checkin 后未收到机器人回复")
 
-# 等待并获取目标机器人最新回复
-async def get_bot_reply(client: TelegramClient, channel_entity: Any, check_limit: int, target_bot_id: int, min_id: int = 0) -> Message | None:
-    log('cyan', 'arrow', f"等待 {CHECK_WAIT_TIME} 秒后查找机器人回复...")
-    await asyncio.sleep(CHECK_WAIT_TIME)
-    
-    log('cyan', 'arrow', f"开始查找最近 {check_limit} 条消息...")
-    message_count = 0
+    except Exception as e:
+        traceback.print_exc()
+        err_msg = f"严重错误: {type(e).__name__} - {str(e)}"
+        log('red', 'error', err_msg)
+        status = "错误"
 
-    async for msg in client.iter_messages(channel_entity, limit=check_limit):
-        if isinstance(msg, Message) and msg.sender_id == target_bot_id:
-            if msg.id > min_id:
-                log('green', 'check', f"找到来自 {TARGET_BOT_USERNAME} 的回复")
-                return msg
-    return None
+    return {'status': status, 'gained': gained_points, 'total': total_points}
 
 
 async def check_in():
@@ -127,78 +201,36 @@ async def check_in():
         sys.exit(1)
 
     log('cyan', 'arrow', "启动 TG 并尝试登录")
-    status = "失败"
-    gained_points = DEFAULT_GAINED_POINTS
-    total_points = DEFAULT_TOTAL_POINTS
-    check_limit = 30  # 消息查找范围
+    metrics = Metrics('tg-checkin-cloudcat')
+    result = {'status': "失败", 'gained': DEFAULT_GAINED_POINTS, 'total': DEFAULT_TOTAL_POINTS}
 
-    # 签到逻辑：先发送 /checkin，成功则直接获取积分；若为“已签到”则发送 /points 获取积分
     try:
         await client.connect()
         if not await client.is_user_authorized():
             log('red', 'error', "tg_session 已失效, 请更新环境变量 TG_SESSION_STR")
             return
-
-        # 获取频道对象
-        channel_entity = await client.get_entity(TG_CHANNEL)
-        log('cyan', 'arrow', f"已成功连接频道：{channel_entity.title}")
-
-        # 动态获取机器人 ID
-        target_bot_entity = await client.get_entity(TARGET_BOT_USERNAME)
-        current_bot_id = target_bot_entity.id
-        log('green', 'check', f"已成功获取签到机器人ID: {current_bot_id}")
-        
-        # 发送签到指令 /checkin
-        log('cyan', 'arrow', "发送 /checkin 签到")
-        sent_msg = await client.send_message(channel_entity, '/checkin')
-
-        # 获取机器人回复
-        reply = await get_bot_reply(client, channel_entity, check_limit, current_bot_id, min_id=sent_msg.id)
-        if reply and reply.text:
-            log('green', 'check', f"收到 /checkin 回复，内容:\n{reply.text}")
-
-            # 检查是否签到成功
-            if any(keyword in reply.text for keyword in ['成功', 'successful']):
-                status = "成功"
-                log('green', 'check', "签到成功")
-                gained_points, total_points = parse_points_from_message(reply.text, False)
-
-            # 检查是否已签到
-            elif any(keyword in reply.text for keyword in ['已经签到过了', '今天已经签到', '今日已签到']):
-                status = "今日已签到"
-                log('yellow', 'warning', "今日已签到，发送 /points 获取积分详情")
-                sent_points_msg = await client.send_message(channel_entity, '/points')
-                
-                points_reply = await get_bot_reply(client, channel_entity, check_limit, current_bot_id, min_id=sent_points_msg.id)
-                if points_reply and points_reply.text:
-                    log('green', 'check', f"收到 /points 回复，内容:\n{points_reply.text}")
-                    gained_points, total_points = parse_points_from_message(points_reply.text, True)
-                else:
-                    log('red', 'error', "发送 /points 后未收到机器人回复")
-            else:
-                status = "失败"
-                log('red', 'error', "未找到预期的签到成功或已签到关键词")
-        else:
-            status = "失败"
-            log('red', 'error', "发送 /checkin 后未收到机器人回复")
+        result = await run(client)
 
     except Exception as e:
         traceback.print_exc()
         err_msg = f"严重错误: {type(e).__name__} - {str(e)}"
         log('red', 'error', err_msg)
-        status = "错误"
+        result['status'] = "错误"
     finally:
         if client.is_connected():
             await client.disconnect()
             log('cyan', 'arrow', "连接已安全断开")
         # === 最终通知 ===
-        send_tg_notification(status, gained_points, total_points)
+        send_tg_notification(build_notification(result))
         log('green', 'check', "任务执行完毕! 结果统计：")
-        log('cyan', 'arrow', f"最终状态: {status}")
-        log('cyan', 'arrow', f"今日获得: {gained_points}")
-        log('cyan', 'arrow', f"当前总分: {total_points}")
+        log('cyan', 'arrow', f"最终状态: {result['status']}")
+        log('cyan', 'arrow', f"今日获得: {result['gained']}")
+        log('cyan', 'arrow', f"当前总分: {result['total']}")
+
+        metrics.account('CloudCat', is_success(result), time.time() - metrics.start, detail=result['status'])
+        metrics.write()
 
-        if any(k in status for k in ["失败", "错误"]):
+        if not is_success(result):
             sys.exit(1)
 
 if __name__ == '__main__':
@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+import time
+from telethon import TelegramClient, errors, types, utils
+from telethon.tl.custom.message import Message
+from typing import Any, Dict, Optional, Tuple
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 仓库根目录，用于导入 common
+from common import trace
+
+# ================= 配置区域 =================
+ENTITY_CACHE_FILE = os.getenv('TG_ENTITY_CACHE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'entity_cache.json'))
+ENTITY_CACHE_TTL = int(os.getenv('TG_ENTITY_TTL', str(7 * 24 * 3600)))  # 缓存有效期（秒），过期后重新解析用户名
+# ============================================
+
+# 缓存的 peer 被服务器拒绝时抛出的异常，遇到后应调用 resolve(..., refresh=True) 重新解析
+REJECTED_ERRORS = (
+    errors.PeerIdInvalidError,
+    errors.ChannelInvalidError,
+    errors.ChannelPrivateError,
+    errors.UserIdInvalidError,
+)
+
+_PEER_TYPES = {
+    'user': lambda e: types.InputPeerUser(e['id'], e['access_hash']),
+    'channel': lambda e: types.InputPeerChannel(e['id'], e['access_hash']),
+    'chat': lambda e: types.InputPeerChat(e['id']),
+}
+
+_entries: Optional[Dict[str, Dict[str, Any]]] = None
+
+
+def _load() -> Dict[str, Dict[str, Any]]:
+    global _entries
+    if _entries is None:
+        try:
+            with open(ENTITY_CACHE_FILE, 'r', encoding='utf-8') as f:
+                _entries = json.load(f)
+        except (OSError, ValueError):
+            _entries = {}
+    return _entries
+
+
+def _save():
+    tmp = f"{ENTITY_CACHE_FILE}.tmp"
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(_load(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp, ENTITY_CACHE_FILE)
+    except OSError:
+        pass
+
+
+def _encode(peer: Any) -> Optional[Dict[str, Any]]:
+    if isinstance(peer, types.InputPeerUser):
+        return {'type': 'user', 'id': peer.user_id, 'access_hash': peer.access_hash}
+    if isinstance(peer, types.InputPeerChannel):
+        return {'type': 'channel', 'id': peer.channel_id, 'access_hash': peer.access_hash}
+    if isinstance(peer, types.InputPeerChat):
+        return {'type': 'chat', 'id': peer.chat_id, 'access_hash': 0}
+    return None
+
+
+@trace.traced("tg.resolve", username="username")
+async def resolve(client: TelegramClient, username: str, refresh: bool = False) -> Any:
+    """
+    返回 username 对应的 InputPeer。缓存未过期时直接使用缓存的 id 与 access_hash，不发起 ResolveUsername；
+    refresh=True 时忽略缓存并重新解析
+    """
+    key = username.lstrip('@').lower()
+    entries = _load()
+    entry = entries.get(key)
+    if entry and not refresh and time.time() - entry.get('saved_at', 0) < ENTITY_CACHE_TTL:
+        return _PEER_TYPES[entry['type']](entry)
+
+    peer = await client.get_input_entity(username)
+    encoded = _encode(peer)
+    if encoded:
+        encoded['saved_at'] = int(time.time())
+        entries[key] = encoded
+        _save()
+    return peer
+
+
+def peer_id(peer: Any) -> int:
+    """InputPeer 对应的 ID，用户即 user_id，可直接与 sender_id 比较"""
+    return utils.get_peer_id(peer)
+
+
+@trace.traced("tg.send", text="text")
+async def send_message(client: TelegramClient, username: str, peer: Any, text: str) -> Tuple[Any, Message]:
+    """
+    向缓存的 peer 发送消息；若缓存已被服务器拒绝，则重新解析用户名后重试一次。
+    返回 (实际使用的 peer, 已发送的消息)
+    """
+    try:
+        return peer, await client.send_message(peer, text)
+    except REJECTED_ERRORS:
+        peer = await resolve(client, username, refresh=True)
+        return peer, await client.send_message(peer, text)
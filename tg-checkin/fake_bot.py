@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import importlib
+from telethon import events, types, utils
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+# 离线模拟的 Telethon 客户端：实现签到插件用到的接口（解析用户名、发消息、事件监听、点按钮、历史消息），
+# 机器人回复来自 reply_corpus.py 中的样例，可注入回复延迟与不回复，用于不连接 Telegram 的运行与计时
+class FakeMessage:
+    def __init__(self, client: 'FakeClient', chat_id: int, msg_id: int, sender_id: int, text: str,
+                 buttons: Optional[List[List[str]]] = None, out: bool = False):
+        self.client = client
+        self.chat_id = chat_id
+        self.id = msg_id
+        self.sender_id = sender_id
+        self.text = text
+        self.buttons = buttons
+        self.out = out
+
+    async def click(self, row: int, col: int):
+        await self.client._on_click(self, self.buttons[row][col])
+
+
+class FakeEvent:
+    def __init__(self, message: FakeMessage):
+        self.message = message
+
+
+# 机器人脚本：收到指令 -> (回复文本, 按钮)；点击按钮 -> 编辑后的文本
+Script = Dict[str, Any]
+
+
+def default_bots() -> Dict[str, Tuple[int, Optional[str], Script]]:
+    """用户名 -> (机器人 ID, 所在频道用户名（私聊为 None）, 脚本)"""
+    from reply_corpus import CORPUS
+    from cloudcat import CHECKIN_REPLY as CLOUDCAT_CHECKIN, POINTS_REPLY as CLOUDCAT_POINTS, TG_CHANNEL
+    from sheerid import POINTS_REPLY as SHEERID_POINTS
+    from icmp9 import INFO_REPLY as ICMP9_INFO
+
+    def first(spec, contains=''):
+        return next(text for s, text, _ in CORPUS if s is spec and contains in text)
+
+    return {
+        'cloudcatofficialbot': (9100001, TG_CHANNEL, {
+            '/checkin': (first(CLOUDCAT_CHECKIN), None),
+            '/points': (first(CLOUDCAT_POINTS), None),
+        }),
+        'auto_sheerid_bot': (9100002, None, {
+            '/qd': (first(SHEERID_POINTS, '签到成功'), None),
+            '/balance': (first(SHEERID_POINTS, '余额'), None),
+        }),
+        'icmp9_bot': (9100003, None, {
+            '/checkin': (first(ICMP9_INFO, '签到成功'), [['签到', '账户', '虚机']]),
+            '账户': first(ICMP9_INFO, '📊'),
+            '虚机': "🖥️ 虚拟机列表\n1. vm-hk-01 (运行中)",
+        }),
+    }
+
+
+class FakeClient:
+    def __init__(self, bots: Optional[Dict[str, Tuple[int, Optional[str], Script]]] = None,
+                 latency: float = 0.05, jitter: float = 0.0, drop_rate: float = 0.0):
+        self.bots = bots if bots is not None else default_bots()
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.handlers: List[Tuple[Callable, Any]] = []
+        self.next_id = 1000
+        self.connected = False
+        self.channels = {ch.lstrip('@').lower(): 8100000 + i
+                         for i, (_, ch, _) in enumerate(self.bots.values()) if ch}
+
+    # ---------------- 连接 ----------------
+    async def connect(self):
+        self.connected = True
+
+    async def disconnect(self):
+        self.connected = False
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    async def is_user_authorized(self) -> bool:
+        return True
+
+    # ---------------- 实体 ----------------
+    async def get_input_entity(self, username: str):
+        key = username.lstrip('@').lower()
+        if key in self.bots:
+            return types.InputPeerUser(self.bots[key][0], 1)
+        if key in self.channels:
+            return types.InputPeerChannel(self.channels[key], 1)
+        raise ValueError(f"No user has \"{username}\" as username")
+
+    def _bot_for_chat(self, chat_id: int) -> Optional[Tuple[int, Script]]:
+        for key, (bot_id, channel, script) in self.bots.items():
+            if chat_id == bot_id or (channel and chat_id == utils.get_peer_id(types.PeerChannel(self.channels[channel.lstrip('@').lower()]))):
+                return bot_id, script
+        return None
+
+    # ---------------- 消息 ----------------
+    def add_event_handler(self, callback: Callable, event: Any):
+        self.handlers.append((callback, event))
+
+    def remove_event_handler(self, callback: Callable, event: Any):
+        self.handlers = [(cb, ev) for cb, ev in self.handlers if not (cb == callback and ev is event)]
+
+    async def send_message(self, peer: Any, text: str) -> FakeMessage:
+        chat_id = utils.get_peer_id(peer)
+        self.next_id += 1
+        sent = FakeMessage(self, chat_id, self.next_id, 0, text, out=True)
+        bot = self._bot_for_chat(chat_id)
+        reply = bot[1].get(text.strip()) if bot else None
+        if reply:
+            asyncio.get_running_loop().create_task(self._reply(chat_id, bot[0], *reply))
+        return sent
+
+    async def _delay(self) -> bool:
+        await asyncio.sleep(self.latency + (random.uniform(0, self.jitter) if self.jitter else 0))
+        return random.random() >= self.drop_rate
+
+    async def _reply(self, chat_id: int, bot_id: int, text: str, buttons: Optional[List[List[str]]]):
+        if not await self._delay():
+            return
+        self.next_id += 1
+        await self._dispatch(FakeMessage(self, chat_id, self.next_id, bot_id, text, buttons), edited=False)
+
+    async def _on_click(self, message: FakeMessage, label: str):
+        bot = self._bot_for_chat(message.chat_id)
+        text = bot[1].get(label) if bot else None
+        if isinstance(text, str) and await self._delay():
+            edited = FakeMessage(self, message.chat_id, message.id, message.sender_id, text, message.buttons)
+            await self._dispatch(edited, edited=True)
+
+    async def _dispatch(self, message: FakeMessage, edited: bool):
+        for callback, event in list(self.handlers):
+            if isinstance(event, events.MessageEdited) != edited:
+                continue
+            if event.chats is not None and utils.get_peer_id(event.chats) != message.chat_id:
+                continue
+            await callback(FakeEvent(message))
+
+    async def get_messages(self, chat: Any, ids: int):
+        return None
+
+    async def iter_messages(self, chat: Any, **kwargs):
+        return
+        yield
+
+
+async def bench(targets: List[str], rounds: int, client: FakeClient) -> List[float]:
+    """每轮并发运行所有签到，返回每个签到每轮的耗时（秒）"""
+    from runner import PLUGINS
+    modules = [importlib.import_module(PLUGINS[name]) for name in targets]
+    latencies: List[float] = []
+
+    async def timed(module):
+        start = time.perf_counter()
+        await module.run(client)
+        latencies.append(time.perf_counter() - start)
+
+    await client.connect()
+    for _ in range(rounds):
+        await asyncio.gather(*(timed(module) for module in modules))
+    await client.disconnect()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用模拟的机器人运行签到插件并计时")
+    parser.add_argument('--targets', default='CloudCat,SheerID,ICMP9')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.environ.setdefault('TG_ENTITY_CACHE', os.devnull)  # 不写入真实的实体缓存
+    targets = [t.strip() for t in args.targets.split(',') if t.strip()]
+    client = FakeClient(latency=args.latency, jitter=args.jitter, drop_rate=args.drop_rate)
+
+    start = time.perf_counter()
+    latencies = asyncio.run(bench(targets, args.rounds, client))
+    wall = time.perf_counter() - start
+    try:
+        import resource
+        peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:  # Windows
+        peak_rss_kb = 0
+    # 最后一行输出 JSON，供 common/bench.py 读取
+    print(json.dumps({'accounts': len(latencies), 'wall': wall, 'latencies': latencies, 'peak_rss_kb': peak_rss_kb}))
+
+
+if __name__ == '__main__':
+    main()
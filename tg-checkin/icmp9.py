@@ -1,12 +1,20 @@
 import os
+import re
 import sys
+import time
 import asyncio
-import re
-import requests  # type: ignore
 import traceback
 from telethon import TelegramClient
 from telethon.sessions import StringSession
-from typing import Dict, Any
+from typing import Dict
+from reply_waiter import ReplyWaiter
+from reply_parser import Field, ReplySpec
+import entity_cache
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 仓库根目录，用于导入 common
+from common import trace
+from common.metrics import Metrics, parse_bytes
+from common.notify import get_notifier
+from common.report import Renderer
 
 if sys.platform == 'win32':
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
@@ -18,7 +26,7 @@ TG_SESSION_STR = os.getenv('TG_SESSION_STR')
 TG_BOT_TOKEN = os.getenv('TG_BOT_TOKEN')
 TG_CHAT_ID = os.getenv('TG_CHAT_ID')
 TARGET_BOT_USERNAME = '@ICMP9_Bot'
-CHECK_WAIT_TIME = 5
+CHECK_WAIT_TIME = 5  # 等待机器人回复的最长时间（秒），收到预期的内容即返回
 # ============================================
 
 COLORS = {'red': '\033[91m', 'green': '\033[92m', 'yellow': '\033[93m', 'cyan': '\033[96m', 'reset': '\033[0m'}
@@ -31,71 +39,83 @@ def log(color_key: str, symbol_key: str, message: str):
     print(f"{color}{icon} {message}{COLORS['reset']}")
 
 
-def send_tg_notification(data: Dict[str, str]):
+def build_notification(data: Dict[str, str]) -> str:
+    r = Renderer("Markdown")  # 机器人回复中解析出的内容需要转义，避免 Markdown 解析失败
+    return r.fmt(
+        "🤖 *ICMP9 签到报告* 🤖\n"
+        "━━━━━━━━━━━━\n"
+        "👤 账户: {user}\n"
+        "📅 状态: {status}\n"
+        "🎁 今日已获: {gained}\n"
+        "🔥 连续签到: {streak}\n"
+        "━━━━━━━━━━━━\n"
+        "📦 总配额: {total}\n"
+        "📈 已使用: {used}\n"
+        "📉 剩余量: {remaining}\n"
+        "🖥️ 虚机列表: {vm_info}",
+        user=data.get('user', '未知'), status=data.get('status', '未知'), gained=data.get('gained', '0 GB'),
+        streak=data.get('streak', '未知'), total=data.get('total', '未知'), used=data.get('used', '未知'),
+        remaining=data.get('remaining', '未知'), vm_info=data.get('vm_info', '无')
+    )
+
+
+def is_success(data: Dict[str, str]) -> bool:
+    return any(k in data['status'] for k in ["成功", "已签"])
+
+
+def export_metrics(metrics: Metrics, data: Dict[str, str]):
+    """流量配额与连续签到天数，字段为“未知”时不输出"""
+    for kind in ('total', 'used', 'remaining'):
+        metrics.gauge('icmp9_quota_bytes', parse_bytes(data.get(kind)), help="ICMP9 流量配额（字节）", kind=kind)
+    metrics.gauge('icmp9_gained_bytes', parse_bytes(data.get('gained')), help="ICMP9 今日签到获得的流量（字节）")
+    streak = re.match(r'\d+', data.get('streak') or '')
+    metrics.gauge('icmp9_streak_days', int(streak.group()) if streak else None, help="ICMP9 连续签到天数")
+
+
+def send_tg_notification(text: str):
     if not (TG_BOT_TOKEN and TG_CHAT_ID):
         log('yellow', 'warning', "未设置TG通知变量，跳过通知")
         return
 
-    text = (
-        f"🤖 *ICMP9 签到报告* 🤖\n"
-        f"━━━━━━━━━━━━\n"
-        f"👤 账户: {data.get('user', '未知')}\n"
-        f"📅 状态: {data.get('status', '未知')}\n"
-        f"🎁 今日已获: {data.get('gained', '0 GB')}\n"
-        f"🔥 连续签到: {data.get('streak', '未知')}\n"
-        f"━━━━━━━━━━━━\n"
-        f"📦 总配额: {data.get('total', '未知')}\n"
-        f"📈 已使用: {data.get('used', '未知')}\n"
-        f"📉 剩余量: {data.get('remaining', '未知')}\n"
-        f"🖥️ 虚机列表: {data.get('vm_info', '无')}"
-    )
+    get_notifier().send(text, parse_mode='Markdown')
+    log('green', 'check', "TG 通知已加入发送队列")
 
-    url = f"https://api.telegram.org/bot{TG_BOT_TOKEN}/sendMessage"
-    payload: Dict[str, Any] = {
-        'chat_id': TG_CHAT_ID,
-        'text': text,
-        'parse_mode': 'Markdown'
-    }
 
-    try:
-        requests.post(url, data=payload, timeout=10).raise_for_status()
-        log('green', 'check', "TG 通知已发送")
-    except requests.exceptions.RequestException as e:
-        log('red', 'error', f"TG 通知发送失败: {e}")
+# 机器人回复的字段表，导入时逐字段预编译
+INFO_REPLY = ReplySpec('icmp9', [
+    Field('user', r'📊\s*([^\n\r]+)', lambda v: v.split('━━')[0].strip().replace('*', '')),
+    Field('streak', r'连续签到[：:\s]+(\d+)', lambda v: f"{v} 天"),
+    Field('total', r'配额[：:\s]+([\d\.]+\s*[GMB]+)'),
+    Field('used', r'已用[：:\s]+([\d\.]+\s*[GMB]+)'),
+    Field('remaining', r'剩余[：:\s]+([\d\.]+\s*[GMB]+)'),
+    Field('gained', r'(\d+(?:\.\d+)?)\s*(GB|MB|KB|B)', lambda num, unit: f"{num} {unit.upper()}", ignore_case=True),
+])
+ALWAYS_PARSED = {'streak', 'total', 'used', 'remaining'}
 
 
-def parse_all_info(text: str, current_data: Dict[str, str], parse_user: bool = False, parse_gained: bool = False) -> Dict[str, str]:
-    if parse_user:
-        user_match = re.search(r'📊\s*([^\n\r]+)', text)
-        if user_match:
-            name = user_match.group(1).split('━━')[0].strip().replace('*', '')
-            current_data['user'] = name
-            log('green', 'check', f"解析到用户名: {name}")
-
-    if parse_gained:
-        gained = re.search(r'(\d+(?:\.\d+)?)\s*(GB|MB|KB|B)', text, re.I)
-        if gained:
-            current_data['gained'] = f"{gained.group(1)} {gained.group(2).upper()}"
-
-    streak = re.search(r'连续签到[：:\s]+(\d+)', text)
-    if streak:
-        current_data['streak'] = f"{streak.group(1)} 天"
-
-    quota = re.search(r'配额[：:\s]+([\d\.]+\s*[GMB]+)', text)
-    if quota:
-        current_data['total'] = quota.group(1)
-
-    used = re.search(r'已用[：:\s]+([\d\.]+\s*[GMB]+)', text)
-    if used:
-        current_data['used'] = used.group(1)
-
-    rem = re.search(r'剩余[：:\s]+([\d\.]+\s*[GMB]+)', text)
-    if rem:
-        current_data['remaining'] = rem.group(1)
+# 判断回复是否为最终结果，跳过“处理中”之类的中间消息或编辑
+def is_checkin_result(text: str) -> bool:
+    return '成功' in text or '已签' in text or '已经签到' in text or 'streak' in INFO_REPLY.parse(text, only={'streak'})
+
+
+def is_account_info(text: str) -> bool:
+    return 'user' in INFO_REPLY.parse(text, only={'user'})
 
+
+def is_vm_list(text: str) -> bool:
+    return '虚拟机' in text
+
+
+def parse_all_info(text: str, current_data: Dict[str, str], parse_user: bool = False, parse_gained: bool = False) -> Dict[str, str]:
+    only = ALWAYS_PARSED | ({'user'} if parse_user else set()) | ({'gained'} if parse_gained else set())
+    parsed = INFO_REPLY.parse(text, only=only)
+    current_data.update(parsed.values)
+    if 'user' in parsed:
+        log('green', 'check', f"解析到用户名: {parsed.get('user')}")
     return current_data
 
 
+@trace.traced("icmp9.click", button="button_text")
 async def safe_click(msg, button_text):
     if not msg or not msg.buttons:
         log('red', 'error', "消息中没有按钮可点击")
@@ -113,6 +133,76 @@ async def safe_click(msg, button_text):
     return False
 
 
+def new_info() -> Dict[str, str]:
+    return {
+        'user': '未知',
+        'status': '失败',
+        'gained': '未知',
+        'streak': '未知',
+        'total': '未知',
+        'used': '未知',
+        'remaining': '未知',
+        'vm_info': '未知'
+    }
+
+
+# 签到流程（插件入口），client 需已连接并授权，多个签到可共用同一连接
+@trace.traced("icmp9.run")
+async def run(client: TelegramClient) -> Dict[str, str]:
+    info = new_info()
+
+    try:
+        log('green', 'check', f"TG 登录成功, 连接机器人: {TARGET_BOT_USERNAME}")
+        bot = await entity_cache.resolve(client, TARGET_BOT_USERNAME)
+
+        # 先注册回复监听，再发送指令
+        async with ReplyWaiter(client, bot, entity_cache.peer_id(bot)) as waiter:
+            # 1. 签到
+            log('cyan', 'arrow', "发送签到指令 /checkin")
+            bot, sent_msg = await entity_cache.send_message(client, TARGET_BOT_USERNAME, bot, '/checkin')
+            log('cyan', 'arrow', f"等待签到回复（最长 {CHECK_WAIT_TIME} 秒）")
+            msg_obj = await waiter.wait(min_id=sent_msg.id, timeout=CHECK_WAIT_TIME, match=is_checkin_result)
+            if not msg_obj:
+                log('red', 'error', "未收到回复")
+                return info
+
+            info = parse_all_info(msg_obj.text, info, parse_user=False, parse_gained=True)
+            info['status'] = "✅ 签到成功" if "成功" in msg_obj.text else "ℹ️ 今日已签"
+
+            # 2. 账户详情
+            log('cyan', 'arrow', "请求账户详情...")
+            if await safe_click(msg_obj, '账户'):
+                log('cyan', 'arrow', f"等待账户消息更新（最长 {CHECK_WAIT_TIME} 秒）")
+                refreshed = await waiter.wait(edit_of=msg_obj.id, timeout=CHECK_WAIT_TIME, match=is_account_info)
+                if refreshed:
+                    info = parse_all_info(refreshed.text, info, parse_user=True, parse_gained=False)
+                    msg_obj = refreshed
+                else:
+                    log('yellow', 'warning', "账户信息获取失败")
+
+            # 3. 虚机详情
+            log('cyan', 'arrow', "请求虚拟机列表...")
+            if await safe_click(msg_obj, '虚机'):
+                log('cyan', 'arrow', f"等待虚拟机信息更新（最长 {CHECK_WAIT_TIME} 秒）")
+                refreshed = await waiter.wait(edit_of=msg_obj.id, timeout=CHECK_WAIT_TIME, match=is_vm_list)
+                if refreshed:
+                    clean_text = refreshed.text.replace('*', '')
+                    if "虚拟机列表" in clean_text:
+                        clean_text = clean_text.split("虚拟机列表")[-1]
+                    clean_text = clean_text.strip()
+                    info['vm_info'] = clean_text if clean_text else "您当前没有虚拟机"
+                else:
+                    log('yellow', 'warning', "虚拟机列表获取失败")
+
+    except Exception as e:
+        traceback.print_exc()
+        err_msg = f"严重错误: {type(e).__name__} - {str(e)}"
+        log('red', 'error', err_msg)
+        info['status'] = "错误"
+
+    return info
+
+
 async def main():
     if not (TG_API_ID and TG_API_HASH):
         log('red', 'error', "环境变量缺失")
@@ -125,67 +215,15 @@ async def main():
         log('yellow', 'warning', "请先运行转换脚本获取 Session 字符串，并配置到环境变量中")
         sys.exit(1)
 
-    info = {
-        'user': '未知',
-        'status': '失败',
-        'gained': '未知',
-        'streak': '未知',
-        'total': '未知',
-        'used': '未知',
-        'remaining': '未知',
-        'vm_info': '未知'
-    }
+    info = new_info()
+    metrics = Metrics('tg-checkin-icmp9')
 
     try:
         await client.connect()
         if not await client.is_user_authorized():
             log('red', 'error', "tg_session 已失效, 请更新环境变量 TG_SESSION_STR")
             return
-
-        log('green', 'check', f"TG 登录成功, 连接机器人: {TARGET_BOT_USERNAME}")
-        bot = await client.get_entity(TARGET_BOT_USERNAME)
-
-        # 1. 签到
-        log('cyan', 'arrow', "发送签到指令 /checkin")
-        await client.send_message(bot, '/checkin')
-        log('cyan', 'arrow', f"等待 {CHECK_WAIT_TIME} 秒获取签到回复")
-        await asyncio.sleep(CHECK_WAIT_TIME)
-
-        msgs = await client.get_messages(bot, limit=1)
-        if not msgs:
-            log('red', 'error', "未收到回复")
-            return
-        msg_obj = msgs[0]
-
-        info = parse_all_info(msg_obj.text, info, parse_user=False, parse_gained=True)
-        info['status'] = "✅ 签到成功" if "成功" in msg_obj.text else "ℹ️ 今日已签"
-
-        # 2. 账户详情
-        log('cyan', 'arrow', "请求账户详情...")
-        if await safe_click(msg_obj, '账户'):
-            log('cyan', 'arrow', f"等待 {CHECK_WAIT_TIME} 秒更新账户消息")
-            await asyncio.sleep(CHECK_WAIT_TIME)
-            refreshed = await client.get_messages(bot, ids=msg_obj.id)
-            if refreshed:
-                info = parse_all_info(refreshed.text, info, parse_user=True, parse_gained=False)
-                msg_obj = refreshed
-            else:
-                log('yellow', 'warning', "账户信息获取失败")
-
-        # 3. 虚机详情
-        log('cyan', 'arrow', "请求虚拟机列表...")
-        if await safe_click(msg_obj, '虚机'):
-            log('cyan', 'arrow', f"等待 {CHECK_WAIT_TIME} 秒更新虚拟机信息")
-            await asyncio.sleep(CHECK_WAIT_TIME)
-            refreshed = await client.get_messages(bot, ids=msg_obj.id)
-            if refreshed:
-                clean_text = refreshed.text.replace('*', '')
-                if "虚拟机列表" in clean_text:
-                    clean_text = clean_text.split("虚拟机列表")[-1]
-                clean_text = clean_text.strip()
-                info['vm_info'] = clean_text if clean_text else "您当前没有虚拟机"
-            else:
-                log('yellow', 'warning', "虚拟机列表获取失败")
+        info = await run(client)
 
     except Exception as e:
         traceback.print_exc()
@@ -197,7 +235,7 @@ async def main():
             await client.disconnect()
             log('cyan', 'arrow', "连接已断开")
         # === 最终通知 ===
-        send_tg_notification(info)
+        send_tg_notification(build_notification(info))
         log('green', 'check', "任务执行完毕，结果统计：")
         log('cyan', 'arrow', f"最终状态: {info['status']}")
         log('cyan', 'arrow', f"连续签到: {info['streak']}")
@@ -207,7 +245,11 @@ async def main():
         log('cyan', 'arrow', f"剩余配额: {info['remaining']}")
         log('cyan', 'arrow', f"虚机列表: {info['vm_info']}")
 
-        if not any(k in info['status'] for k in ["成功", "已签"]):
+        metrics.account('ICMP9', is_success(info), time.time() - metrics.start, detail=info['status'])
+        export_metrics(metrics, info)
+        metrics.write()
+
+        if not is_success(info):
             sys.exit(1)
 
 if __name__ == '__main__':
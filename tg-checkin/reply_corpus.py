@@ -0,0 +1,29 @@
+# 各签到机器人的回复样例，供 reply_parser.py 的微基准使用（用户名、数值已替换）
+# 每条为 (字段表, 回复, 需要的字段)，需要的字段与插件中实际的调用一致，None 表示全部字段
+from typing import FrozenSet, List, Optional, Tuple
+
+from cloudcat import CHECKIN_REPLY as CLOUDCAT_CHECKIN, POINTS_REPLY as CLOUDCAT_POINTS
+from sheerid import POINTS_REPLY as SHEERID_POINTS
+from icmp9 import ALWAYS_PARSED, INFO_REPLY as ICMP9_INFO
+from reply_parser import ReplySpec
+
+ICMP9_CHECKIN = frozenset(ALWAYS_PARSED | {'gained'})  # 签到回复
+ICMP9_ACCOUNT = frozenset(ALWAYS_PARSED | {'user'})    # 点击“账户”后的回复
+
+CORPUS: List[Tuple[ReplySpec, str, Optional[FrozenSet[str]]]] = [
+    (CLOUDCAT_CHECKIN, "🎉 签到成功！\n你获得 3 ⭐\n当前积分：128.5 ⭐\n连续签到 12 天，明天再来吧~", None),
+    (CLOUDCAT_CHECKIN, "✅ Check-in successful!\nYou got 2.5 ⭐\nCurrent points: 77 ⭐", None),
+    (CLOUDCAT_CHECKIN, "签到成功，但积分服务繁忙，请稍后发送 /points 查询", None),
+    (CLOUDCAT_POINTS, "👤 用户: someone\nCheckInAddPoint: 3 ⭐\n当前积分: 131\n排名: 42", None),
+    (CLOUDCAT_POINTS, "User: someone\nCheckInAddPoint：1.5\nCurrent Points: 64.0\nInvite: 0", None),
+    (SHEERID_POINTS, "✅ 签到成功！\n获得积分: +5\n当前积分: 230\n明天记得再来哦", None),
+    (SHEERID_POINTS, "💰 账户余额\n当前积分：1024\n可兑换次数：3", None),
+    (SHEERID_POINTS, "⚠️ 今天已经签到过了，请明天再来", None),
+    (ICMP9_INFO, "✅ 签到成功！\n🎁 今日获得 1.5 GB 流量\n🔥 连续签到: 8 天\n━━━━━━━━━━━━\n"
+                 "📦 配额: 60 GB\n📈 已用: 12.3 GB\n📉 剩余: 47.7 GB", ICMP9_CHECKIN),
+    (ICMP9_INFO, "ℹ️ 今天已经签到过了\n🔥 连续签到：9 天", ICMP9_CHECKIN),
+    (ICMP9_INFO, "📊 *someone* ━━━━━━━━━━━━\n🆔 ID: 123456789\n🔥 连续签到: 9 天\n"
+                 "📦 总配额: 61.5 GB\n📈 已用: 13 GB\n📉 剩余: 48.5 GB\n📅 注册时间: 2025-03-01", ICMP9_ACCOUNT),
+    (ICMP9_INFO, "📊 *someone* ━━━━\n📦 配额: 512 MB\n📈 已用: 0 B\n📉 剩余: 512 MB\n"
+                 "⚠️ 流量较低，请注意使用。" + "\n说明：签到可获得随机流量奖励。" * 20, ICMP9_ACCOUNT),
+]
@@ -0,0 +1,124 @@
+import re
+import sys
+from typing import Any, Callable, Dict, Iterable, List, Optional, Pattern, Sequence, Tuple
+
+
+# 表驱动的机器人回复解析：每个机器人一张字段表（字段名、正则、规范化函数），创建时逐字段预编译。
+# 不合并成一个大的分支正则：各字段大多以固定文字开头（如 '配额[：:]'），单独 search 时 re 能先快速定位这段文字，
+# 合并后的分支正则要在每个位置逐个尝试各分支，在 icmp9 的回复上反而慢一倍以上
+class Field:
+    """
+    pattern 中不能使用命名分组；normalize 接收 pattern 的各个分组（没有分组时接收整个匹配），
+    返回字段值，抛出 ValueError 时视为未命中
+    """
+
+    __slots__ = ("name", "pattern", "normalize", "ignore_case")
+
+    def __init__(self, name: str, pattern: str, normalize: Optional[Callable[..., Any]] = None,
+                 ignore_case: bool = False):
+        self.name = name
+        self.pattern = pattern
+        self.normalize = normalize or (lambda value, *rest: value)
+        self.ignore_case = ignore_case
+
+
+class Parsed:
+    """解析结果：values 为命中字段的规范化值，matched 为命中的字段名（按文本中出现的顺序）"""
+
+    __slots__ = ("values", "matched")
+
+    def __init__(self, values: Dict[str, Any], matched: Tuple[str, ...]):
+        self.values = values
+        self.matched = matched
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.values.get(name, default)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.values
+
+    def __repr__(self) -> str:
+        return f"Parsed({self.values!r})"
+
+
+class ReplySpec:
+    """
+    用法：
+        SPEC = ReplySpec('sheerid', [
+            Field('gained', r'获得积分\\D*(\\d+)', lambda v: f"{v}分"),
+            Field('total', r'当前积分\\D*(\\d+)', lambda v: f"{v}分"),
+        ])
+        parsed = SPEC.parse(text)              # 或 SPEC.parse(text, only={'total'})
+        total = parsed.get('total', '未知')
+    每个字段取文本中第一次出现的匹配；matched 按出现位置排序
+    """
+
+    def __init__(self, name: str, fields: Sequence[Field]):
+        self.name = name
+        self.fields = list(fields)
+        # 创建时编译，正则写错时尽早报错
+        self.compiled: List[Tuple[Field, Pattern]] = [
+            (field, re.compile(field.pattern, re.IGNORECASE if field.ignore_case else 0)) for field in self.fields
+        ]
+
+    def parse(self, text: str, only: Optional[Iterable[str]] = None) -> Parsed:
+        wanted = None if only is None else set(only)
+        values: Dict[str, Any] = {}
+        found: List[Tuple[int, str]] = []  # (位置, 字段名)，用于按出现顺序排列 matched
+        if not text:
+            return Parsed(values, ())
+        for field, regex in self.compiled:
+            if wanted is not None and field.name not in wanted:
+                continue
+            m = regex.search(text)
+            if not m:
+                continue
+            try:
+                values[field.name] = field.normalize(*(m.groups() or (m.group(0),)))
+            except ValueError:
+                continue
+            found.append((m.start(), field.name))
+        return Parsed(values, tuple(name for _, name in sorted(found)))
+
+    def parse_each(self, text: str, only: Optional[Iterable[str]] = None) -> Parsed:
+        """改造前的写法（每次调用用内联正则 re.search），仅作为基准测试的对照与结果核对"""
+        wanted = set(only) if only is not None else {field.name for field in self.fields}
+        values: Dict[str, Any] = {}
+        found: List[Tuple[int, str]] = []
+        for field in self.fields:
+            if field.name not in wanted:
+                continue
+            m = re.search(field.pattern, text, re.IGNORECASE if field.ignore_case else 0)
+            if not m:
+                continue
+            try:
+                values[field.name] = field.normalize(*(m.groups() or (m.group(0),)))
+            except ValueError:
+                continue
+            found.append((m.start(), field.name))
+        return Parsed(values, tuple(name for _, name in sorted(found)))
+
+
+def benchmark(corpus: Sequence[Tuple[ReplySpec, str, Optional[Iterable[str]]]], rounds: int = 2000):
+    """对比字段表解析与内联 re.search 在语料上的耗时（各自按语料中给出的字段解析），并列出两者结果不一致的回复"""
+    import timeit
+
+    for spec in dict.fromkeys(spec for spec, _, _ in corpus):
+        samples = [(text, only) for s, text, only in corpus if s is spec]
+        table = timeit.timeit(lambda: [spec.parse(t, o) for t, o in samples], number=rounds)
+        inline = timeit.timeit(lambda: [spec.parse_each(t, o) for t, o in samples], number=rounds)
+        per_call = 1e6 / (rounds * len(samples))
+        print(f"{spec.name:<18} {len(spec.fields)} 个字段 {len(samples)} 条回复  "
+              f"字段表 {table * per_call:6.2f} µs/条  内联 re.search {inline * per_call:6.2f} µs/条  "
+              f"加速 {inline / table:4.2f}x")
+        for text, only in samples:
+            a, b = spec.parse(text, only), spec.parse_each(text, only)
+            if a.values != b.values or a.matched != b.matched:
+                print(f"  ⚠ 结果不一致: {text[:40]!r}\n    字段表: {a.values}\n    内联:   {b.values}")
+
+if __name__ == '__main__':
+    # 语料为各机器人回复的样例，运行：python tg-checkin/reply_parser.py [轮数]
+    import os
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from reply_corpus import CORPUS
+    benchmark(CORPUS, int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
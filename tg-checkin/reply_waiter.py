@@ -0,0 +1,132 @@
+import os
+import sys
+import asyncio
+from telethon import TelegramClient, events
+from telethon.tl.custom.message import Message
+from typing import Any, Callable, Dict, List, Optional
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 仓库根目录，用于导入 common
+from common import trace
+
+
+REPLY_IDLE = float(os.environ.get("TG_REPLY_IDLE", "1.5"))  # 未指定判定条件时，机器人停止发送/编辑该秒数后视为回复完毕
+
+Match = Callable[[str], bool]
+
+
+# 推送式等待机器人回复：注册 NewMessage / MessageEdited 事件，回复一到立即判断，超时只作为兜底。
+# 机器人常先回一条“处理中…”再发送或编辑成结果，因此取的是最新一条回复，而不是第一条
+class ReplyWaiter:
+    """
+    用法：先进入上下文注册监听，再发送指令，避免回复早于监听到达而丢失
+        async with ReplyWaiter(client, chat, bot_id) as waiter:
+            sent = await client.send_message(chat, '/checkin')
+            reply = await waiter.wait(min_id=sent.id, timeout=10, match=lambda text: '签到' in text)
+    指定 match 时等到有回复的文本满足它为止，返回满足条件的最新一条；
+    未指定时等到机器人安静 idle 秒后返回最新一条
+    """
+
+    def __init__(self, client: TelegramClient, chat: Any, bot_id: int, idle: float = REPLY_IDLE):
+        self.client = client
+        self.chat = chat
+        self.bot_id = bot_id
+        self.idle = idle
+        self.messages: Dict[int, Message] = {}  # 消息 id -> 最新版本（新消息及其后续编辑）
+        self.edits: Dict[int, Message] = {}     # 消息 id -> 尚未取走的最新一次编辑
+        self.last_event = 0.0
+        self.changed = asyncio.Event()
+        self.new_filter = events.NewMessage(chats=chat, from_users=bot_id, incoming=True)
+        self.edit_filter = events.MessageEdited(chats=chat, from_users=bot_id, incoming=True)
+
+    def _touch(self):
+        self.last_event = asyncio.get_running_loop().time()
+        self.changed.set()
+
+    async def _on_new(self, event: events.NewMessage.Event):
+        self.messages[event.message.id] = event.message
+        self._touch()
+
+    async def _on_edit(self, event: events.MessageEdited.Event):
+        msg = event.message
+        if msg.id in self.messages:
+            self.messages[msg.id] = msg
+        self.edits[msg.id] = msg
+        self._touch()
+
+    async def __aenter__(self) -> 'ReplyWaiter':
+        self.client.add_event_handler(self._on_new, self.new_filter)
+        self.client.add_event_handler(self._on_edit, self.edit_filter)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.client.remove_event_handler(self._on_new, self.new_filter)
+        self.client.remove_event_handler(self._on_edit, self.edit_filter)
+
+    def _candidates(self, min_id: int, edit_of: Optional[int]) -> List[Message]:
+        """按从旧到新排列的候选回复"""
+        if edit_of is not None:
+            return [self.edits[edit_of]] if edit_of in self.edits else []
+        return [self.messages[i] for i in sorted(self.messages) if i > min_id]
+
+    def _take(self, msg: Message, edit_of: Optional[int]) -> Message:
+        if edit_of is not None:
+            self.edits.pop(edit_of, None)
+        else:
+            self.messages = {i: m for i, m in self.messages.items() if i > msg.id}
+        return msg
+
+    @staticmethod
+    def _newest(candidates: List[Message], match: Optional[Match]) -> Optional[Message]:
+        for msg in reversed(candidates):
+            if match is None or match(msg.text or ''):
+                return msg
+        return None
+
+    @trace.traced("tg.wait_reply")
+    async def wait(self, min_id: int = 0, timeout: float = 10, edit_of: Optional[int] = None,
+                   match: Optional[Match] = None) -> Optional[Message]:
+        """
+        等待 id 大于 min_id 的新回复；若指定 edit_of，则等待该消息被机器人编辑。
+        超时后取已收到的最新回复（优先满足 match 的），一条都没有时回退到一次历史消息查询，仍无结果则返回 None
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            self.changed.clear()
+            candidates = self._candidates(min_id, edit_of)
+            now = loop.time()
+            if match is not None:
+                msg = self._newest(candidates, match)
+                if msg is not None:
+                    return self._take(msg, edit_of)
+                wake = deadline
+            elif candidates:
+                if now - self.last_event >= self.idle:
+                    return self._take(candidates[-1], edit_of)
+                wake = min(deadline, self.last_event + self.idle)
+            else:
+                wake = deadline
+            if now >= deadline:
+                if candidates:
+                    return self._take(self._newest(candidates, match) or candidates[-1], edit_of)
+                return await self._fallback(min_id, edit_of, match)
+            try:
+                await asyncio.wait_for(self.changed.wait(), wake - now)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fallback(self, min_id: int, edit_of: Optional[int], match: Optional[Match]) -> Optional[Message]:
+        """从历史消息中取机器人最新的回复（优先满足 match 的）"""
+        try:
+            if edit_of is not None:
+                return await self.client.get_messages(self.chat, ids=edit_of)
+            newest = None
+            async for msg in self.client.iter_messages(self.chat, limit=5, min_id=min_id):  # 从新到旧
+                if not isinstance(msg, Message) or msg.sender_id != self.bot_id or msg.out:
+                    continue
+                if match is None or match(msg.text or ''):
+                    return msg
+                newest = newest or msg
+            return newest
+        except Exception:
+            pass
+        return None
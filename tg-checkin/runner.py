@@ -0,0 +1,180 @@
+import os
+import sys
+import time
+import asyncio
+import importlib
+import traceback
+from telethon import TelegramClient
+from telethon.sessions import StringSession
+from typing import Dict, List, Optional
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 仓库根目录，用于导入 common
+from common import trace
+from common.metrics import Metrics
+from common.notify import get_notifier
+from common.report import Renderer
+from common.runstate import RunState
+
+# Windows事件循环策略，兼容win系统运行
+if sys.platform == 'win32':
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+# ================= 配置区域 =================
+TG_API_ID = os.getenv('TG_API_ID')
+TG_API_HASH = os.getenv('TG_API_HASH')
+TG_SESSION_STR = os.getenv('TG_SESSION_STR')
+TG_BOT_TOKEN = os.getenv('TG_BOT_TOKEN')
+TG_CHAT_ID = os.getenv('TG_CHAT_ID')
+RUN_TARGET = os.getenv('RUN_TARGET', 'All')   # All，或逗号分隔的签到名称，如 SheerID,ICMP9
+PLUGINS: Dict[str, str] = {                   # 签到名称 -> 模块名，模块需提供 run / build_notification / is_success，可选 export_metrics
+    'CloudCat': 'cloudcat',
+    'SheerID': 'sheerid',
+    'ICMP9': 'icmp9',
+}
+ALL_TARGETS: List[str] = ['SheerID', 'ICMP9']  # RUN_TARGET=All 时运行的签到（CloudCat 已暂停）
+RUN_STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'run_state.json')  # 今日已签到成功的任务不再重复发送指令
+# ============================================
+
+COLORS: Dict[str, str] = {
+    'red': '\033[91m', 'green': '\033[92m', 'yellow': '\033[93m',
+    'cyan': '\033[96m', 'reset': '\033[0m'
+}
+SYMBOLS: Dict[str, str] = {'check': '✓', 'warning': '⚠', 'arrow': '➜', 'error': '✗'}
+
+
+def log(color: str, symbol: str, message: str):
+    print(f"{COLORS[color]}{SYMBOLS[symbol]} {message}{COLORS['reset']}")
+
+
+def send_tg_notification(text: str):
+    if not (TG_BOT_TOKEN and TG_CHAT_ID):
+        log('yellow', 'warning', "未设置 TG_BOT_TOKEN 或 TG_CHAT_ID，跳过通知")
+        return
+
+    get_notifier().send(text, parse_mode='Markdown')
+    log('green', 'check', "TG 通知已加入发送队列")
+
+
+# 解析要运行的签到，名称不区分大小写
+def resolve_targets(spec: str) -> List[str]:
+    if not spec or spec.strip().lower() == 'all':
+        return list(ALL_TARGETS)
+    lookup = {name.lower(): name for name in PLUGINS}
+    targets = []
+    for item in spec.split(','):
+        name = lookup.get(item.strip().lower())
+        if name and name not in targets:
+            targets.append(name)
+        elif item.strip():
+            log('yellow', 'warning', f"未知的签到名称，已忽略: {item.strip()}")
+    return targets
+
+
+# 在同一个已授权的连接上并发执行所有签到，给出 metrics 时记录各签到的耗时与结果
+async def run_all(client: TelegramClient, targets: List[str],
+                  metrics: Optional[Metrics] = None) -> Dict[str, Dict[str, str]]:
+    async def timed(name: str) -> Dict[str, str]:
+        module = importlib.import_module(PLUGINS[name])
+        start = time.perf_counter()
+        result = await module.run(client)
+        if metrics:
+            metrics.account(name, module.is_success(result), time.perf_counter() - start, detail=result['status'])
+        return result
+
+    results = await asyncio.gather(*(timed(name) for name in targets))
+    return dict(zip(targets, results))
+
+
+# 插件的附加指标（如 ICMP9 的流量配额），今日跳过的签到沿用上次保存的数据
+def export_metrics(metrics: Metrics, results: Dict[str, Dict[str, str]]):
+    for name, result in results.items():
+        module = importlib.import_module(PLUGINS[name])
+        if hasattr(module, 'export_metrics'):
+            module.export_metrics(metrics, result)
+
+
+# 执行签到并发送合并通知，返回是否全部成功。client 未连接时自动连接但不断开，守护进程传入常驻的客户端
+async def check_in(client: TelegramClient, targets: List[str]) -> bool:
+    # 今天（北京时间）已签到成功的任务直接沿用上次结果，不再连接机器人
+    state = RunState(RUN_STATE_FILE)
+    metrics = Metrics('tg-checkin')
+    results: Dict[str, Dict[str, str]] = {}
+    for name in targets:
+        if state.done_today(name):
+            log('yellow', 'warning', f"{name} 今日已签到成功，本次跳过（RUN_FORCE=1 可强制签到）")
+            results[name] = dict(state.get(name).get('data') or {}, status="今日已签到")
+            metrics.account(name, True, skipped=True)
+    due = [name for name in targets if name not in results]
+
+    error = ""
+    fresh: Dict[str, Dict[str, str]] = {}
+    if due:
+        try:
+            log('cyan', 'arrow', f"启动 TG 客户端，签到任务: {', '.join(due)}")
+            async with trace.span("tg.connect"):
+                if not client.is_connected():
+                    await client.connect()
+                authorized = await client.is_user_authorized()
+            if authorized:
+                fresh = await run_all(client, due, metrics)
+                for name, result in fresh.items():
+                    state.record(name, importlib.import_module(PLUGINS[name]).is_success(result), result['status'], result)
+                state.save()
+                results = {name: results.get(name) or fresh[name] for name in targets}
+            else:
+                error = "tg_session 已失效, 请更新环境变量 TG_SESSION_STR"
+                log('red', 'error', error)
+        except Exception as e:
+            traceback.print_exc()
+            error = f"严重错误: {type(e).__name__} - {str(e)}"
+            log('red', 'error', error)
+
+    # === 合并通知 ===
+    ok = False
+    if results:
+        blocks = [importlib.import_module(PLUGINS[name]).build_notification(result) for name, result in results.items()]
+        if error:
+            blocks.append(f"❌ TG 签到失败: {Renderer('Markdown').esc(error)}")
+        send_tg_notification("\n\n".join(blocks))
+        ok = not error and all(importlib.import_module(PLUGINS[name]).is_success(result) for name, result in results.items())
+    else:
+        send_tg_notification(f"❌ TG 签到失败: {Renderer('Markdown').esc(error or '未知错误')}")
+
+    # 未能执行的签到（连接失败、会话失效等）按失败计入指标
+    for name in due:
+        if name not in fresh:
+            metrics.account(name, False, detail=error or '未知错误')
+    export_metrics(metrics, results)
+    metrics.write()
+
+    log('green', 'check', "任务执行完毕! 结果统计：")
+    for name, result in results.items():
+        log('cyan', 'arrow', f"{name}: {result['status']}")
+    return ok
+
+
+async def main():
+    targets = resolve_targets(sys.argv[1] if len(sys.argv) > 1 else RUN_TARGET)
+    if not targets:
+        log('red', 'error', "没有需要运行的签到任务")
+        sys.exit(1)
+
+    required_vars = {'TG_API_ID': TG_API_ID, 'TG_API_HASH': TG_API_HASH, 'TG_SESSION_STR': TG_SESSION_STR}
+    missing_vars = [name for name, val in required_vars.items() if not val]
+    if missing_vars:
+        log('red', 'error', f"TG 登录失败：缺少必要的变量: {', '.join(missing_vars)}！请检查 GitHub Secrets 设置")
+        sys.exit(1)
+
+    client = TelegramClient(StringSession(TG_SESSION_STR), int(TG_API_ID), TG_API_HASH)
+    try:
+        ok = await check_in(client, targets)
+    finally:
+        if client.is_connected():
+            await client.disconnect()
+            log('cyan', 'arrow', "连接已安全断开")
+
+    if not ok:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    log('cyan', 'arrow', "=== 执行 TG 多机器人签到任务 ===")
+    asyncio.run(main())
@@ -1,13 +1,20 @@
 import os
-import re
 import sys
+import time
 import asyncio
-import requests  # type: ignore
 import traceback
 from telethon import TelegramClient
 from telethon.tl.custom.message import Message
 from telethon.sessions import StringSession
-from typing import Dict, Any, Tuple
+from typing import Dict, Tuple
+from reply_waiter import ReplyWaiter
+from reply_parser import Field, ReplySpec
+import entity_cache
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 仓库根目录，用于导入 common
+from common import trace
+from common.metrics import Metrics
+from common.notify import get_notifier
+from common.report import Raw, Renderer
 
 # Windows事件循环策略，兼容win系统运行
 if sys.platform == 'win32':
@@ -20,7 +27,7 @@ TG_SESSION_STR = os.getenv('TG_SESSION_STR')  # 你的 TG Session 字符串
 TG_BOT_TOKEN = os.getenv('TG_BOT_TOKEN')      # 你的通知机器人 Token
 TG_CHAT_ID = os.getenv('TG_CHAT_ID')          # 你的个人 Chat ID (接收通知用)
 TARGET_BOT_USERNAME = '@auto_sheerid_bot'     # 签到目标机器人用户名
-CHECK_WAIT_TIME = 5                           # 等待机器人回复的时间（秒）
+CHECK_WAIT_TIME = 5                           # 等待机器人回复的最长时间（秒），收到签到结果即返回
 DEFAULT_GAINED_POINTS = "未知"                 # 获得积分的默认值
 DEFAULT_TOTAL_POINTS = "未知"                  # 总积分的默认值
 # ============================================
@@ -38,34 +45,42 @@ def log(color: str, symbol: str, message: str):
     print(f"{COLORS[color]}{SYMBOLS[symbol]} {message}{COLORS['reset']}")
 
 
-# 发送 Telegram 消息通知模板
-def send_tg_notification(status: str, gained: str, total: str):
+# 签到结果通知模板
+def build_notification(result: Dict[str, str]) -> str:
+    status = result['status']
+    target_bot_link = TARGET_BOT_USERNAME.replace('@', 't.me/') if TARGET_BOT_USERNAME.startswith('@') else TARGET_BOT_USERNAME  # 构造链接
+    status_emoji = "✅" if status == "成功" else ("⭐" if status == "今日已签到" else "❌")
+    r = Renderer("Markdown")  # 机器人回复中解析出的内容需要转义，避免 Markdown 解析失败
+    return r.fmt(
+        "🤖 *Auto SheerID 签到通知* 🤖\n"
+        "====================\n"
+        "{} 状态: {}\n"
+        "🎯 目标: [{}]({})\n"
+        "📌 今日获得: {}\n"
+        "📊 当前总分: {}",
+        status_emoji, status, TARGET_BOT_USERNAME, Raw(target_bot_link), result['gained'], result['total']
+    )
+
+
+# 签到是否成功（含今日已签到）
+def is_success(result: Dict[str, str]) -> bool:
+    return any(k in result['status'] for k in ["成功", "今日已签到"])
+
+
+# 发送 Telegram 消息通知
+def send_tg_notification(notification_text: str):
     if not (TG_BOT_TOKEN and TG_CHAT_ID):
         log('yellow', 'warning', "未设置 TG_BOT_TOKEN 或 TG_CHAT_ID，跳过通知")
         return
 
-    target_bot_link = TARGET_BOT_USERNAME.replace('@', 't.me/') if TARGET_BOT_USERNAME.startswith('@') else TARGET_BOT_USERNAME  # 构造链接
-    status_emoji = "✅" if status == "成功" else ("⭐" if status == "今日已签到" else "❌")
-    notification_text = (
-        f"🤖 *Auto SheerID 签到通知* 🤖\n"
-        f"====================\n"
-        f"{status_emoji} 状态: {status}\n"
-        f"🎯 目标: [{TARGET_BOT_USERNAME}]({target_bot_link})\n"
-        f"📌 今日获得: {gained}\n"
-        f"📊 当前总分: {total}"
-    )
+    get_notifier().send(notification_text, parse_mode='Markdown')
 
-    url = f"https://api.telegram.org/bot{TG_BOT_TOKEN}/sendMessage"
-    payload: Dict[str, Any] = {
-        'chat_id': TG_CHAT_ID,
-        'text': notification_text,
-        'parse_mode': 'Markdown'
-    }
 
-    try:
-        requests.post(url, data=payload, timeout=10).raise_for_status()
-    except requests.exceptions.RequestException as e:
-        log('red', 'error', f"Telegram 通知发送失败: {e}")
+# 机器人回复的字段表，签到回复与 /balance 回复共用
+POINTS_REPLY = ReplySpec('sheerid', [
+    Field('gained', r'获得积分\D*(\d+)', lambda v: f"{v}分"),
+    Field('total', r'当前积分\D*(\d+)', lambda v: f"{v}分"),
+])
 
 
 # 解析积分信息
@@ -73,29 +88,80 @@ def parse_points(message_text: str) -> Tuple[str, str]:
     """
     从消息文本中解析 '获得积分' 和 '当前积分'。如果未找到，返回默认值
     """
+    parsed = POINTS_REPLY.parse(message_text)
+    return parsed.get('gained', DEFAULT_GAINED_POINTS), parsed.get('total', DEFAULT_TOTAL_POINTS)
+
+
+def is_checkin_result(text: str) -> bool:
+    return '签到成功' in text or '已签到' in text or '已经签到' in text
+
+
+def is_balance_result(text: str) -> bool:
+    return 'total' in POINTS_REPLY.parse(text, only={'total'})
+
+
+# 等待并获取目标机器人最新回复（match 判断回复是否为最终结果，跳过“处理中”之类的中间消息）
+async def get_bot_reply(waiter: ReplyWaiter, min_id: int = 0, match=None) -> Message | None:
+    log('cyan', 'arrow', f"等待机器人回复（最长 {CHECK_WAIT_TIME} 秒）")
+    return await waiter.wait(min_id=min_id, timeout=CHECK_WAIT_TIME, match=match)
+
+
+# 签到流程（插件入口），client 需已连接并授权，多个签到可共用同一连接
+@trace.traced("sheerid.run")
+async def run(client: TelegramClient) -> Dict[str, str]:
+    status = "失败"
     gained_points = DEFAULT_GAINED_POINTS
     total_points = DEFAULT_TOTAL_POINTS
-    gained_match = re.search(r'获得积分\D*(\d+)', message_text)
-    total_match = re.search(r'当前积分\D*(\d+)', message_text)
 
-    if gained_match:
-        gained_points = f"{gained_match.group(1)}分"
-    if total_match:
-        total_points = f"{total_match.group(1)}分"
+    try:
+        try:
+            bot_entity = await entity_cache.resolve(client, TARGET_BOT_USERNAME)
+            log('cyan', 'arrow', f"已连接到机器人: {TARGET_BOT_USERNAME}")
+        except Exception as e:
+            log('red', 'error', f"无法找到机器人 {TARGET_BOT_USERNAME}: {e}")
+            return {'status': status, 'gained': gained_points, 'total': total_points}
 
-    return gained_points, total_points
+        # 先注册回复监听，再发送指令
+        async with ReplyWaiter(client, bot_entity, entity_cache.peer_id(bot_entity)) as waiter:
+            log('cyan', 'arrow', "发送 /qd 签到命令")
+            bot_entity, sent_msg = await entity_cache.send_message(client, TARGET_BOT_USERNAME, bot_entity, '/qd')
+        
+            reply = await get_bot_reply(waiter, min_id=sent_msg.id, match=is_checkin_result)
+            if reply and reply.text:
+                reply_text = reply.text
+                log('green', 'check', f"收到回复:\n{reply_text}")
+
+                # 情况 A: 签到成功
+                if '签到成功' in reply_text:
+                    status = "成功"
+                    log('green', 'check', "判断为：签到成功")
+                    gained_points, total_points = parse_points(reply_text)
+
+                # 情况 B: 今日已签到
+                elif '已经签到' in reply_text or '已签到' in reply_text:
+                    status = "今日已签到"
+                    log('yellow', 'warning', "判断为：今日已签到，尝试查询余额")
+                    sent_balance_msg = await client.send_message(bot_entity, '/balance')
+                    balance_reply = await get_bot_reply(waiter, min_id=sent_balance_msg.id, match=is_balance_result)
+                    if balance_reply and balance_reply.text:
+                        log('green', 'check', f"收到余额回复:\n{balance_reply.text}")
+                        _, total_points = parse_points(balance_reply.text)
+                    else:
+                        log('red', 'error', "查询余额未收到回复")
 
+                else:
+                    status = "未知响应"
+                    log('red', 'error', "无法识别机器人的回复内容")
+            else:
+                log('red', 'error', "未收到机器人回复")
 
-# 等待并获取目标机器人最新回复
-async def get_bot_reply(client: TelegramClient, bot_entity: Any, check_limit: int = 5) -> Message | None:
-    log('cyan', 'arrow', f"等待 {CHECK_WAIT_TIME} 秒后读取机器人回复")
-    await asyncio.sleep(CHECK_WAIT_TIME)
+    except Exception as e:
+        traceback.print_exc()
+        err_msg = f"严重错误: {type(e).__name__} - {str(e)}"
+        log('red', 'error', err_msg)
+        status = "错误"
 
-    target_id = bot_entity.id # 获取签到机器人的ID
-    async for msg in client.iter_messages(bot_entity, limit=check_limit):
-        if isinstance(msg, Message) and msg.sender_id == target_id and not msg.out:
-            return msg
-    return None
+    return {'status': status, 'gained': gained_points, 'total': total_points}
 
 
 # 执行签到主逻辑
@@ -116,72 +182,36 @@ async def check_in():
         sys.exit(1)
 
     log('cyan', 'arrow', "启动 TG 客户端")
-    status = "失败"
-    gained_points = DEFAULT_GAINED_POINTS
-    total_points = DEFAULT_TOTAL_POINTS
+    metrics = Metrics('tg-checkin-sheerid')
+    result = {'status': "失败", 'gained': DEFAULT_GAINED_POINTS, 'total': DEFAULT_TOTAL_POINTS}
 
     try:
         await client.connect()
         if not await client.is_user_authorized():
             log('red', 'error', "tg_session 已失效, 请更新环境变量 TG_SESSION_STR")
             return
-
-        try:
-            bot_entity = await client.get_entity(TARGET_BOT_USERNAME)
-            log('cyan', 'arrow', f"已连接到机器人: {TARGET_BOT_USERNAME}")
-        except Exception as e:
-            log('red', 'error', f"无法找到机器人 {TARGET_BOT_USERNAME}: {e}")
-            return
-
-        log('cyan', 'arrow', "发送 /qd 签到命令")
-        await client.send_message(bot_entity, '/qd')
-        
-        reply = await get_bot_reply(client, bot_entity)
-        if reply and reply.text:
-            reply_text = reply.text
-            log('green', 'check', f"收到回复:\n{reply_text}")
-
-            # 情况 A: 签到成功
-            if '签到成功' in reply_text:
-                status = "成功"
-                log('green', 'check', "判断为：签到成功")
-                gained_points, total_points = parse_points(reply_text)
-
-            # 情况 B: 今日已签到
-            elif '已经签到' in reply_text or '已签到' in reply_text:
-                status = "今日已签到"
-                log('yellow', 'warning', "判断为：今日已签到，尝试查询余额")
-                await client.send_message(bot_entity, '/balance')
-                balance_reply = await get_bot_reply(client, bot_entity)
-                if balance_reply and balance_reply.text:
-                    log('green', 'check', f"收到余额回复:\n{balance_reply.text}")
-                    _, total_points = parse_points(balance_reply.text)
-                else:
-                    log('red', 'error', "查询余额未收到回复")
-
-            else:
-                status = "未知响应"
-                log('red', 'error', "无法识别机器人的回复内容")
-        else:
-            log('red', 'error', "未收到机器人回复")
+        result = await run(client)
 
     except Exception as e:
         traceback.print_exc()
         err_msg = f"严重错误: {type(e).__name__} - {str(e)}"
         log('red', 'error', err_msg)
-        status = "错误"
+        result['status'] = "错误"
     finally:
         if client.is_connected():
             await client.disconnect()
             log('cyan', 'arrow', "连接已安全断开")
         # === 最终通知 ===
-        send_tg_notification(status, gained_points, total_points)
+        send_tg_notification(build_notification(result))
         log('green', 'check', "任务执行完毕! 结果统计：")
-        log('cyan', 'arrow', f"最终状态: {status}")
-        log('cyan', 'arrow', f"今日获得: {gained_points}")
-        log('cyan', 'arrow', f"当前总分: {total_points}")
+        log('cyan', 'arrow', f"最终状态: {result['status']}")
+        log('cyan', 'arrow', f"今日获得: {result['gained']}")
+        log('cyan', 'arrow', f"当前总分: {result['total']}")
+
+        metrics.account('SheerID', is_success(result), time.time() - metrics.start, detail=result['status'])
+        metrics.write()
 
-        if not any(k in status for k in ["成功", "今日已签到"]):
+        if not is_success(result):
             sys.exit(1)
 
 if __name__ == '__main__':
@@ -2,50 +2,78 @@ import requests
 import os
 import sys
 import re
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 仓库根目录，用于导入 common
+from common.accounts import has_source, iter_accounts, parse_shard
+from common.report import Renderer, Result
+from common.resilience import CircuitBreaker, CircuitOpenError, Retry, TransientError, host_of, raise_for_transient
+from common.runstate import RunState
+from common.shards import result_file, write_result
+from common.metrics import Metrics
+from common import trace
 
 # -----------------------------------------------------------------------
-BASE_URL = "https://client.webhostmost.com"
+BASE_URL = os.getenv("WHM_BASE_URL", "https://client.webhostmost.com").rstrip("/")  # 可指向本地回放服务，见 common/replay.py
 LOGIN_URL = f"{BASE_URL}/login"
 REDIRECT_URL = f"{BASE_URL}/clientarea.php"
 EMAIL_FIELD = "username"
 PASSWORD_FIELD = "password"
 TG_BOT_TOKEN = os.getenv("TG_BOT_TOKEN")
 TG_CHAT_ID = os.getenv("TG_CHAT_ID")
+WHM_WORKERS = int(os.getenv("WHM_WORKERS", "8"))  # 并发登录的账号数
+WHM_MIN_DAYS = int(os.getenv("WHM_MIN_DAYS", "35"))  # 上次登录后估算的剩余天数仍大于该值时跳过本次登录，0 表示不跳过
+RUN_STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run_state.json")
 # -----------------------------------------------------------------------
 
 
-def parse_users(users_secret):
-    """解析 GitHub Secret 格式：邮箱:密码\\n邮箱2:密码2"""
-    users = []
-    if not users_secret:
-        print("❌ 未找到 WHM_ACCOUNT 环境变量中的用户数据。")
-        return users
+class PooledAdapter(HTTPAdapter):
+    """所有账号共用的连接池，连接保持 keep-alive 并共用同一个 TLS 上下文"""
+
+    def __init__(self, pool_size):
+        self.ssl_context = ssl.create_default_context()
+        super().__init__(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["ssl_context"] = self.ssl_context
+        return super().init_poolmanager(*args, **kwargs)
 
-    for line in users_secret.strip().split('\n'):
-        parts = line.strip().split(':', 1)
-        if len(parts) == 2:
-            email, password = parts[0].strip(), parts[1].strip()
-            users.append({'email': email, 'password': password})
-        else:
-            print(f"⚠️ 跳过格式错误的行: {line}")
-    return users
 
+SHARED_ADAPTER = PooledAdapter(max(WHM_WORKERS, 1))
+WHM_HOST = host_of(BASE_URL)
+BREAKER = CircuitBreaker()  # 所有线程共用：站点连续出错后剩余账号直接跳过
+RETRY = Retry(BREAKER)
+
+
+def new_session():
+    """每个账号独立的 Cookie，底层连接来自共享连接池"""
+    session = requests.Session()
+    session.mount("https://", SHARED_ADAPTER)
+    session.mount("http://", SHARED_ADAPTER)
+    return session
+
+
+def parse_users(shard=None):
+    """读取 WHM_ACCOUNT（或 WHM_ACCOUNT_FILE / WHM_ACCOUNT_VAULT），格式：邮箱:密码\n邮箱2:密码2"""
+    return list(iter_accounts("WHM_ACCOUNT", shard=shard, on_invalid=lambda msg: print(f"⚠️ 跳过格式错误的行: {msg}")))
+
+@trace.traced("whm.csrf")
 def get_csrf_token(session):
-    """从登录页提取 CSRF Token"""
-    try:
-        r = session.get(LOGIN_URL, timeout=15)
-        r.raise_for_status()
-        match = re.search(r'name="token"\s+value="([^"]+)"', r.text)
-        if match:
-            token = match.group(1)
-            print(f"🔑 获取到 CSRF Token: {token[:8]}...")
-            return token
-        else:
-            print("⚠️ 未找到 CSRF Token，可能页面结构已变。")
-            return None
-    except requests.RequestException as e:
-        print(f"❌ 获取登录页时出错: {e}")
+    """从登录页提取 CSRF Token；网络错误与 5xx 向上抛出，由重试层处理"""
+    r = session.get(LOGIN_URL, timeout=15)
+    raise_for_transient(r.status_code, r.headers.get("Retry-After"))
+    r.raise_for_status()
+    match = re.search(r'name="token"\s+value="([^"]+)"', r.text)
+    if match:
+        token = match.group(1)
+        print(f"🔑 获取到 CSRF Token: {token[:8]}...")
+        return token
+    else:
+        print("⚠️ 未找到 CSRF Token，可能页面结构已变。")
         return None
 
 def extract_remaining_days():
@@ -59,11 +87,19 @@ def extract_remaining_days():
     remaining_days = remaining_timedelta.days
     return remaining_days
 
-def attempt_login(email, password):
-    """尝试登录并返回结果与剩余时间"""
-    session = requests.Session()
-    print(f"\n👤 尝试登录用户：{email}")
+def estimate_remaining_days(state, email):
+    """
+    根据上次成功登录时记录的剩余天数估算现在的剩余天数。
+    估算值仍大于 WHM_MIN_DAYS 时返回该值（可跳过本次登录），否则返回 None
+    """
+    entry = state.get(email) or {}
+    days = (entry.get("data") or {}).get("days")
+    if WHM_MIN_DAYS <= 0 or days is None or not state.fresh(email, (days - WHM_MIN_DAYS) * 86400):
+        return None
+    return int(days - state.age(email) // 86400)
 
+def submit_login(session, email, password):
+    """获取 Token 并提交登录表单。暂时性错误会整体重试，每次重试都重新获取 Token"""
     token = get_csrf_token(session)
     if not token:
         print("⚠️ 获取 CSRF Token 失败，跳过此账号。")
@@ -82,107 +118,161 @@ def attempt_login(email, password):
         "Origin": BASE_URL,
     }
 
-    try:
+    with trace.span("whm.login_post"):
         response = session.post(LOGIN_URL, data=payload, headers=headers, allow_redirects=True, timeout=15)
+    raise_for_transient(response.status_code, response.headers.get("Retry-After"))
 
-        if REDIRECT_URL in response.url or "clientarea.php" in response.text.lower():
-            print(f"✅ 成功登录用户 {email}，正在解析剩余时间...")
-            remaining_days = extract_remaining_days()
-            if remaining_days is not None:
-                print(f"📆 剩余时间: {remaining_days} 天")
-            else:
-                print("⚠️ 无法获取剩余时间。")
-            return {"email": email, "success": True, "days": remaining_days}
-
-        elif "incorrect" in response.text.lower():
-            print(f"❌ 登录失败：账号或密码错误。用户 {email}")
-            return {"email": email, "success": False, "reason": "账号或密码错误"}
-
-        elif "Invalid CSRF token" in response.text:
-            print(f"❌ 登录失败：Token 无效。用户 {email}")
-            return {"email": email, "success": False, "reason": "CSRF Token 无效"}
-
+    if REDIRECT_URL in response.url or "clientarea.php" in response.text.lower():
+        print(f"✅ 成功登录用户 {email}，正在解析剩余时间...")
+        remaining_days = extract_remaining_days()
+        if remaining_days is not None:
+            print(f"📆 剩余时间: {remaining_days} 天")
         else:
-            print(f"⚠️ 登录失败：未知原因。URL: {response.url}")
-            return {"email": email, "success": False, "reason": "未知错误"}
+            print("⚠️ 无法获取剩余时间。")
+        return {"email": email, "success": True, "days": remaining_days}
 
-    except requests.exceptions.RequestException as e:
-        print(f"❌ 登录用户 {email} 时发生错误: {e}")
-        return {"email": email, "success": False, "reason": str(e)}
+    elif "incorrect" in response.text.lower():
+        print(f"❌ 登录失败：账号或密码错误。用户 {email}")
+        return {"email": email, "success": False, "reason": "账号或密码错误"}
 
+    elif "Invalid CSRF token" in response.text:
+        print(f"❌ 登录失败：Token 无效。用户 {email}")
+        return {"email": email, "success": False, "reason": "CSRF Token 无效"}
 
-def send_tg_message(message):
-    """通过 Telegram 发送通知"""
-    if not TG_BOT_TOKEN or not TG_CHAT_ID:
-        print("⚠️ 未设置 TG_BOT_TOKEN 或 TG_CHAT_ID，跳过 Telegram 通知。")
-        return
+    else:
+        print(f"⚠️ 登录失败：未知原因。URL: {response.url}")
+        return {"email": email, "success": False, "reason": "未知错误"}
 
-    url = f"https://api.telegram.org/bot{TG_BOT_TOKEN}/sendMessage"
-    data = {
-        "chat_id": TG_CHAT_ID,
-        "text": message,
-        "parse_mode": "Markdown"
-    }
+@trace.traced("whm.attempt_login", account="email")
+def attempt_login(email, password):
+    """尝试登录并返回结果与剩余时间"""
+    session = new_session()
+    print(f"\n👤 尝试登录用户：{email}")
 
     try:
-        r = requests.post(url, data=data, timeout=10)
-        if r.status_code == 200:
-            print("📨 Telegram 通知已发送。")
-        else:
-            print(f"⚠️ Telegram 通知发送失败: {r.status_code} {r.text}")
-    except Exception as e:
-        print(f"⚠️ Telegram 通知错误: {e}")
-
+        return RETRY.call(WHM_HOST, submit_login, session, email, password)
+    except CircuitOpenError as e:
+        print(f"⛔ 跳过用户 {email}: {e}")
+        return {"email": email, "success": False, "reason": "服务不可用，已跳过"}
+    except (TransientError, requests.exceptions.RequestException) as e:
+        print(f"❌ 登录用户 {email} 时发生错误: {e}")
+        return {"email": email, "success": False, "reason": str(e)}
 
-def main():
-    user_credentials_secret = os.getenv('WHM_ACCOUNT')
 
-    if not user_credentials_secret:
-        print("错误：未设置 WHM_ACCOUNT 环境变量。请在 GitHub Secrets 中配置。")
-        sys.exit(1)
+def render_lines(r, results):
+    """逐个账号渲染登录详情，动态内容按 Markdown 转义"""
+    for res in results:
+        days = res.data.get("days")
+        if res.skipped:
+            yield r.fmt("⏭️ {} 近期已登录，估算剩余时间 {} 天，本次跳过", res.name, days)
+        elif res.ok:
+            days_text = f" 剩余时间 {days} 天" if days else " 剩余时间未知"
+            yield r.fmt("🟢 {} 登录成功，{}", res.name, days_text)
+        else:
+            yield r.fmt("🔴 {} 登录失败，原因：{}", res.name, res.detail or "未知错误")
 
-    users = parse_users(user_credentials_secret)
-    if not users:
-        print("未解析到任何用户。退出。")
-        sys.exit(1)
 
-    results = []
-    for user in users:
-        result = attempt_login(user['email'], user['password'])
-        results.append(result)
+def send_report(entries):
+    """
+    生成并发送报告，单任务运行与分片汇总共用（超长时按账号边界分成多条消息）。
+    返回是否至少有一个账号登录成功（没有账号时视为成功）
+    """
+    results = [e if isinstance(e, Result) else Result.from_dict(e) for e in entries]
 
     # 统计结果
     total = len(results)
-    success = sum(1 for r in results if r["success"])
-    failed = total - success
+    skipped = sum(1 for res in results if res.skipped)
+    success = sum(1 for res in results if res.ok) - skipped  # 跳过的账号本次未登录，不计入成功
+    failed = total - success - skipped
 
     # 生成报告
-    report_lines = [
+    head = "\n".join([
         "🌐 *webhostmost 登录报告*",
         "===================",
         f"👥 共处理账号: {total} 个",
         f"✅ 登录成功: {success} 个",
+        f"⏭️ 本次跳过: {skipped} 个",
         f"❌ 登录失败: {failed} 个",
         "===================",
         "📋 登录详情："
-    ]
+    ])
+
+    # 发送 Telegram 通知（后台发送，带重试）
+    r = Renderer("Markdown")
+    r.send(head, render_lines(r, results), echo=lambda chunk: print("\n" + chunk))
+    if TG_BOT_TOKEN and TG_CHAT_ID:
+        print("📨 Telegram 通知已加入发送队列。")
+    else:
+        print("⚠️ 未设置 TG_BOT_TOKEN 或 TG_CHAT_ID，跳过 Telegram 通知。")
+    return not results or any(res.ok for res in results)
 
-    for r in results:
-        if r["success"]:
-            days_text = f" 剩余时间 {r['days']} 天" if r.get("days") else " 剩余时间未知"
-            report_lines.append(f"🟢 {r['email']} 登录成功，{days_text}")
-        else:
-            report_lines.append(f"🔴 {r['email']} 登录失败，原因：{r.get('reason', '未知错误')}")
 
-    message = "\n".join(report_lines)
-    print("\n" + message)
+def run():
+    """登录所有账号并发送报告（分片运行时写结果文件），返回是否至少有一个账号成功；守护进程（common/daemon.py）直接调用"""
+    shard = parse_shard()
+    metrics = Metrics("webhostmost-checkin", shard)
+    users = parse_users(shard)
+    if shard:
+        print(f"🧩 分片 {shard[0]}/{shard[1]}: 本分片共 {len(users)} 个账号")
+    if not users and not shard:  # 分片后为空属于正常情况，仍需写出空的结果文件
+        print("未解析到任何用户。退出。")
+        return False
+
+    state = RunState(RUN_STATE_FILE)
+    skipped = {}
+    for u in users:
+        days = estimate_remaining_days(state, u.name)
+        if days is not None:
+            skipped[u.name] = days
+    if skipped:
+        print(f"⏭️ {len(skipped)} 个账号剩余时间仍大于 {WHM_MIN_DAYS} 天，本次跳过（RUN_FORCE=1 可强制登录）")
+
+    def timed_login(u):
+        start = time.perf_counter()
+        r = attempt_login(u.name, u.secret)
+        r["seconds"] = time.perf_counter() - start
+        return r
+
+    pending = [u for u in users if u.name not in skipped]
+    with ThreadPoolExecutor(max_workers=max(WHM_WORKERS, 1)) as pool:
+        done = dict(zip((u.name for u in pending), pool.map(timed_login, pending)))
+
+    if BREAKER.summary():
+        print(f"⛔ {BREAKER.summary()}")
+
+    results = []
+    for u in users:
+        if u.name in skipped:
+            results.append(Result(u.name, True, "跳过", data={"days": skipped[u.name]}))
+            metrics.account(u.name, True, skipped=True, days=skipped[u.name])
+            continue
+        r = done[u.name]
+        state.record(u.name, r["success"], r.get("reason", "登录成功"), {"days": r.get("days")})
+        results.append(Result(u.name, r["success"], "成功" if r["success"] else "失败",
+                              r.get("reason", ""), {"days": r.get("days")}))
+        metrics.account(u.name, r["success"], r["seconds"], detail=r.get("reason", ""), days=r.get("days"))
+    state.save()
+    metrics.write()
+
+    # 分片运行时只写结果文件，由汇总任务统一发送报告
+    path = result_file()
+    if path:
+        write_result(path, "webhostmost-checkin", shard, [res.to_dict() for res in results])
+        return True
+
+    ok = send_report(results)
+    if not ok:
+        print("❌ 所有账号登录失败。")
+    return ok
+
 
-    # 发送 Telegram 通知
-    send_tg_message(message)
+def main():
+    if not has_source("WHM_ACCOUNT"):
+        # 输出到 stderr 并以状态码 1 退出；分片运行时作为失败原因写入结果文件
+        sys.exit("错误：未设置 WHM_ACCOUNT 环境变量。请在 GitHub Secrets 中配置。")
 
     # 所有失败则报错退出
-    if success == 0:
-        print("❌ 所有账号登录失败，脚本退出。")
+    if not run():
         sys.exit(1)
 
 